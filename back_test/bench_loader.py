@@ -0,0 +1,59 @@
+import time
+
+import pandas as pd
+
+from src.acquisition import ensure_monthly_files
+from src.utils import CSV_ENGINE, load_ohlcv_files
+
+# K线CSV读取速度对比：原读取方式（默认 read_csv 解析全部12列、逐文件推断类型，再单独转换时间戳）
+# 与 read_ohlcv_csv / load_ohlcv_files（只读 OHLCV、指定数据类型、时间戳直接转为索引、多文件并行）。
+# 用法（在仓库根目录）: python back_test/bench_loader.py
+
+# 设置参数
+symbol = 'BTCUSDT'
+interval = '1m'
+DATA_DIR = 'back_test/data'
+selected_years = [2025]
+selected_months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+
+repeats = 3  # 每种方式重复次数，取最快一次
+
+
+def baseline_load(file_paths):
+    # 原方式：merge_csv_files_by_years_months 的读取 + load_and_process_data 的处理
+    frames = [pd.read_csv(path) for path in file_paths]
+    data = pd.concat(frames, ignore_index=True)
+    data['open_time'] = pd.to_datetime(data['open_time'], unit='ms')
+    data.set_index('open_time', inplace=True)
+    return data[['open', 'high', 'low', 'close', 'volume']].rename(
+        columns={'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}
+    )
+
+
+def best_time(func):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+ensure_monthly_files(symbol, interval, selected_years, selected_months, save_dir=DATA_DIR)
+file_paths = [f'{DATA_DIR}/{symbol}-{interval}/{symbol}-{interval}-{year}-{month:02d}.csv'
+              for year in selected_years for month in selected_months]
+
+baseline_seconds, baseline = best_time(lambda: baseline_load(file_paths))
+fast_seconds, fast = best_time(lambda: load_ohlcv_files(file_paths))
+fast32_seconds, fast32 = best_time(lambda: load_ohlcv_files(file_paths, float32=True))
+
+pd.testing.assert_frame_equal(baseline, fast)  # 结果必须与原方式完全一致
+
+print(f"{symbol} {interval} 共 {len(fast)} 根K线，{len(file_paths)} 个文件，解析引擎: {CSV_ENGINE}")
+for name, seconds, data in [
+    ('原读取方式', baseline_seconds, baseline),
+    ('快速读取 float64', fast_seconds, fast),
+    ('快速读取 float32', fast32_seconds, fast32),
+]:
+    memory = data.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"{name:<16} {seconds:7.3f} 秒  加速 {baseline_seconds / seconds:5.2f}x  内存 {memory:7.1f} MB")
@@ -0,0 +1,63 @@
+import os
+
+from src.acquisition import acquire_data
+from src.parallel_search import convergence_table, parallel_optimize
+
+# 参数搜索方法的收敛速度对比：相同的评估次数和进程数下，异步并行贝叶斯优化、随机搜索和网格搜索
+# 在各时间点找到的最佳值（交易数不少于 min_trades 时的胜率）。
+# 用法（在仓库根目录）: python back_test/bench_optimizers.py
+
+# 设置参数
+symbol = 'LINKUSDT'
+interval = '15m'
+DATA_DIR = 'back_test/data'
+RESULTS_DIR = 'back_test/results'
+selected_years = [2025]
+selected_months = [1, 2, 3, 4, 5, 6]
+
+backtest_params = {
+    'cash': 1_000_000_000_000,
+    'finalize_trades': True
+}
+
+strategy_params = {
+    'time_filter_hours': [[23, 1], [8, 10], [3, 4]]
+}
+
+search_space = {
+    'ema_period': range(2, 50),
+    'atr_period': range(2, 25),
+    'multiplier': range(1, 10),
+    'sl_multiplier': [2, 3],
+}
+
+min_trades = 30  # 交易数太少的组合胜率不可信，目标值记为 0
+max_tries = 300  # 每种方法的评估次数
+workers = None  # 进程数，None 则为 CPU 核数
+random_state = 42
+methods = ['bayes', 'random', 'grid']
+
+
+def win_rate_with_min_trades(stats):
+    if stats['# Trades'] < min_trades or stats['Win Rate [%]'] != stats['Win Rate [%]']:
+        return 0
+    return stats['Win Rate [%]']
+
+
+if __name__ == '__main__':
+    data = acquire_data(symbol=symbol, interval=interval, selected_years=selected_years, selected_months=selected_months, save_dir=DATA_DIR)
+
+    histories = {}
+    for method in methods:
+        _, _, histories[method] = parallel_optimize(
+            data, search_space, backtest_params, strategy_params,
+            maximize=win_rate_with_min_trades, method=method, max_tries=max_tries, workers=workers, random_state=random_state,
+        )
+
+    table = convergence_table(histories)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    table_filename = f'{RESULTS_DIR}/optimizer_convergence_{symbol}_{interval}.csv'
+    table.to_csv(table_filename)
+    print(f"{symbol} {interval}，每种方法 {max_tries} 次评估，各时间点（秒）的最佳胜率和已评估数量:")
+    print(table)
+    print(f"结果已保存到: {table_filename}")
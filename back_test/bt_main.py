@@ -1,22 +1,40 @@
 import numpy as np
 
-from src.acquisition import acquire_data
+from src.acquisition import acquire_data, ensure_monthly_files
+from src.costs import apply_costs, build_cost_model
 from src.strategy import ema_atr_atrFilter  # 导入回测函数
+from src.intrabar import IntrabarExitResolver
+from src.streaming import run_streaming_backtest
+from src.montecarlo import calculate_monte_carlo
+from src.results_db import ResultsDB
 from src.processing import process_batch_backtest, process_single_backtest  # 添加导入
 from src.utils import send_email_notification, custom_maximize  # 添加导入，用于发送邮件和自定义最大化函数
 
 # 设置参数
 symbol = 'LINKUSDT'
-interval = '15m'
+interval = '15m'  # 也可以是 build_bars.py 生成的自定义K线类型，如 'vol20000'、'dollar300000'、'30s'
 
 # --- 新增：统一路径管理 ---
 DATA_DIR = 'back_test/data'
 RESULTS_DIR = 'back_test/results'
+RESULTS_DB = f'{RESULTS_DIR}/results.db'  # 结果数据库，查询见 query_results.py
 # --- 结束新增 ---
 
 # 设置开关
 is_batch_test = False  # 是否进行批量回测
 
+# 新增：同一根K线内止损和止盈都被触及时，用该周期的K线判断先后（只检查这些K线，需额外获取该周期数据）；None 则按 backtesting 默认止损优先。
+# 默认关闭；需要时改为更细的周期（如 '1m'，会额外下载并合并所选月份的 1m 数据，结果与止损优先时不同）
+intrabar_interval = None
+
+# 新增：流式回测，按月份文件分块读取K线（每块的K线数量），内存占用与数据年限无关，结果与普通单次回测相同；
+# None 则合并后整体载入。仅用于单次回测，不生成图表，不支持 intrabar_interval
+streaming_chunksize = None
+
+# 新增：单次回测后对交易做蒙特卡洛稳健性分析（重抽样/打乱顺序），每种方法的模拟次数；0 则不做（默认关闭，需要时设为如 10_000）
+monte_carlo_simulations = 0
+monte_carlo_seed = 42  # 随机种子，None 则每次不同
+
 # 新增：选择具体年份和月份进行合并回测（空列表则使用默认单个文件）
 selected_years = [2025]  # 示例：选择2025年；可修改为所需年份列表，如 [2024, 2025]
 selected_months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]  # 示例：选择1月、2月、3月；可修改为所需月份列表，如 [1] 或 [1, 4, 7]
@@ -28,6 +46,15 @@ backtest_params = {
     # 'commission': 0.0005
 }
 
+# 新增：交易成本模型（src/costs.py），撮合后按每笔交易扣除，单次回测和批量回测（每个参数组合）都适用；None 则不计成本（默认）。
+# 手续费在这里设置时不要再设置上面的 commission，以免重复扣除。启用示例:
+# cost_params = {
+#     'fee_rate': 0.0005,  # 单边手续费率（按成交额，OKX 永续 taker 0.05%）
+#     'slippage': 0.0002,  # 单边滑点（成交价的比例）
+#     'funding': True,  # 按 Binance 资金费率历史扣除持仓期间的资金费（归档下载到 DATA_DIR/{symbol}-fundingRate）
+# }
+cost_params = None
+
 # 单次回测参数（可在 main 中调节）
 strategy_params = {
     'ema_period': 25,
@@ -58,27 +85,53 @@ optimize_params = {
     # 'rr_range': [2],  # 已是列表，无步长
     
     'max_tries': 10000,
-    'method': 'sambo',
+    'method': 'sambo',  # 也可以是 'grid'，或异步并行搜索 'parallel_bayes' / 'parallel_random' / 'parallel_grid'（见 src/parallel_search.py），或 'batched' 用批量内核评估完整网格（见 src/batch_kernel.py，需 intrabar_interval = None）
+    'workers': None,  # 新增：并行搜索的进程数，None 则为 CPU 核数
+    'time_budget': None,  # 新增：并行搜索的最长时间（秒），None 则只受 max_tries 限制
     'return_optimization': True,  # 新增：控制是否返回优化结果，默认 True
 
     'return_heatmap': True,
     'maximize': custom_maximize,
 }
 
+# 新增：批量回测的 Pareto 前沿（见 src/objectives.py），各目标之间的取舍保存在 pareto_front.csv 和结果数据库中
+pareto_objectives = {'Win Rate [%]': 'max', 'Net R': 'max', '# Trades': 'max'}  # {指标: 'max'/'min'}，可选指标见 objectives.METRICS
+pareto_min_trades = 30  # 交易数少于该值的组合不参与 Pareto 前沿
+
+is_record_results = False  # 新增：把本次回测的参数和结果写入结果数据库（默认关闭）
+
 is_send_batch_email = False  # 批量回测邮件开关
 is_send_single_email = False  # 单次回测邮件开关
 
 # 获取数据
-data = acquire_data(symbol=symbol, interval=interval, selected_years=selected_years, selected_months=selected_months, save_dir=DATA_DIR)
+exit_resolver = None
+cost_model = build_cost_model(symbol, selected_years, selected_months, cost_params, save_dir=DATA_DIR)
+if streaming_chunksize and not is_batch_test:
+    # 流式回测逐月分块读取，只需确保月度文件存在，不合并
+    ensure_monthly_files(symbol, interval, selected_years, selected_months, save_dir=DATA_DIR)
+else:
+    data = acquire_data(symbol=symbol, interval=interval, selected_years=selected_years, selected_months=selected_months, save_dir=DATA_DIR)
+
+    if intrabar_interval and intrabar_interval != interval:
+        intrabar_data = acquire_data(symbol=symbol, interval=intrabar_interval, selected_years=selected_years, selected_months=selected_months, save_dir=DATA_DIR)
+        exit_resolver = IntrabarExitResolver(data, intrabar_data, interval)
 
 # 调用回测函数
 if is_batch_test:
     stats, heatmap, bt = ema_atr_atrFilter(  # 接收 bt 仍然是好的，以备后用
         is_batch_test, data, symbol, interval,
-        backtest_params, strategy_params, optimize_params
+        backtest_params, strategy_params, optimize_params, exit_resolver=exit_resolver, cost_model=cost_model
     )
     # 在调用 process_batch_backtest 时传入 RESULTS_DIR
-    process_batch_backtest(stats, heatmap, symbol, interval, bt, results_dir=RESULTS_DIR)  # 传递 bt (即使新逻辑可能不用)
+    batch_folder, trials = process_batch_backtest(
+        stats, heatmap, symbol, interval, bt, results_dir=RESULTS_DIR,
+        pareto_objectives=pareto_objectives, pareto_min_trades=pareto_min_trades, cost_model=cost_model
+    )  # 传递 bt (即使新逻辑可能不用)
+    if is_record_results:
+        with ResultsDB(RESULTS_DB) as db:
+            db.record_batch(stats, trials, list(heatmap.index.names), symbol, interval, optimize_params,
+                            {**backtest_params, 'cost_params': cost_params}, batch_folder,
+                            objective=optimize_params.get('maximize') or 'SQN')  # 未指定时 backtesting 默认按 SQN 优化
     
     if is_send_batch_email:
         # 发送批量回测邮件提醒
@@ -87,12 +140,31 @@ if is_batch_test:
         subject = "批量回测完成提醒"
         body = f"批量回测已完成。最佳胜率: {win_rate}%，交易数量: {num_trades}。"
         send_email_notification(subject, body)
+elif streaming_chunksize:
+    stats = run_streaming_backtest(
+        symbol, interval, selected_years, selected_months, strategy_params, backtest_params,
+        data_dir=DATA_DIR, chunksize=streaming_chunksize
+    )
+    stats = apply_costs(stats, cost_model)
+    single_folder = process_single_backtest(stats, symbol, interval, None, results_dir=RESULTS_DIR, strategy_params=strategy_params)
+    if is_record_results:
+        with ResultsDB(RESULTS_DB) as db:
+            db.record_single(stats, symbol, interval, strategy_params, {**backtest_params, 'cost_params': cost_params}, single_folder)
+    if monte_carlo_simulations:
+        calculate_monte_carlo(stats, single_folder, n_simulations=monte_carlo_simulations, seed=monte_carlo_seed)
 else:
     stats, bt = ema_atr_atrFilter(
         is_batch_test, data, symbol, interval,
-        backtest_params, strategy_params
+        backtest_params, strategy_params, exit_resolver=exit_resolver, cost_model=cost_model
     )
-    process_single_backtest(stats, symbol, interval, bt, results_dir=RESULTS_DIR, strategy_params=strategy_params)  # 修复：传递 results_dir
+    if exit_resolver is not None:
+        print(f"盘中止盈止损判定（{intrabar_interval}）：{exit_resolver.stats}")
+    single_folder = process_single_backtest(stats, symbol, interval, bt, results_dir=RESULTS_DIR, strategy_params=strategy_params)  # 修复：传递 results_dir
+    if is_record_results:
+        with ResultsDB(RESULTS_DB) as db:
+            db.record_single(stats, symbol, interval, strategy_params, {**backtest_params, 'cost_params': cost_params}, single_folder)
+    if monte_carlo_simulations:
+        calculate_monte_carlo(stats, single_folder, n_simulations=monte_carlo_simulations, seed=monte_carlo_seed)
     
     if is_send_single_email:
         # 发送单次回测邮件提醒
@@ -0,0 +1,23 @@
+from src.aggtrades import build_bars_from_agg_trades
+
+# 从 Binance 逐笔成交（aggTrades）生成自定义K线：成交量K线、成交额K线、秒级时间K线。
+# 每个月的压缩包不解压、分块流式读取，内存占用与文件大小无关；结果按月保存为与K线文件相同的格式，
+# 回测时把 bt_main.py 的 interval 设为对应的K线类型（如 'dollar50000000'）即可直接使用。
+# 用法（在仓库根目录）: python back_test/build_bars.py
+
+# 设置参数
+symbol = 'LINKUSDT'
+DATA_DIR = 'back_test/data'
+selected_years = [2025]
+selected_months = [1, 2, 3]
+
+# K线类型：'vol{数量}' 成交量K线，'dollar{金额}' 成交额K线（USDT），'10s' 等时间K线
+bar_types = ['vol20000', 'dollar300000', '30s']
+
+chunksize = 2_000_000  # 每块读取的成交笔数
+delete_archives = False  # 处理完成后是否删除逐笔成交压缩包
+
+build_bars_from_agg_trades(
+    symbol, bar_types, selected_years, selected_months,
+    save_dir=DATA_DIR, chunksize=chunksize, delete_archives=delete_archives
+)
@@ -0,0 +1,196 @@
+import os
+import secrets
+import argparse
+import multiprocessing
+
+from datetime import datetime
+
+import pandas as pd
+
+from dotenv import load_dotenv
+
+from src.acquisition import acquire_data
+from src.costs import build_cost_model
+from src.distributed import DEFAULT_PORT, JobBroker, expand_grid, run_worker
+from src.stability import analyze_parameter_stability
+from src.objectives import save_pareto_front
+from src.results_db import ResultsDB
+
+# 分布式批量回测：协调端把参数网格切块发布到内置的任务代理，任意机器上的工作端领取、回测（数据缓存在工作端本机）并交回结果。
+# 用法（在仓库根目录，各机器的 .env 中设置相同的 DISTRIBUTED_AUTHKEY，如 python -c "import secrets; print(secrets.token_hex(32))" 生成）:
+#   python back_test/distributed_main.py coordinator --bind 0.0.0.0         # 在协调机上发布任务并等待结果（默认只监听本机）
+#   python back_test/distributed_main.py prepare                            # 在每台工作机上先准备数据（同一台机器开多个工作进程时避免同时下载、合并）
+#   python back_test/distributed_main.py worker --host 192.168.1.10         # 在每台工作机上运行，可以开多个进程
+#   python back_test/distributed_main.py coordinator --local-workers 4      # 单机测试：先准备数据，再同时启动 4 个本机工作进程
+# 工作端崩溃或断网时，它持有的任务在断开连接或租约超时后重新排队，由其他工作端接手。
+# 代理收到的消息会被反序列化，能连上端口并通过认证即可在协调端执行代码：密钥不要外泄，--bind 0.0.0.0 只在可信网络中使用。
+# 不支持 intrabar_interval（盘中止盈止损判定），结果与 bt_main.py 中未设置 intrabar_interval 的网格批量回测一致。
+
+# 设置参数
+symbols = ['LINKUSDT']  # 可同时优化多个品种，每个品种的全部参数组合作为一组任务
+interval = '15m'
+selected_years = [2025]
+selected_months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+
+DATA_DIR = 'back_test/data'
+RESULTS_DIR = 'back_test/results'
+RESULTS_DB = f'{RESULTS_DIR}/results.db'
+
+backtest_params = {
+    'cash': 1_000_000_000_000,
+    'finalize_trades': True
+}
+
+# 固定的策略参数（不参与优化）
+strategy_params = {
+    'time_filter_hours': [[23, 1], [8, 10], [3, 4]]
+}
+
+# 交易成本（见 src/costs.py）：单边手续费率、单边滑点、是否按 Binance 资金费率历史扣除资金费（工作端在本机下载并缓存）；None 则不计。
+# 默认不计，需要时改为如 {'fee_rate': 0.0005, 'slippage': 0.0002, 'funding': True}
+cost_params = None
+
+# 优化参数（网格全部组合）
+optimize_params = {
+    'ema_period_range': range(2, 50),
+    'atr_period_range': range(2, 25),
+    'multiplier_range': range(1, 10),
+    'sl_multiplier_range': [2, 3],
+    'atr_threshold_pct_range': [0],
+    'rr_range': [2],
+    'volume_multiplier_range': [1.0],
+}
+
+chunk_size = 50  # 每个任务包含的参数组合数量
+lease_timeout = 600  # 租约时长（秒），应大于工作端回测 chunk_size / 3 个组合的时间
+min_trades = 30  # 参数稳定性分析和 Pareto 前沿中交易数少于该值的组合视为未评估
+
+# Pareto 前沿的目标（见 src/objectives.py）：{指标: 'max' / 'min'}
+pareto_objectives = {'Win Rate [%]': 'max', 'Net R': 'max', '# Trades': 'max'}
+
+is_record_results = True  # 把结果写入结果数据库
+
+
+def authkey(generate=False):
+    # 读取 .env 中的 DISTRIBUTED_AUTHKEY；未设置时协调端生成随机密钥并打印（其他机器的工作端需设置为该值），工作端拒绝启动
+    load_dotenv()
+    key = os.getenv('DISTRIBUTED_AUTHKEY')
+    if not key:
+        if not generate:
+            raise SystemExit("未设置 DISTRIBUTED_AUTHKEY，请在 .env 中设置与协调端相同的密钥")
+        key = secrets.token_hex(32)
+        print(f"未设置 DISTRIBUTED_AUTHKEY，本次使用随机密钥（其他机器的工作端需在 .env 中设置）: {key}")
+    return key.encode()
+
+
+def prepare_data(data_dir=DATA_DIR):
+    # 为每个品种下载、合并K线并准备资金费率（工作端直接读取缓存）；本机多个工作进程启动前先运行一次，避免同时下载和合并同一份文件
+    for symbol in symbols:
+        acquire_data(symbol=symbol, interval=interval, selected_years=selected_years, selected_months=selected_months, save_dir=data_dir)
+        build_cost_model(symbol, selected_years, selected_months, cost_params, save_dir=data_dir)
+
+
+def save_results(symbol, trials, param_names):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    batch_folder = f"{RESULTS_DIR}/distributed_{symbol}_{interval}_{timestamp}"
+    os.makedirs(batch_folder, exist_ok=True)
+
+    trials = trials.sort_values(param_names, ignore_index=True)
+    trials.to_csv(f'{batch_folder}/trials.csv', index=False)
+    best = trials.loc[trials['win_rate'].idxmax()]
+    print(f"{symbol} 共 {len(trials)} 个参数组合，最佳胜率 {best['win_rate']:.2f}%（{int(best['# Trades'])} 笔交易）: "
+          f"{', '.join(f'{name}={best[name]}' for name in param_names)}")
+
+    try:
+        trials, _ = save_pareto_front(trials, batch_folder, param_names, pareto_objectives, min_trades)
+    except Exception as e:
+        print(f"Pareto 前沿计算失败: {e}")
+
+    cells = None
+    try:
+        _, cells = analyze_parameter_stability(trials, batch_folder, param_names, min_trades=min_trades)
+        if cells is not None:
+            cells = cells.merge(trials.drop(columns=['win_rate', '# Trades']).drop_duplicates(param_names), on=param_names, how='left')
+    except Exception as e:
+        print(f"参数稳定性分析失败: {e}")
+
+    if is_record_results:
+        stats = pd.Series({
+            'Start': best['data_start'], 'End': best['data_end'],
+            'Win Rate [%]': best['Win Rate [%]'], '# Trades': best['# Trades'],
+            'Return [%]': best['Return [%]'], 'Max. Drawdown [%]': best['Max. Drawdown [%]'],
+        })
+        with ResultsDB(RESULTS_DB) as db:
+            db.record_batch(stats, cells if cells is not None else trials, param_names, symbol, interval,
+                            optimize_params, {**backtest_params, **strategy_params, 'cost_params': cost_params}, batch_folder,
+                            objective='custom_maximize')  # 工作端的 win_rate 列即 utils.custom_maximize 的取值
+    return batch_folder
+
+
+def coordinator(args):
+    param_names, combos = expand_grid(optimize_params)
+    broker = JobBroker((args.bind, args.port), authkey(generate=True), lease_timeout)
+    spec_ids = {}
+    for symbol in symbols:
+        spec = {
+            'symbol': symbol, 'interval': interval, 'years': selected_years, 'months': selected_months,
+            'backtest_params': backtest_params, 'strategy_params': strategy_params, 'cost_params': cost_params,
+        }
+        spec_ids[symbol] = broker.submit(spec, combos, chunk_size)
+    print(f"{len(symbols)} 个品种 x {len(combos)} 个参数组合，每个任务 {chunk_size} 个组合")
+    if args.local_workers:
+        prepare_data()
+    broker.start()
+
+    workers = []
+    for i in range(args.local_workers):
+        process = multiprocessing.Process(
+            target=run_worker, args=(('127.0.0.1', broker.address[1]), broker.authkey, DATA_DIR, f'local-{i}'), daemon=True)
+        process.start()
+        workers.append(process)
+
+    try:
+        broker.wait()
+    finally:
+        broker.close()
+    for process in workers:
+        process.join(timeout=30)
+
+    for symbol, spec_id in spec_ids.items():
+        save_results(symbol, broker.collect(spec_id), param_names)
+
+
+def worker(args):
+    run_worker((args.host, args.port), authkey(), args.data_dir, args.name, connect_timeout=args.connect_timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分布式批量回测')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinator_parser = commands.add_parser('coordinator', help='发布参数网格并收集结果')
+    coordinator_parser.add_argument('--bind', default='127.0.0.1', help='监听地址，默认只接受本机连接；0.0.0.0 允许其他机器连接（仅限可信网络）')
+    coordinator_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    coordinator_parser.add_argument('--local-workers', type=int, default=0, help='同时在本机启动的工作进程数')
+
+    prepare_parser = commands.add_parser('prepare', help='在本机准备回测数据')
+    prepare_parser.add_argument('--data-dir', default=DATA_DIR, help='本机数据目录')
+
+    worker_parser = commands.add_parser('worker', help='领取任务并回测')
+    worker_parser.add_argument('--host', default='127.0.0.1', help='协调端地址')
+    worker_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    worker_parser.add_argument('--data-dir', default=DATA_DIR, help='本机数据目录')
+    worker_parser.add_argument('--name', help='工作端名称（默认 主机名-进程号）')
+    worker_parser.add_argument('--connect-timeout', type=float, default=300.0, help='连不上协调端时的最长重试时间（秒）')
+
+    args = parser.parse_args()
+    if args.command == 'coordinator':
+        coordinator(args)
+    elif args.command == 'prepare':
+        prepare_data(args.data_dir)
+    else:
+        worker(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+
+import pandas as pd
+
+from src.results_db import DEFAULT_DB_PATH, RANK_COLUMNS, ResultsDB
+
+# 查询回测结果数据库（bt_main.py 在 is_record_results = True 时写入）。
+# 用法（在仓库根目录）:
+#   python back_test/query_results.py runs --symbol LINKUSDT
+#   python back_test/query_results.py best --months 6 --min-trades 50          # 近6个月数据上各品种最稳健的参数
+#   python back_test/query_results.py best --by win_rate --top 3 --interval 15m
+#   python back_test/query_results.py trials 12 --limit 10
+#   python back_test/query_results.py pareto 12                              # 某次批量回测的 Pareto 前沿（胜率/净R/交易数的取舍）
+#   python back_test/query_results.py sql "SELECT symbol, COUNT(*) FROM runs GROUP BY symbol"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查询回测结果数据库')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help=f'数据库路径（默认 {DEFAULT_DB_PATH}）')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_filters(command):
+        command.add_argument('--symbol')
+        command.add_argument('--interval')
+        command.add_argument('--kind', choices=['single', 'batch'])
+        command.add_argument('--since', help='回测数据起始时间不早于该日期，如 2025-04-01')
+        command.add_argument('--months', type=int, help='回测数据起始时间在最近 N 个月内（与 --since 二选一）')
+
+    runs = commands.add_parser('runs', help='列出运行记录')
+    add_filters(runs)
+    runs.add_argument('--limit', type=int, default=50)
+
+    best = commands.add_parser('best', help='各品种排名靠前的参数组合')
+    add_filters(best)
+    best.add_argument('--by', choices=RANK_COLUMNS, default='score', help='排名指标（默认参数稳定性得分）')
+    best.add_argument('--min-trades', type=int, default=0)
+    best.add_argument('--top', type=int, default=1)
+
+    trials = commands.add_parser('trials', help='某次运行中排名靠前的参数组合')
+    trials.add_argument('run_id', type=int)
+    trials.add_argument('--by', choices=RANK_COLUMNS, default='score')
+    trials.add_argument('--min-trades', type=int, default=0)
+    trials.add_argument('--limit', type=int, default=20)
+
+    pareto = commands.add_parser('pareto', help='某次批量回测的 Pareto 前沿')
+    pareto.add_argument('run_id', type=int)
+    pareto.add_argument('--min-trades', type=int, default=0)
+
+    sql = commands.add_parser('sql', help='执行任意 SQL 查询')
+    sql.add_argument('statement')
+
+    args = parser.parse_args()
+    data_since = getattr(args, 'since', None)
+    if getattr(args, 'months', None):
+        data_since = pd.Timestamp.now().normalize() - pd.DateOffset(months=args.months)
+
+    with ResultsDB(args.db) as db:
+        if args.command == 'runs':
+            result = db.runs(args.symbol, args.interval, args.kind, data_since, args.limit)
+        elif args.command == 'best':
+            result = db.best_params(args.symbol, args.interval, args.kind, data_since, args.by, args.min_trades, args.top)
+        elif args.command == 'trials':
+            result = db.trials(args.run_id, args.by, args.min_trades, args.limit)
+        elif args.command == 'pareto':
+            result = db.pareto(args.run_id, args.min_trades)
+        else:
+            result = db.query(args.statement)
+
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200, 'display.max_colwidth', 120):
+        print(result if not result.empty else '没有符合条件的记录。')
+
+
+if __name__ == '__main__':
+    main()
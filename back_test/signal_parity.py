@@ -0,0 +1,99 @@
+import time
+import filecmp
+
+import numpy as np
+
+from src.acquisition import acquire_data
+from src.signal_core import compute_indicators, entry_signals, IncrementalSignal
+from src.batch_kernel import signal_matrix
+
+# 信号一致性检查：同一份K线分别用回测的向量化计算（entry_signals）和实盘的逐根计算（IncrementalSignal）
+# 生成信号，两者必须逐根完全一致；同时校验三份 signal_core.py 副本内容相同，以及批量回测内核的多参数信号矩阵（batch_kernel.signal_matrix）与 entry_signals 一致。
+# 用法（在仓库根目录）: python back_test/signal_parity.py
+# 合成数据上的同类检查和实盘/回测逐笔交易一致性测试见 back_test/tests/test_signal_parity.py（python -m pytest），本脚本用于真实行情数据
+
+# 设置参数
+symbol = 'LINKUSDT'
+interval = '15m'
+DATA_DIR = 'back_test/data'
+selected_years = [2025]
+selected_months = [1, 2, 3]
+
+# 待检查的参数组合（与 bt_main.strategy_params 同名）
+param_sets = [
+    {'ema_period': 25, 'atr_period': 24, 'multiplier': 3, 'atr_threshold_pct': 0, 'volume_multiplier': 1.3,
+     'time_filter_hours': [[23, 1], [8, 10], [3, 4]]},
+    {'ema_period': 12, 'atr_period': 9, 'multiplier': 1, 'atr_threshold_pct': 0.001, 'volume_multiplier': 1.0,
+     'time_filter_hours': []},
+]
+
+SIGNAL_CORE_COPIES = ['back_test/src/signal_core.py', 'live/src/signal_core.py', 'live_vps/src/signal_core.py']
+
+# 校验三份副本
+for path in SIGNAL_CORE_COPIES[1:]:
+    if not filecmp.cmp(SIGNAL_CORE_COPIES[0], path, shallow=False):
+        raise SystemExit(f"signal_core.py 副本不一致: {SIGNAL_CORE_COPIES[0]} 与 {path}")
+print("三份 signal_core.py 副本一致。")
+
+# 获取数据
+data = acquire_data(symbol=symbol, interval=interval, selected_years=selected_years, selected_months=selected_months, save_dir=DATA_DIR)
+arrays = {col: data[col].to_numpy(dtype=float) for col in ['Open', 'High', 'Low', 'Close', 'Volume']}
+hours = data.index.hour.to_numpy()
+timestamps = data.index.values.astype('datetime64[s]').astype(np.int64)
+print(f"K线数量: {len(data)}")
+
+failed = False
+for params in param_sets:
+    start = time.perf_counter()
+    ema, atr = compute_indicators(arrays['High'], arrays['Low'], arrays['Close'], params['ema_period'], params['atr_period'])
+    vectorized = entry_signals(
+        arrays['Open'], arrays['High'], arrays['Low'], arrays['Close'], arrays['Volume'], hours,
+        params['ema_period'], params['atr_period'], params['multiplier'], params['atr_threshold_pct'],
+        params['volume_multiplier'], params['time_filter_hours'], ema, atr
+    )
+    vectorized_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    state = IncrementalSignal(params['ema_period'], params['atr_period'], params['multiplier'],
+                              params['atr_threshold_pct'], params['volume_multiplier'], params['time_filter_hours'])
+    incremental = np.zeros(len(data), dtype=np.int8)
+    incremental_ema = np.empty(len(data))
+    incremental_atr = np.empty(len(data))
+    for i in range(len(data)):
+        incremental[i] = state.update(arrays['Open'][i], arrays['High'][i], arrays['Low'][i], arrays['Close'][i],
+                                      arrays['Volume'][i], hours[i], ts=int(timestamps[i]))
+        incremental_ema[i] = state.ema
+        incremental_atr[i] = state.atr
+    incremental_seconds = time.perf_counter() - start
+
+    batched = signal_matrix(
+        arrays['Open'], arrays['Close'], arrays['Volume'], hours, ema, atr,
+        [params['multiplier']], [params['atr_threshold_pct']], [params['volume_multiplier']], params['time_filter_hours']
+    )[:, 0]
+
+    mismatches = np.flatnonzero(vectorized != incremental)
+    ema_diff = np.nanmax(np.abs(ema - incremental_ema))
+    atr_diff = np.nanmax(np.abs(atr - incremental_atr))
+    print(f"\n参数: {params}")
+    print(f"向量化耗时 {vectorized_seconds:.3f} 秒，逐根耗时 {incremental_seconds:.3f} 秒")
+    print(f"信号数量: 上突破 {int((vectorized == 1).sum())}，下突破 {int((vectorized == -1).sum())}")
+    print(f"EMA 最大偏差 {ema_diff:.3e}，ATR 最大偏差 {atr_diff:.3e}")
+    if len(mismatches):
+        failed = True
+        print(f"信号不一致: {len(mismatches)} 根K线")
+        upper = ema + atr * params['multiplier']
+        lower = ema - atr * params['multiplier']
+        for i in mismatches[:20]:
+            print(f"  {data.index[i]}: 向量化 {vectorized[i]}，逐根 {incremental[i]}，"
+                  f"收盘价距上轨 {arrays['Close'][i] - upper[i]:.6g}，距下轨 {arrays['Close'][i] - lower[i]:.6g}")
+    else:
+        print("信号完全一致。")
+    batched_mismatches = np.flatnonzero(vectorized != batched)
+    if len(batched_mismatches):
+        failed = True
+        print(f"批量内核信号不一致: {len(batched_mismatches)} 根K线，如 {list(data.index[batched_mismatches[:5]])}")
+    else:
+        print("批量内核信号一致。")
+
+if failed:
+    raise SystemExit("信号一致性检查未通过。")
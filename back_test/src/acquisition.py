@@ -2,6 +2,18 @@ import os  # 导入 os 库，用于文件和路径操作
 
 from .utils import load_and_process_data, download_binance_data, unzip_binance_data, merge_csv_files_by_years_months, delete_zip_folder  # 修改为相对导入
 
+def ensure_monthly_files(symbol, interval, years, months, save_dir='back_test/data'):
+    # 检查所需的月度文件是否存在，缺少时下载并解压（不合并，流式回测直接逐月读取）
+    for year in years:
+        for month in months:
+            file_path = f'{save_dir}/{symbol}-{interval}/{symbol}-{interval}-{year}-{month:02d}.csv'
+            if not os.path.exists(file_path):
+                # 下载并解压数据
+                download_binance_data(symbol=symbol, interval=interval, years=years, months=months, save_dir=save_dir)
+                unzip_binance_data(symbol=symbol, interval=interval, save_dir=save_dir)
+                delete_zip_folder(symbol, interval, save_dir)
+                return
+
 def acquire_data(symbol, interval, selected_years=None, selected_months=None, save_dir='back_test/data'):
 
     if selected_years and selected_months:
@@ -11,22 +23,7 @@ def acquire_data(symbol, interval, selected_years=None, selected_months=None, sa
         output_file = f'{save_dir}/merged_{symbol}-{interval}_{years_str}_{months_str}.csv'
         
         if not os.path.exists(output_file):
-            # 检查所需子文件是否存在
-            files_exist = True
-            for year in selected_years:
-                for month in selected_months:
-                    file_path = f'{save_dir}/{symbol}-{interval}/{symbol}-{interval}-{year}-{month:02d}.csv'
-                    if not os.path.exists(file_path):
-                        files_exist = False
-                        break
-                if not files_exist:
-                    break
-            
-            if not files_exist:
-                # 下载并解压数据
-                download_binance_data(symbol=symbol, interval=interval, years=selected_years, months=selected_months, save_dir=save_dir)
-                unzip_binance_data(symbol=symbol, interval=interval, save_dir=save_dir)
-                delete_zip_folder(symbol, interval, save_dir)
+            ensure_monthly_files(symbol, interval, selected_years, selected_months, save_dir)
             
             # 合并数据
             input_dir = f'{save_dir}/{symbol}-{interval}'
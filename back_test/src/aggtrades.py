@@ -0,0 +1,288 @@
+import os
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+import requests
+
+from tqdm import tqdm
+
+# Binance U本位合约逐笔成交（aggTrades）月度压缩包，列顺序固定（2022年以后的文件带表头，更早的没有）
+AGG_TRADES_URL = "https://data.binance.vision/data/futures/um/monthly/aggTrades/{symbol}/"
+AGG_TRADE_COLUMNS = ['agg_trade_id', 'price', 'quantity', 'first_trade_id', 'last_trade_id', 'transact_time', 'is_buyer_maker']
+
+# 输出列与 Binance K线CSV一致（open_time/close_time 为毫秒），可直接被 acquire_data / load_and_process_data 读取
+BAR_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'count']
+
+# 每次从压缩包读取的成交笔数，内存占用只与它有关，与文件大小无关
+DEFAULT_CHUNKSIZE = 2_000_000
+
+
+def parse_bar_spec(bar):
+    """
+    解析自定义K线类型。
+
+    参数:
+    - bar: 'vol1000'（每累计 1000 个币的成交量一根）、'dollar5000000'（每累计 5e6 USDT 成交额一根）、
+      '10s' / '30s' / '1m' 等时间K线（支持秒级）
+
+    返回:
+    - (kind, size): kind 为 'volume' / 'dollar' / 'time'，size 为阈值（时间K线为毫秒数）
+    """
+    match = re.fullmatch(r'(vol|dollar)(\d+(?:\.\d+)?)', bar)
+    if match:
+        size = float(match.group(2))
+        if size <= 0:
+            raise ValueError(f"K线阈值必须为正数: {bar}")
+        return ('volume' if match.group(1) == 'vol' else 'dollar'), size
+    try:
+        ms = int(pd.Timedelta(bar) / pd.Timedelta(milliseconds=1))
+    except ValueError:
+        raise ValueError(f"无法识别的K线类型: {bar}（示例: 'vol1000'、'dollar5000000'、'10s'）") from None
+    if ms <= 0:
+        raise ValueError(f"时间K线周期必须为正: {bar}")
+    return 'time', ms
+
+
+class BarAggregator:
+    """
+    把逐笔成交流式聚合为一种K线，每次喂入一块成交，返回其中已完成的K线，最后一根未完成的K线留到下一块继续累计。
+
+    成交量/成交额K线按累计量的固定网格切分：累计量（喂入前）每跨过一个阈值的整数倍开始一根新K线，
+    长期平均每根K线的量等于阈值，整个计算可向量化，单笔大额成交不拆分。
+
+    参数:
+    - bar: K线类型，见 parse_bar_spec
+    """
+
+    def __init__(self, bar):
+        self.bar = bar
+        self.kind, self.size = parse_bar_spec(bar)
+        self.total = 0.0  # 已喂入的累计成交量/成交额
+        self.carry = None  # 未完成的K线：(id, 各列的值)
+
+    def _bar_ids(self, time_ms, quantity, quote):
+        if self.kind == 'time':
+            return time_ms // self.size
+        amount = quantity if self.kind == 'volume' else quote
+        cumulative = np.cumsum(amount)
+        before = self.total + cumulative - amount
+        self.total += cumulative[-1]
+        # 累计量恰好落在阈值整数倍上时，分块不同会带来 1e-12 量级的舍入差异，加一个远小于一根K线的容差使结果与分块无关
+        return np.floor(before / self.size + 1e-9).astype(np.int64)
+
+    def update(self, time_ms, price, quantity):
+        """
+        喂入一块按时间排序的成交。
+
+        返回:
+        - DataFrame: 本块中已完成的K线（列为 BAR_COLUMNS），可能为空
+        """
+        if not len(time_ms):
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        time_ms = np.asarray(time_ms, dtype=np.int64)
+        price = np.asarray(price, dtype=float)
+        quantity = np.asarray(quantity, dtype=float)
+        quote = price * quantity
+        ids = self._bar_ids(time_ms, quantity, quote)
+
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)] - 1
+        open_time = ids[starts] * self.size if self.kind == 'time' else time_ms[starts]
+        bars = np.column_stack([
+            open_time,
+            price[starts],
+            np.maximum.reduceat(price, starts),
+            np.minimum.reduceat(price, starts),
+            price[ends],
+            np.add.reduceat(quantity, starts),
+            time_ms[ends],
+            np.add.reduceat(quote, starts),
+            np.diff(np.r_[starts, len(ids)]),
+        ])
+        bar_ids = ids[starts]
+
+        completed = []
+        if self.carry is not None:
+            carry_id, carry_bar = self.carry
+            if bar_ids[0] == carry_id:
+                bars[0] = self._merge(carry_bar, bars[0])
+            else:
+                completed.append(carry_bar)
+        self.carry = (bar_ids[-1], bars[-1])
+        completed.extend(bars[:-1])
+        return self._frame(completed)
+
+    def flush(self):
+        """
+        返回最后一根未完成的K线并清空状态（数据中断或全部处理完时调用）。
+        """
+        carry, self.carry = self.carry, None
+        return self._frame([] if carry is None else [carry[1]])
+
+    @staticmethod
+    def _merge(first, second):
+        merged = first.copy()
+        merged[2] = max(first[2], second[2])
+        merged[3] = min(first[3], second[3])
+        merged[4] = second[4]
+        merged[5] = first[5] + second[5]
+        merged[6] = second[6]
+        merged[7] = first[7] + second[7]
+        merged[8] = first[8] + second[8]
+        return merged
+
+    @staticmethod
+    def _frame(rows):
+        frame = pd.DataFrame(np.array(rows).reshape(-1, len(BAR_COLUMNS)), columns=BAR_COLUMNS)
+        for col in ('open_time', 'close_time', 'count'):
+            frame[col] = frame[col].astype(np.int64)
+        return frame
+
+
+def download_agg_trades(symbol, years, months, save_dir='back_test/data'):
+    """
+    下载逐笔成交月度压缩包（流式写盘，已存在的跳过）。
+
+    参数:
+    - symbol: 交易对符号，如 'BTCUSDT'
+    - years: 年份列表
+    - months: 月份列表
+    - save_dir: 数据目录，压缩包保存在 {save_dir}/{symbol}_aggTrades
+
+    返回:
+    - list: 按时间顺序的 (year, month, 压缩包路径)，下载失败的月份不在其中
+    """
+    zip_dir = f"{save_dir}/{symbol}_aggTrades"
+    os.makedirs(zip_dir, exist_ok=True)
+    base_url = AGG_TRADES_URL.format(symbol=symbol)
+
+    archives = []
+    for year in years:
+        for month in months:
+            file_name = f"{symbol}-aggTrades-{year}-{month:02d}.zip"
+            save_path = os.path.join(zip_dir, file_name)
+            if os.path.exists(save_path):
+                print(f"已存在：{file_name}")
+                archives.append((year, month, save_path))
+                continue
+            try:
+                print(f"开始下载 {file_name} ...")
+                response = requests.get(base_url + file_name, stream=True)
+                if response.status_code != 200:
+                    print(f"❌ 无法访问 {file_name} (状态码: {response.status_code})")
+                    continue
+                total = int(response.headers.get('content-length', 0))
+                tmp_path = save_path + '.part'
+                with open(tmp_path, 'wb') as file, tqdm(
+                    desc=file_name, total=total, unit='B', unit_scale=True, ncols=100
+                ) as bar:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        file.write(chunk)
+                        bar.update(len(chunk))
+                os.replace(tmp_path, save_path)  # 下载中断时不会留下不完整的压缩包
+                print(f"✅ 下载完成: {file_name}")
+                archives.append((year, month, save_path))
+            except Exception as e:
+                print(f"下载失败 {file_name}: {e}")
+    return archives
+
+
+def iter_agg_trades(zip_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    不解压到磁盘，直接从压缩包中分块读取逐笔成交。
+
+    返回:
+    - 生成器，每块为 (transact_time 毫秒, price, quantity) 三个 numpy 数组
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        name = archive.namelist()[0]
+        with archive.open(name) as f:
+            has_header = not f.readline()[:1].isdigit()
+        with archive.open(name) as f:
+            reader = pd.read_csv(
+                f, header=0 if has_header else None, names=AGG_TRADE_COLUMNS,
+                usecols=['price', 'quantity', 'transact_time'],
+                dtype={'price': np.float64, 'quantity': np.float64, 'transact_time': np.int64},
+                chunksize=chunksize,
+            )
+            for chunk in reader:
+                yield chunk['transact_time'].to_numpy(), chunk['price'].to_numpy(), chunk['quantity'].to_numpy()
+
+
+class _MonthlyBarWriter:
+    """
+    按K线开盘时间所在月份追加写入 {save_dir}/{symbol}-{bar}/{symbol}-{bar}-{year}-{month}.csv，
+    本次运行中第一次写某个文件时覆盖旧文件。
+    """
+
+    def __init__(self, symbol, bar, save_dir):
+        self.symbol = symbol
+        self.bar = bar
+        self.directory = f"{save_dir}/{symbol}-{bar}"
+        os.makedirs(self.directory, exist_ok=True)
+        self.written = set()
+        self.rows = 0
+
+    def write(self, bars):
+        if bars.empty:
+            return
+        months = pd.to_datetime(bars['open_time'], unit='ms').dt.strftime('%Y-%m')
+        for month, group in bars.groupby(months, sort=True):
+            path = f"{self.directory}/{self.symbol}-{self.bar}-{month}.csv"
+            first = path not in self.written
+            group.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+            self.written.add(path)
+            self.rows += len(group)
+
+
+def build_bars_from_agg_trades(symbol, bars, years, months, save_dir='back_test/data', chunksize=DEFAULT_CHUNKSIZE, delete_archives=False):
+    """
+    下载逐笔成交并一次遍历聚合出多种自定义K线，保存到回测数据目录。
+
+    保存格式与 Binance K线文件相同，回测时把 interval 设为K线类型即可，如
+    acquire_data(symbol, 'dollar5000000', selected_years, selected_months)。
+    相邻月份之间连续累计（跨月的K线归入开盘所在月份），缺少某个月的数据时在断点处丢弃未完成的K线。
+
+    参数:
+    - symbol: 交易对符号，如 'BTCUSDT'
+    - bars: K线类型列表，如 ['vol1000', 'dollar5000000', '10s']
+    - years: 年份列表
+    - months: 月份列表
+    - save_dir: 数据目录
+    - chunksize: 每块读取的成交笔数
+    - delete_archives: 处理完成后是否删除逐笔成交压缩包
+
+    返回:
+    - dict: {K线类型: 写入的K线数量}
+    """
+    aggregators = [BarAggregator(bar) for bar in bars]
+    writers = [_MonthlyBarWriter(symbol, bar, save_dir) for bar in bars]
+    archives = download_agg_trades(symbol, years, months, save_dir)
+
+    previous = None
+    for year, month, zip_path in archives:
+        if previous is not None and (year * 12 + month) - (previous[0] * 12 + previous[1]) != 1:
+            print(f"{previous[0]}-{previous[1]:02d} 与 {year}-{month:02d} 之间缺少数据，丢弃未完成的K线")
+            for aggregator in aggregators:
+                aggregator.flush()
+        previous = (year, month)
+
+        trades = 0
+        for time_ms, price, quantity in tqdm(iter_agg_trades(zip_path, chunksize), desc=f"{symbol} {year}-{month:02d}", unit='块', ncols=100):
+            trades += len(time_ms)
+            for aggregator, writer in zip(aggregators, writers):
+                writer.write(aggregator.update(time_ms, price, quantity))
+        print(f"{year}-{month:02d} 处理完成，共 {trades} 笔成交")
+
+    # 最后一根未完成的K线不写入
+    for aggregator in aggregators:
+        aggregator.flush()
+    if delete_archives:
+        for _, _, zip_path in archives:
+            os.remove(zip_path)
+
+    counts = {writer.bar: writer.rows for writer in writers}
+    print(f"自定义K线生成完成: {counts}")
+    return counts
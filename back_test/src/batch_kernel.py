@@ -0,0 +1,379 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from .signal_core import allowed_hours_mask, compute_indicators
+from .strategy import build_backtest
+from .streaming import FULL_EQUITY, SUPPORTED_BACKTEST_PARAMS
+from .objectives import r_multiples
+from .costs import apply_costs
+
+# 参数批量回测内核：(ema_period, atr_period) 相同的参数组合共用 EMA/ATR，
+# 其余参数（multiplier、atr_threshold_pct、volume_multiplier、sl_multiplier、rr）作为列一次性展开，
+# 信号为 (K线数, 组合数) 的矩阵，撮合按"轮"推进：每轮所有列各自找下一个信号、开仓、向后查找止损/止盈，
+# 都是跨列的数组运算，组合数增加时耗时增长很慢，不再是每个组合一次完整回测。
+# 撮合规则与 streaming.py 相同（即 backtesting 对本策略的处理），交易数和胜率与 bt.run 完全一致，
+# 收益、回撤、SQN 等只有浮点舍入级别（相对误差 1e-11 以内）的差异。不支持 intrabar 判定；
+# commission 以外的手续费、滑点和资金费用 costs.CostModel 在撮合后按交易数组扣除，与对 bt.run 结果调用 costs.apply_costs 相同。
+
+TRAILING_PARAMS = ('multiplier', 'atr_threshold_pct', 'volume_multiplier', 'sl_multiplier', 'rr')
+STATS_COLUMNS = ['Exposure Time [%]', 'Equity Final [$]', 'Equity Peak [$]', 'Return [%]', 'Max. Drawdown [%]', '# Trades',
+                 'Win Rate [%]', 'Best Trade [%]', 'Worst Trade [%]', 'Avg. Trade [%]', 'Profit Factor', 'Expectancy [%]', 'SQN',
+                 'Net R', 'Avg. R']
+
+MAX_CELLS = 8_000_000  # 每块 K线数 x 组合数 的上限，控制信号矩阵和权益矩阵的内存
+
+
+def signal_matrix(open_, close, volume, hours, ema, atr, multipliers, atr_threshold_pcts, volume_multipliers, forbidden_hours=None):
+    """
+    signal_core.entry_signals 的多参数版本：每列一组 (multiplier, atr_threshold_pct, volume_multiplier)，
+    逐列结果与 entry_signals 完全相同（signal_parity.py 会校验）。
+
+    返回:
+    - np.ndarray: (K线数, 组合数) 的 int8 矩阵
+    """
+    multipliers = np.asarray(multipliers, dtype=float)[None, :]
+    thresholds = np.asarray(atr_threshold_pcts, dtype=float)[None, :]
+    volume_multipliers = np.asarray(volume_multipliers, dtype=float)[None, :]
+    signals = np.zeros((len(close), multipliers.shape[1]), dtype=np.int8)
+    if len(close) < 2:
+        return signals
+
+    upper = ema[:, None] + atr[:, None] * multipliers
+    lower = ema[:, None] - atr[:, None] * multipliers
+    color = close > open_
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        low_volatility = (atr / close)[1:, None] < thresholds
+        common = (color[1:] == color[:-1]) & allowed_hours_mask(hours, forbidden_hours)[1:]
+        valid = ~low_volatility & common[:, None] & (volume[1:, None] > volume[:-1, None] * volume_multipliers)
+        upper_breakout = (close[:-1, None] < upper[:-1]) & (close[1:, None] > upper[1:])
+        lower_breakout = (lower[:-1] < close[:-1, None]) & (lower[1:] > close[1:, None])
+
+    signals[1:] = np.where(valid & upper_breakout, 1, np.where(valid & lower_breakout, -1, 0))
+    return signals
+
+
+def _first_exit(open_, high, low, entry, is_long, sl, tp, width=16, max_width=4096):
+    # 从开仓K线起向后查找第一次触及止损或止盈的K线，窗口逐步加倍；返回 (K线下标或 -1, 成交价)
+    n = len(open_)
+    exit_bar = np.full(len(entry), -1)
+    exit_price = np.full(len(entry), np.nan)
+    position = entry.copy()
+    remaining = np.arange(len(entry))
+    while remaining.size:
+        bars = position[remaining, None] + np.arange(width)
+        inside = bars < n
+        bars = np.minimum(bars, n - 1)
+        long = is_long[remaining, None]
+        stop, target = sl[remaining, None], tp[remaining, None]
+        sl_hit = np.where(long, low[bars] <= stop, high[bars] >= stop) & inside
+        tp_hit = np.where(long, high[bars] >= target, low[bars] <= target) & inside
+        hit = sl_hit | tp_hit
+        found = hit.any(axis=1)
+
+        rows = remaining[found]
+        first = hit[found].argmax(axis=1)
+        bar = bars[found, first]
+        # 止损先于止盈；跳空时按开盘价成交
+        stop_first = sl_hit[found, first]
+        bar_open = open_[bar]
+        long = is_long[rows]
+        exit_bar[rows] = bar
+        exit_price[rows] = np.where(
+            stop_first,
+            np.where(long, np.minimum(bar_open, sl[rows]), np.maximum(bar_open, sl[rows])),
+            np.where(long, np.maximum(bar_open, tp[rows]), np.minimum(bar_open, tp[rows])),
+        )
+
+        remaining = remaining[~found]
+        position[remaining] += width
+        remaining = remaining[position[remaining] < n]
+        width = min(width * 2, max_width)
+    return exit_bar, exit_price
+
+
+def _simulate(open_, high, low, close, atr, signals, sl_multipliers, rrs, start, cash, commission, spread, finalize_trades,
+              cost_model=None, bar_funding=None):
+    # 按轮撮合全部列，返回每列的统计（列与 signals 的列对应）
+    n, m = signals.shape
+    signals = signals.copy()
+    signals[:start] = 0  # 预热期（backtesting 不调用 next）的信号无效
+    signal_positions = np.flatnonzero(signals.T)  # 列优先: 列 * n + K线下标
+
+    search_from = np.full(m, start)
+    balance = np.full(m, float(cash))
+    trades = []  # 每轮一组数组
+    open_trades = []  # 结束时仍持有的仓位
+    columns = np.arange(m)
+    if start >= n:
+        columns = columns[:0]
+
+    while columns.size:
+        # 1. 每列下一个信号
+        keys = columns * n + search_from[columns]
+        k = np.searchsorted(signal_positions, keys)
+        has = k < len(signal_positions)
+        position = signal_positions[np.minimum(k, len(signal_positions) - 1)] if len(signal_positions) else keys
+        has &= position // n == columns
+        columns, signal_bar = columns[has], position[has] % n
+        if not columns.size:
+            break
+        entry = signal_bar + 1
+        final = entry >= n  # 最后一根K线的信号：finalize_trades 时 backtesting 会用最后一根K线再撮合一次
+        if not finalize_trades:
+            columns, signal_bar, entry, final = columns[~final], signal_bar[~final], entry[~final], final[~final]
+        entry = np.minimum(entry, n - 1)
+
+        # 2. 下一根K线开盘市价开仓（全部权益，整数数量）
+        direction = signals[signal_bar, columns].astype(float)
+        entry_open = open_[entry]
+        adjusted_price = entry_open * (1 + spread * direction)
+        price_plus_commission = adjusted_price + FULL_EQUITY * entry_open * commission / FULL_EQUITY  # 运算顺序与 backtesting 相同
+        margin_available = np.maximum(balance[columns], 0.0)
+        size = np.floor_divide(margin_available * FULL_EQUITY, price_plus_commission) * direction
+        filled = (size != 0) & (np.abs(size) * price_plus_commission <= margin_available)
+
+        # 资金不足的订单取消，开仓K线收盘后可以再次产生信号
+        retry = columns[~filled & ~final]
+        search_from[retry] = entry[~filled & ~final]
+        columns, signal_bar, entry, final, direction = columns[filled], signal_bar[filled], entry[filled], final[filled], direction[filled]
+        size, adjusted_price = size[filled], adjusted_price[filled]
+        if not columns.size:
+            columns = retry
+            continue
+        balance_entry = balance[columns] - np.abs(size) * adjusted_price * commission
+
+        sl_distance = atr[signal_bar] * sl_multipliers[columns]
+        tp_distance = sl_distance * rrs[columns]
+        is_long = direction > 0
+        signal_close = close[signal_bar]
+        sl = np.where(is_long, signal_close - sl_distance, signal_close + sl_distance)
+        tp = np.where(is_long, signal_close + tp_distance, signal_close - tp_distance)
+
+        # 3. 止损/止盈
+        exit_bar, exit_price = _first_exit(open_, high, low, entry, is_long, sl, tp)
+        unclosed = exit_bar < 0
+        if finalize_trades:
+            # 结束时仍持仓：按最后一根K线开盘价平仓（最后一根K线上的信号开出的仓位除外，与 backtesting 一致）
+            close_at_end = unclosed & ~final
+            exit_bar[close_at_end] = n - 1
+            exit_price[close_at_end] = open_[n - 1]
+            unclosed &= final
+        if unclosed.any():
+            open_trades.append((columns[unclosed], entry[unclosed], size[unclosed], adjusted_price[unclosed], balance_entry[unclosed]))
+
+        closed = ~unclosed
+        col, size_c, entry_price, exit_p = columns[closed], size[closed], adjusted_price[closed], exit_price[closed]
+        exit_commission = np.abs(size_c) * exit_p * commission
+        gross = size_c * (exit_p - entry_price)
+        balance[col] = balance_entry[closed] + gross - exit_commission
+        total_commission = exit_commission + np.abs(size_c) * entry_price * commission
+        trades.append({
+            'column': col, 'entry': entry[closed], 'exit': exit_bar[closed], 'size': size_c, 'entry_price': entry_price,
+            'balance_entry': balance_entry[closed], 'balance_after': balance[col], 'pnl': gross - total_commission, 'sl': sl[closed],
+            'exit_price': exit_p,
+            'return': np.sign(size_c) * (exit_p / entry_price - 1) - total_commission / (np.abs(size_c) * entry_price),
+        })
+
+        # 平仓K线收盘后可以再次产生信号；最后一根K线的信号撮合后结束
+        search_from[col] = exit_bar[closed]
+        columns = np.sort(np.concatenate([retry, col[~final[closed]]]))
+
+    trades = {key: np.concatenate([t[key] for t in trades]) for key in trades[0]} if trades else None
+    if trades is not None and cost_model is not None:
+        # 手续费、滑点和资金费（bar_funding 为各K线开盘时的累计资金费率）
+        cost = sum(cost_model.trade_costs(trades['size'], trades['entry_price'], trades['exit_price'],
+                                          bar_funding[trades['entry']], bar_funding[trades['exit']]))
+        trades['cost'] = cost
+        trades['pnl'] = trades['pnl'] - cost
+        trades['return'] = trades['return'] - cost / (np.abs(trades['size']) * trades['entry_price'])
+    return _column_stats(m, n, start, cash, close, trades, open_trades)
+
+
+def _column_stats(m, n, start, cash, close, trades, open_trades):
+    # 权益：空仓时为账户余额（在平仓K线更新），持仓期间为 开仓后余额 + 数量 * (收盘价 - 开仓价)，与逐根撮合的数值完全相同
+    balance = np.full((m, n), np.nan)
+    balance[:, 0] = cash
+    segments = []
+    if trades is not None:
+        balance[trades['column'], trades['exit']] = trades['balance_after']
+        segments.append((trades['column'], trades['entry'], trades['exit'], trades['size'], trades['entry_price'], trades['balance_entry']))
+    for column, entry, size, entry_price, balance_entry in open_trades:
+        segments.append((column, entry, np.full(len(column), n), size, entry_price, balance_entry))
+    filled = np.where(np.isnan(balance), 0, np.arange(n))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    equity = np.take_along_axis(balance, filled, axis=1)
+
+    for column, entry, end, size, entry_price, balance_entry in segments:
+        lengths = end - entry
+        total = int(lengths.sum())
+        if not total:
+            continue
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        bars = np.repeat(entry, lengths) + offsets
+        rows = np.repeat(column, lengths)
+        equity[rows, bars] = np.repeat(balance_entry, lengths) + np.repeat(size, lengths) * (close[bars] - np.repeat(entry_price, lengths))
+
+    if trades is not None and 'cost' in trades:
+        # 交易成本在平仓K线从权益中扣除（见 costs.apply_costs）
+        charged = np.zeros((m, n))
+        np.add.at(charged, (trades['column'], trades['exit']), trades['cost'])
+        equity -= np.cumsum(charged, axis=1)
+
+    equity = equity[:, start:] if start < n else np.full((m, 1), float(cash))
+    initial = equity[:, 0]
+    final = equity[:, -1]
+    peak = np.maximum.accumulate(equity, axis=1)
+    max_drawdown = (1 - equity / peak).max(axis=1)
+
+    # 持仓时间占比：与 backtesting 相同，按已平仓交易覆盖的K线数（含开仓和平仓K线）除以全部K线数
+    covered = np.zeros((m, n + 1))
+    if trades is not None:
+        np.add.at(covered, (trades['column'], trades['entry']), 1)
+        np.add.at(covered, (trades['column'], trades['exit'] + 1), -1)
+    exposure = (np.cumsum(covered[:, :n], axis=1) > 0).mean(axis=1) * 100
+
+    stats = pd.DataFrame({
+        'Exposure Time [%]': exposure,
+        'Equity Final [$]': final,
+        'Equity Peak [$]': np.maximum(peak[:, -1], initial),
+        'Return [%]': (final - initial) / initial * 100,
+        'Max. Drawdown [%]': -max_drawdown * 100,
+    })
+    if trades is None:
+        stats['# Trades'] = 0
+        for column in STATS_COLUMNS[6:]:
+            stats[column] = np.nan
+        stats['Net R'] = 0.0
+        return stats[STATS_COLUMNS]
+
+    column, pnl, returns = trades['column'], trades['pnl'], trades['return']
+    count = np.bincount(column, minlength=m)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        best = np.full(m, -np.inf)
+        worst = np.full(m, np.inf)
+        np.maximum.at(best, column, returns)
+        np.minimum.at(worst, column, returns)
+        growth = 1 + returns
+        bad_growth = np.bincount(column, growth <= 0, minlength=m) > 0
+        log_growth = np.bincount(column, np.log(np.maximum(growth, 1e-300)), minlength=m)
+        gains = np.bincount(column, np.where(returns > 0, returns, 0), minlength=m)
+        losses = np.abs(np.bincount(column, np.where(returns < 0, returns, 0), minlength=m))
+        pnl_mean = np.bincount(column, pnl, minlength=m) / count
+        pnl_var = np.bincount(column, (pnl - pnl_mean[column]) ** 2, minlength=m) / (count - 1)
+        pnl_std = np.sqrt(pnl_var)
+
+        stats['# Trades'] = count
+        stats['Win Rate [%]'] = np.bincount(column, pnl > 0, minlength=m) / count * 100
+        stats['Best Trade [%]'] = np.where(count > 0, best, np.nan) * 100
+        stats['Worst Trade [%]'] = np.where(count > 0, worst, np.nan) * 100
+        stats['Avg. Trade [%]'] = np.where(bad_growth, 0, np.exp(log_growth / count) - 1) * 100
+        stats['Profit Factor'] = gains / np.where(losses > 0, losses, np.nan)
+        stats['Expectancy [%]'] = np.bincount(column, returns, minlength=m) / count * 100
+        stats['SQN'] = np.sqrt(count) * pnl_mean / np.where(pnl_std > 0, pnl_std, np.nan)
+
+        r = r_multiples(pnl, trades['size'], trades['entry_price'], trades['sl'])
+        valid_r = np.isfinite(r)
+        stats['Net R'] = np.bincount(column, np.where(valid_r, r, 0), minlength=m)
+        stats['Avg. R'] = stats['Net R'] / np.bincount(column, valid_r, minlength=m)
+    return stats
+
+
+def evaluate_trailing_params(data, ema_period, atr_period, trailing, backtest_params=None, time_filter_hours=None, max_cells=MAX_CELLS,
+                             cost_model=None):
+    """
+    一次评估同一 (ema_period, atr_period) 下的多组其余参数。
+
+    参数:
+    - data: K线数据（Open/High/Low/Close/Volume，DatetimeIndex）
+    - ema_period, atr_period: 通道参数
+    - trailing: DataFrame，每行一组参数，列为 TRAILING_PARAMS（缺少的列按 build_backtest 的默认值）
+    - backtest_params: 回测参数，支持 cash、commission（按成交额比例）、spread、finalize_trades
+    - time_filter_hours: 禁止交易时段
+    - max_cells: 每块 K线数 x 组合数 的上限
+    - cost_model: 交易成本模型（见 costs.py），None 则不扣除
+
+    返回:
+    - DataFrame: 每行一组参数的统计（列见 STATS_COLUMNS），行顺序与 trailing 相同
+    """
+    backtest_params = dict(backtest_params or {})
+    unsupported = set(backtest_params) - set(SUPPORTED_BACKTEST_PARAMS)
+    if unsupported:
+        raise ValueError(f"批量回测内核不支持参数: {sorted(unsupported)}")
+    commission = backtest_params.get('commission', 0.0)
+    if not isinstance(commission, (int, float)):
+        raise ValueError("批量回测内核的 commission 只支持按成交额比例的数值")
+
+    open_, high, low, close, volume = (data[col].to_numpy(dtype=float) for col in ('Open', 'High', 'Low', 'Close', 'Volume'))
+    hours = data.index.hour.to_numpy()
+    ema, atr = compute_indicators(high, low, close, ema_period, atr_period)
+    # backtesting 从所有指标都有效的下一根K线开始调用 next
+    start = 1 + max(int(np.isnan(ema).argmin()), int(np.isnan(atr).argmin()))
+    bar_funding = cost_model.cumulative_funding(data.index) if cost_model is not None else None
+
+    defaults = {'multiplier': 2, 'atr_threshold_pct': 0, 'volume_multiplier': 1.0, 'sl_multiplier': 3, 'rr': 2}
+    columns = {name: (trailing[name] if name in trailing else pd.Series(default, index=trailing.index)).to_numpy(dtype=float)
+               for name, default in defaults.items()}
+
+    block = max(1, max_cells // max(len(close), 1))
+    results = []
+    for first in range(0, len(trailing), block):
+        part = {name: values[first:first + block] for name, values in columns.items()}
+        signals = signal_matrix(open_, close, volume, hours, ema, atr, part['multiplier'], part['atr_threshold_pct'],
+                                part['volume_multiplier'], time_filter_hours)
+        results.append(_simulate(
+            open_, high, low, close, atr, signals, part['sl_multiplier'], part['rr'], start,
+            float(backtest_params.get('cash', 10_000)), float(commission), float(backtest_params.get('spread', 0.0)),
+            bool(backtest_params.get('finalize_trades', False)), cost_model, bar_funding,
+        ))
+    return pd.concat(results, ignore_index=True).set_axis(trailing.index)
+
+
+def batched_grid_search(data, search_space, backtest_params=None, strategy_params=None, maximize='SQN', cost_model=None):
+    """
+    用批量内核评估完整参数网格：按 (ema_period, atr_period) 分组，组内其余参数一次评估。
+
+    参数:
+    - data: K线数据
+    - search_space: {参数名: 取值列表}，参数名为 ema_period、atr_period 和 TRAILING_PARAMS
+    - backtest_params: 见 evaluate_trailing_params
+    - strategy_params: 固定的策略参数（time_filter_hours，以及 search_space 中没有的参数）
+    - maximize: 目标，STATS_COLUMNS 中的列名或接收 stats 返回数值的函数
+    - cost_model: 交易成本模型（见 costs.py），None 则不扣除
+
+    返回:
+    - stats: 最佳参数用 bt.run 得到的完整统计（扣除成本后）
+    - heatmap: 全部参数组合的目标值（与 bt.optimize 的 heatmap 格式相同，_full_stats 为各组合的统计）
+    """
+    strategy_params = strategy_params or {}
+    unknown = set(search_space) - {'ema_period', 'atr_period', *TRAILING_PARAMS}
+    if unknown:
+        raise ValueError(f"批量回测内核不支持优化参数: {sorted(unknown)}")
+    names = list(search_space)
+    space = {name: list(search_space.get(name, [strategy_params.get(name)]))
+             for name in ('ema_period', 'atr_period', *TRAILING_PARAMS) if name in search_space or name in strategy_params}
+    trailing_names = [name for name in TRAILING_PARAMS if name in space]
+    trailing = pd.DataFrame(list(itertools.product(*(space[name] for name in trailing_names))), columns=trailing_names)
+
+    objective = maximize if callable(maximize) else (lambda stats: stats[maximize])
+    frames = []
+    for ema_period in space.get('ema_period', [4]):
+        for atr_period in space.get('atr_period', [18]):
+            frame = evaluate_trailing_params(data, ema_period, atr_period, trailing, backtest_params, strategy_params.get('time_filter_hours'),
+                                             cost_model=cost_model)
+            frames.append(pd.concat([trailing.assign(ema_period=ema_period, atr_period=atr_period), frame], axis=1))
+    results = pd.concat(frames, ignore_index=True).sort_values(names, kind='stable', ignore_index=True)
+
+    full_stats = [row for _, row in results[STATS_COLUMNS].iterrows()]
+    values = [objective(stats) if stats['# Trades'] else np.nan for stats in full_stats]
+    heatmap = pd.Series(values, index=pd.MultiIndex.from_frame(results[names]), name=getattr(maximize, '__name__', str(maximize)))
+    heatmap._full_stats = full_stats  # process_batch_backtest 从中读取交易数量
+
+    best = heatmap.idxmax() if heatmap.notna().any() else heatmap.index[0]
+    bt = build_backtest(data, backtest_params, strategy_params)
+    stats = bt.run(**{name: value.item() if isinstance(value, np.generic) else value for name, value in zip(names, best)})
+    stats = apply_costs(stats, cost_model)
+    print(f"批量内核评估 {len(heatmap)} 个参数组合（{len(frames)} 组 ema_period/atr_period）")
+    return stats, heatmap
@@ -0,0 +1,253 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+import requests
+
+# 交易成本模型：手续费和滑点按每笔交易的开平仓成交额扣除，资金费按持仓期间经过的结算时点扣除。
+# 资金费率取 Binance U本位合约的月度归档（与K线放在同一数据目录），按结算时间累加后用有序的 as-of 连接（np.searchsorted）
+# 对齐到K线或交易时间：任意时刻之前的累计费率只需一次二分查找，每笔交易的资金费 = 数量 * 开仓价 * (平仓时累计费率 - 开仓时累计费率)。
+# 成本都是对交易明细数组的逐元素运算，单次回测和批量优化中每个参数组合的额外开销都可以忽略。
+# 成本在撮合之后扣除，不改变仓位大小：每笔交易的盈亏正负、胜率、R 倍数与逐笔扣费的撮合一致，
+# 收益和回撤不计成本对后续仓位（全部权益开仓）的复利影响。
+
+FUNDING_RATE_URL = "https://data.binance.vision/data/futures/um/monthly/fundingRate/{symbol}/"
+FUNDING_COLUMNS = ['calc_time', 'funding_interval_hours', 'last_funding_rate']
+
+
+def download_funding_rates(symbol, years, months, save_dir='back_test/data'):
+    """
+    下载资金费率月度归档并解压到 {save_dir}/{symbol}-fundingRate/（已存在的跳过）。
+
+    参数:
+    - symbol: 交易对符号，如 'BTCUSDT'
+    - years: 年份列表
+    - months: 月份列表
+    - save_dir: 数据目录
+
+    返回:
+    - list: 按时间顺序的CSV路径，下载失败的月份不在其中
+    """
+    csv_dir = f"{save_dir}/{symbol}-fundingRate"
+    os.makedirs(csv_dir, exist_ok=True)
+    base_url = FUNDING_RATE_URL.format(symbol=symbol)
+
+    paths = []
+    for year in years:
+        for month in months:
+            file_name = f"{symbol}-fundingRate-{year}-{month:02d}"
+            csv_path = f"{csv_dir}/{file_name}.csv"
+            if not os.path.exists(csv_path):
+                try:
+                    print(f"开始下载 {file_name}.zip ...")
+                    response = requests.get(f"{base_url}{file_name}.zip", timeout=60)
+                    if response.status_code != 200:
+                        print(f"❌ 无法访问 {file_name}.zip (状态码: {response.status_code})")
+                        continue
+                    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+                        member = next(name for name in archive.namelist() if name.endswith('.csv'))
+                        with open(csv_path + '.part', 'wb') as file:
+                            file.write(archive.read(member))
+                    os.replace(csv_path + '.part', csv_path)
+                    print(f"✅ 下载完成: {file_name}.csv")
+                except Exception as e:
+                    print(f"下载失败 {file_name}: {e}")
+                    continue
+            paths.append(csv_path)
+    return paths
+
+
+def read_funding_csv(file_path):
+    """
+    读取一个资金费率CSV（有无表头均可）。
+
+    返回:
+    - pd.Series: 结算时间（DatetimeIndex）-> 费率
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        has_header = not f.readline()[:1].isdigit()
+    frame = pd.read_csv(
+        file_path,
+        header=0 if has_header else None,
+        names=None if has_header else FUNDING_COLUMNS,
+        usecols=['calc_time', 'last_funding_rate'],
+        dtype={'calc_time': np.int64, 'last_funding_rate': np.float64},
+    )
+    index = pd.DatetimeIndex(pd.to_datetime(frame['calc_time'].to_numpy(), unit='ms'), name='calc_time')
+    return pd.Series(frame['last_funding_rate'].to_numpy(), index=index, name='funding_rate')
+
+
+def load_funding_rates(symbol, years, months, save_dir='back_test/data'):
+    """
+    读取资金费率（缺少的月份先下载），按结算时间升序、去重。
+
+    返回:
+    - pd.Series: 结算时间（DatetimeIndex）-> 费率，没有可用数据时为空
+    """
+    frames = [read_funding_csv(path) for path in download_funding_rates(symbol, years, months, save_dir)]
+    if not frames:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], name='calc_time'), name='funding_rate')
+    funding = pd.concat(frames).sort_index(kind='stable')
+    return funding[~funding.index.duplicated(keep='last')]
+
+
+def _as_ns(times):
+    # 时间统一为纳秒整数，便于 searchsorted（pandas 的时间精度可能是 s/ms/us/ns）
+    return pd.DatetimeIndex(times).as_unit('ns').asi8
+
+
+class CostModel:
+    """
+    手续费、滑点和资金费的成本模型。
+
+    参数:
+    - fee_rate: 单边手续费率（按成交额），如 OKX 永续 taker 0.0005
+    - slippage: 单边滑点（成交价的比例），开仓和平仓各按不利方向计
+    - funding: 资金费率（结算时间 -> 费率，见 load_funding_rates），None 则不计资金费
+    """
+
+    def __init__(self, fee_rate=0.0, slippage=0.0, funding=None):
+        self.fee_rate = float(fee_rate)
+        self.slippage = float(slippage)
+        if funding is None:
+            funding = pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+        funding = funding.sort_index(kind='stable')
+        self.funding_times = _as_ns(funding.index)
+        self.cum_funding = np.concatenate([[0.0], np.cumsum(funding.to_numpy(dtype=float))])
+
+    def __repr__(self):
+        return f"CostModel(fee_rate={self.fee_rate}, slippage={self.slippage}, funding_events={len(self.funding_times)})"
+
+    def cumulative_funding(self, times):
+        """
+        as-of 连接：各时刻（含）之前已结算的累计费率。
+
+        参数:
+        - times: 时间序列（交易的开平仓时间，或K线的开盘时间）
+
+        返回:
+        - np.ndarray: 与 times 等长的累计费率
+        """
+        return self.cum_funding[np.searchsorted(self.funding_times, _as_ns(times), side='right')]
+
+    def trade_costs(self, size, entry_price, exit_price, entry_funding, exit_funding):
+        """
+        每笔交易的成本（均为支出，资金费为负表示收取）。
+
+        参数:
+        - size: 带方向的数量（多为正、空为负）
+        - entry_price, exit_price: 开仓价、平仓价
+        - entry_funding, exit_funding: 开仓、平仓时刻的累计费率（cumulative_funding 的结果，或按K线下标取值）；
+          结算时点在 (开仓时刻, 平仓时刻] 内的资金费计入该交易
+
+        返回:
+        - (fees, slippage, funding): 三个与 size 等长的数组
+        """
+        size = np.asarray(size, dtype=float)
+        turnover = np.abs(size) * (np.asarray(entry_price, dtype=float) + np.asarray(exit_price, dtype=float))
+        # 费率为正时多头支付、空头收取；名义价值按开仓价计
+        funding = size * np.asarray(entry_price, dtype=float) * (np.asarray(exit_funding) - np.asarray(entry_funding))
+        return turnover * self.fee_rate, turnover * self.slippage, funding
+
+
+def build_cost_model(symbol, years, months, cost_params, save_dir='back_test/data'):
+    """
+    按配置创建成本模型。
+
+    参数:
+    - symbol, years, months: 回测的交易对和数据区间（用于获取资金费率）
+    - cost_params: {'fee_rate': 单边手续费率, 'slippage': 单边滑点, 'funding': 是否计资金费}，None 则不计成本
+    - save_dir: 数据目录
+
+    返回:
+    - CostModel 或 None
+    """
+    if not cost_params:
+        return None
+    funding = load_funding_rates(symbol, years, months, save_dir) if cost_params.get('funding') else None
+    if funding is not None:
+        print(f"资金费率 {symbol}: {len(funding)} 次结算")
+    return CostModel(cost_params.get('fee_rate', 0.0), cost_params.get('slippage', 0.0), funding)
+
+
+def apply_costs(stats, cost_model):
+    """
+    在回测统计结果上扣除交易成本（backtesting 和流式回测的 stats 均可）。
+
+    参数:
+    - stats: 回测统计结果，包含 _trades（有 _equity_curve 时同时更新权益曲线和回撤）
+    - cost_model: CostModel，None 则原样返回
+
+    返回:
+    - stats: 副本；_trades 增加 Fees、Slippage、Funding 列，PnL 和 ReturnPct 为扣除成本后的值，
+      胜率、盈亏比、收益、回撤等按扣除后的交易重新计算，另有 'Fees [$]'、'Slippage [$]'、'Funding [$]' 合计；
+      夏普比率等其余字段仍为扣除前的值
+    """
+    if cost_model is None:
+        return stats
+    stats = stats.copy()
+    trades = stats['_trades'].copy()
+    size = trades['Size'].to_numpy(dtype=float)
+    entry_price = trades['EntryPrice'].to_numpy(dtype=float)
+    fees, slippage, funding = cost_model.trade_costs(
+        size, entry_price, trades['ExitPrice'].to_numpy(dtype=float),
+        cost_model.cumulative_funding(trades['EntryTime']), cost_model.cumulative_funding(trades['ExitTime']),
+    )
+    costs = fees + slippage + funding
+    trades['Fees'], trades['Slippage'], trades['Funding'] = fees, slippage, funding
+    trades['PnL'] = trades['PnL'].to_numpy(dtype=float) - costs
+    trades['ReturnPct'] = trades['ReturnPct'].to_numpy(dtype=float) - costs / (np.abs(size) * entry_price)
+
+    equity_curve = stats.get('_equity_curve')
+    if equity_curve is not None:
+        # 成本在平仓K线从权益中扣除
+        charged = np.bincount(trades['ExitBar'].to_numpy(dtype=np.intp), costs, minlength=len(equity_curve))
+        equity = equity_curve['Equity'].to_numpy(dtype=float) - np.cumsum(charged)
+        peak = np.maximum.accumulate(equity)
+        equity_curve = equity_curve.copy()
+        equity_curve['Equity'] = equity
+        equity_curve['DrawdownPct'] = 1 - equity / peak
+        stats['_equity_curve'] = equity_curve
+        initial, final = equity[0], equity[-1]
+        stats['Equity Peak [$]'] = peak[-1]
+        stats['Max. Drawdown [%]'] = -np.nanmax(equity_curve['DrawdownPct']) * 100
+    else:
+        final = stats['Equity Final [$]'] - costs.sum()
+        initial = stats['Equity Final [$]'] / (1 + stats['Return [%]'] / 100)
+
+    returns, pl = trades['ReturnPct'], trades['PnL']
+    n_trades = len(trades)
+    growth = returns + 1
+    stats['Equity Final [$]'] = final
+    stats['Return [%]'] = (final - initial) / initial * 100
+    stats['Win Rate [%]'] = (pl > 0).mean() * 100 if n_trades else np.nan
+    stats['Best Trade [%]'] = returns.max() * 100
+    stats['Worst Trade [%]'] = returns.min() * 100
+    stats['Avg. Trade [%]'] = (0 if np.any(growth <= 0) else np.exp(np.log(growth).sum() / (n_trades or np.nan)) - 1) * 100
+    stats['Profit Factor'] = returns[returns > 0].sum() / (abs(returns[returns < 0].sum()) or np.nan)
+    stats['Expectancy [%]'] = returns.mean() * 100
+    stats['SQN'] = np.sqrt(n_trades) * pl.mean() / (pl.std() or np.nan)
+    stats['Fees [$]'], stats['Slippage [$]'], stats['Funding [$]'] = fees.sum(), slippage.sum(), funding.sum()
+    stats['_trades'] = trades
+    return stats
+
+
+class CostAwareObjective:
+    """
+    bt.optimize 的 maximize 包装：先扣除交易成本再计算目标（可被多进程序列化）。
+
+    参数:
+    - maximize: 原目标，stats 中的字段名或接收 stats 返回数值的函数
+    - cost_model: CostModel
+    """
+
+    def __init__(self, maximize, cost_model):
+        self.maximize = maximize
+        self.cost_model = cost_model
+        self.__name__ = getattr(maximize, '__name__', str(maximize))
+
+    def __call__(self, stats):
+        stats = apply_costs(stats, self.cost_model)
+        return self.maximize(stats) if callable(self.maximize) else stats[self.maximize]
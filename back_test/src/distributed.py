@@ -0,0 +1,291 @@
+import os
+import time
+import socket
+import itertools
+import threading
+
+from collections import deque
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+import numpy as np
+import pandas as pd
+
+from .acquisition import acquire_data
+from .strategy import build_backtest
+from .utils import custom_maximize
+from .objectives import METRICS, trade_metrics
+from .costs import apply_costs, build_cost_model
+
+# 分布式参数优化：协调端把参数网格切成小块（job）放进内存中的任务代理（TCP，multiprocessing.connection，authkey 做 HMAC 认证），
+# 任意机器上的工作端领取任务（租约）、用本机缓存的K线数据逐个回测、把指标发回。
+# 租约超时或工作端断开连接时任务重新排队，重复提交的结果只保留第一份，所以工作端可以随时加入、退出或崩溃。
+# multiprocessing.connection 会反序列化（unpickle）收到的消息，能通过认证的一方即可在对方进程中执行代码：
+# authkey 不能为空（空密钥不做认证），代理默认只监听本机，对其他机器开放需显式指定监听地址并只在可信网络中使用。
+
+DEFAULT_PORT = 6010
+METRIC_COLUMNS = ['win_rate', *METRICS]
+
+
+def expand_grid(optimize_params):
+    """
+    把 optimize_params 中的 *_range 展开为参数组合列表（网格全部组合，键名去掉 _range 后缀）。
+
+    返回:
+    - param_names: 参数名列表
+    - combos: [{参数名: 值}, ...]
+    """
+    ranges = {key[:-len('_range')]: list(value) for key, value in optimize_params.items() if key.endswith('_range')}
+    names = list(ranges)
+    return names, [dict(zip(names, values)) for values in itertools.product(*ranges.values())]
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class JobBroker:
+    """
+    任务代理（在协调端进程内运行）。
+
+    参数:
+    - address: 监听地址 (host, port)，默认只接受本机连接；'0.0.0.0' 允许其他机器连接
+    - authkey: 认证密钥（bytes，不能为空），工作端必须一致
+    - lease_timeout: 租约时长（秒），工作端在此时间内既没有续租也没有提交结果时任务重新排队
+    """
+
+    def __init__(self, address=('127.0.0.1', DEFAULT_PORT), authkey=b'', lease_timeout=300.0):
+        if not authkey:
+            raise ValueError("任务代理必须设置 authkey（空密钥不做认证）")
+        self.address = address
+        self.authkey = authkey
+        self.lease_timeout = lease_timeout
+        self.specs = {}  # spec_id -> 数据与回测设置
+        self.jobs = {}  # job_id -> (spec_id, [参数组合])
+        self.pending = deque()
+        self.leases = {}  # job_id -> (工作端, 到期时间)
+        self.results = {}  # job_id -> [结果行]
+        self.requeued = 0
+        self.workers = set()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._closed = False
+
+    # ---------- 协调端 ----------
+
+    def submit(self, spec, combos, chunk_size=20):
+        """
+        提交一组参数组合，按 chunk_size 切分为任务。
+
+        参数:
+        - spec: {'symbol', 'interval', 'years', 'months', 'backtest_params', 'strategy_params'}
+        - combos: 参数组合列表
+        """
+        with self._lock:
+            spec_id = len(self.specs)
+            self.specs[spec_id] = spec
+            for start in range(0, len(combos), chunk_size):
+                job_id = len(self.jobs)
+                self.jobs[job_id] = (spec_id, [{k: _plain(v) for k, v in c.items()} for c in combos[start:start + chunk_size]])
+                self.pending.append(job_id)
+        return spec_id
+
+    def start(self):
+        self._listener = Listener(self.address, authkey=self.authkey)
+        self.address = self._listener.address  # 端口为 0 时取实际端口
+        threading.Thread(target=self._accept_loop, name='broker-accept', daemon=True).start()
+        print(f"任务代理已启动: {self.address[0]}:{self.address[1]}，共 {len(self.jobs)} 个任务")
+        return self
+
+    def progress(self):
+        with self._lock:
+            return len(self.results), len(self.jobs)
+
+    def wait(self, poll_seconds=2.0, report_seconds=30.0):
+        """阻塞直到所有任务完成，定期打印进度。"""
+        last_report = 0.0
+        while True:
+            done, total = self.progress()
+            if done == total:
+                break
+            now = time.time()
+            if now - last_report >= report_seconds:
+                with self._lock:
+                    print(f"进度 {done}/{total}，租出 {len(self.leases)}，工作端 {len(self.workers)}，重新排队 {self.requeued} 次")
+                last_report = now
+            time.sleep(poll_seconds)
+        print(f"全部 {total} 个任务已完成（重新排队 {self.requeued} 次）")
+
+    def collect(self, spec_id):
+        """返回某个 spec 的全部结果（DataFrame，每行一个参数组合）。"""
+        with self._lock:
+            rows = [row for job_id, (job_spec, _) in self.jobs.items() if job_spec == spec_id for row in self.results.get(job_id, [])]
+        return pd.DataFrame(rows)
+
+    def close(self):
+        self._closed = True
+        if self._listener is not None:
+            self._listener.close()
+
+    # ---------- 服务端 ----------
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                print("工作端认证失败，已拒绝连接")
+                continue
+            except OSError:
+                break  # 监听已关闭
+            threading.Thread(target=self._serve, args=(conn,), name='broker-conn', daemon=True).start()
+
+    def _serve(self, conn):
+        worker = None
+        try:
+            while True:
+                message = conn.recv()
+                worker = message[1]
+                conn.send(self._handle(*message))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            if worker is not None:
+                self._release(worker)
+
+    def _handle(self, command, worker, *args):
+        with self._lock:
+            self.workers.add(worker)
+            self._requeue_expired()
+            if command == 'lease':
+                if self.pending:
+                    job_id = self.pending.popleft()
+                    self.leases[job_id] = (worker, time.time() + self.lease_timeout)
+                    spec_id, combos = self.jobs[job_id]
+                    return ('job', job_id, self.specs[spec_id], combos, self.lease_timeout)
+                if self.leases:
+                    return ('wait', min(5.0, self.lease_timeout / 4))  # 其他工作端的任务可能超时重新排队
+                return ('done',)
+            if command == 'renew':
+                job_id, = args
+                lease = self.leases.get(job_id)
+                if lease is None or lease[0] != worker:
+                    return ('ok', False)  # 已超时被重新分配，工作端应放弃该任务
+                self.leases[job_id] = (worker, time.time() + self.lease_timeout)
+                return ('ok', True)
+            if command == 'complete':
+                job_id, rows = args
+                self.leases.pop(job_id, None)
+                if job_id in self.results:
+                    return ('ok', False)  # 重复提交（任务超时后被其他工作端完成）
+                self.results[job_id] = rows
+                if job_id in self.pending:
+                    self.pending.remove(job_id)
+                return ('ok', True)
+            return ('error', f"未知命令: {command}")
+
+    def _requeue_expired(self):
+        now = time.time()
+        for job_id, (worker, deadline) in list(self.leases.items()):
+            if deadline < now:
+                print(f"任务 {job_id} 的租约已超时（{worker}），重新排队")
+                self._requeue(job_id)
+
+    def _release(self, worker):
+        # 工作端断开连接：它持有的任务立即重新排队，不必等租约超时
+        with self._lock:
+            self.workers.discard(worker)
+            for job_id, (holder, _) in list(self.leases.items()):
+                if holder == worker:
+                    print(f"工作端 {worker} 已断开，任务 {job_id} 重新排队")
+                    self._requeue(job_id)
+
+    def _requeue(self, job_id):
+        del self.leases[job_id]
+        if job_id not in self.results:
+            self.pending.appendleft(job_id)
+            self.requeued += 1
+
+
+def _evaluate(bt, params, cost_model=None):
+    stats = apply_costs(bt.run(**params), cost_model)  # 交易成本，见 costs.py
+    return {
+        **params,
+        'win_rate': custom_maximize(stats),  # 与批量回测热力图的取值一致
+        **trade_metrics(stats).to_dict(),  # 多目标指标，见 objectives.py
+    }
+
+
+def run_worker(address, authkey=b'', data_dir='back_test/data', name=None, connect_timeout=60.0):
+    """
+    工作端：循环领取任务并回测，直到代理报告全部完成或长时间连不上代理。
+
+    参数:
+    - address: 代理地址 (host, port)
+    - authkey: 认证密钥（bytes，不能为空）
+    - data_dir: 本机数据目录（缺少的数据由 acquire_data 下载并缓存）
+    - name: 工作端名称，默认为 主机名-进程号
+    - connect_timeout: 连不上代理时的最长重试时间（秒）
+
+    返回:
+    - int: 本工作端完成的参数组合数量
+    """
+    if not authkey:
+        raise ValueError("工作端必须设置 authkey（与任务代理一致）")
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    backtests = {}  # 本机缓存：相同数据与设置只加载一次
+    evaluated = 0
+    conn = None
+    last_contact = time.time()
+
+    def request(*message):
+        conn.send(message)
+        return conn.recv()
+
+    while True:
+        if conn is None:
+            try:
+                conn = Client(tuple(address), authkey=authkey)
+                last_contact = time.time()
+            except AuthenticationError:
+                print(f"[{name}] 认证失败，请检查两端的 authkey")
+                return evaluated
+            except (ConnectionRefusedError, OSError) as e:
+                if time.time() - last_contact > connect_timeout:
+                    print(f"[{name}] 无法连接任务代理，退出: {e}")
+                    return evaluated
+                time.sleep(1.0)
+                continue
+        try:
+            reply = request('lease', name)
+            if reply[0] == 'done':
+                print(f"[{name}] 全部任务已完成，共评估 {evaluated} 个参数组合")
+                return evaluated
+            if reply[0] == 'wait':
+                time.sleep(reply[1])
+                continue
+
+            _, job_id, spec, combos, lease_timeout = reply
+            key = repr(sorted(spec.items()))
+            if key not in backtests:
+                data = acquire_data(spec['symbol'], spec['interval'], spec['years'], spec['months'], save_dir=data_dir)
+                cost_model = build_cost_model(spec['symbol'], spec['years'], spec['months'], spec.get('cost_params'), save_dir=data_dir)
+                backtests[key] = (build_backtest(data, spec.get('backtest_params'), spec.get('strategy_params')), cost_model,
+                                  data.index[0], data.index[-1])
+            bt, cost_model, data_start, data_end = backtests[key]
+
+            rows, last_renew = [], time.time()
+            for params in combos:
+                rows.append({**_evaluate(bt, params, cost_model), 'data_start': data_start, 'data_end': data_end})
+                if time.time() - last_renew > lease_timeout / 3:
+                    if not request('renew', name, job_id)[1]:
+                        rows = None  # 租约已失效，任务已交给其他工作端
+                        break
+                    last_renew = time.time()
+            if rows is not None:
+                request('complete', name, job_id, rows)
+                evaluated += len(rows)
+        except (EOFError, OSError):
+            # 代理关闭或网络中断：重新连接（代理会把未完成的任务重新排队）
+            conn = None
+            last_contact = time.time()
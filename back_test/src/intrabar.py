@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+class IntrabarExitResolver:
+    """
+    用1m K线判断同一根策略K线内止损和止盈谁先触发。
+
+    backtesting 在一根K线同时触及止损和止盈时总是先处理止损（悲观假设），rr 较大、止损按ATR设置时这种K线并不少见，
+    会系统性压低胜率。本类预先建立策略K线到1m K线的下标区间，只在"下一根K线同时触及止损和止盈"时才逐分钟查找先触发的一侧，
+    其余K线只做一次高低价比较。
+
+    参数:
+    - bars: 策略周期K线（回测数据，DatetimeIndex 为开盘时间，含 High/Low 列）
+    - minute_bars: 同一时间段的1m K线（格式同 bars）
+    - interval: 策略周期，如 '15m'；成交量/成交额等非时间K线（见 aggtrades.py）以下一根K线的开盘时间为边界
+    """
+
+    def __init__(self, bars, minute_bars, interval):
+        self.high = bars['High'].to_numpy(dtype=float)
+        self.low = bars['Low'].to_numpy(dtype=float)
+        self.minute_high = minute_bars['High'].to_numpy(dtype=float)
+        self.minute_low = minute_bars['Low'].to_numpy(dtype=float)
+
+        # 策略K线 i 对应1m K线 [starts[i], ends[i])
+        minute_times = minute_bars.index.values
+        bar_times = bars.index.values
+        self.starts = np.searchsorted(minute_times, bar_times, side='left')
+        try:
+            bar_ends = bar_times + pd.Timedelta(interval).to_timedelta64()
+        except ValueError:
+            bar_ends = np.r_[bar_times[1:], np.datetime64('NaT')]  # 最后一根没有边界（NaT 排在最后），取到1m数据末尾
+        self.ends = np.searchsorted(minute_times, bar_ends, side='left')
+
+        self.stats = {'ambiguous': 0, 'tp_first': 0, 'sl_first': 0, 'unresolved': 0}
+
+    def first_hit(self, i, is_long, sl, tp):
+        """
+        判断第 i 根策略K线内先触发的一侧。
+
+        返回:
+        - 'sl' / 'tp': 先触发的一侧；None: 该K线没有同时触及两侧，或1m数据缺失、同一分钟内同时触及（无法判断）
+        """
+        if i >= len(self.high) or sl is None or tp is None:
+            return None
+        high, low = self.high[i], self.low[i]
+        sl_hit = low <= sl if is_long else high >= sl
+        tp_hit = high >= tp if is_long else low <= tp
+        if not (sl_hit and tp_hit):
+            return None
+
+        self.stats['ambiguous'] += 1
+        start, end = self.starts[i], self.ends[i]
+        minute_high, minute_low = self.minute_high[start:end], self.minute_low[start:end]
+        sl_minutes = minute_low <= sl if is_long else minute_high >= sl
+        tp_minutes = minute_high >= tp if is_long else minute_low <= tp
+        if not (sl_minutes.any() and tp_minutes.any()):
+            self.stats['unresolved'] += 1  # 1m 数据缺失或与策略K线不一致
+            return None
+        first_sl, first_tp = sl_minutes.argmax(), tp_minutes.argmax()
+        if first_sl == first_tp:
+            self.stats['unresolved'] += 1
+            return None
+        if first_tp < first_sl:
+            self.stats['tp_first'] += 1
+            return 'tp'
+        self.stats['sl_first'] += 1
+        return 'sl'
+
+    def resolve(self, i, is_long, sl, tp):
+        """
+        按第 i 根K线内的先后顺序去掉不会成交的一侧，无法判断时保持不变（仍按 backtesting 的止损优先处理）。
+
+        返回:
+        - (sl, tp): 本根K线应保留的止损、止盈价格（去掉的一侧为 None）
+        """
+        first = self.first_hit(i, is_long, sl, tp)
+        if first == 'tp':
+            return None, tp
+        if first == 'sl':
+            return sl, None
+        return sl, tp
@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+# 交易序列的蒙特卡洛稳健性分析：对回测交易的收益率做有放回重抽样（bootstrap）或打乱顺序（shuffle），
+# 每批模拟是一个 (模拟次数, 交易数) 的矩阵，收益、回撤、最长连亏和胜率都按行向量化计算；
+# 多批在线程池中并行（numpy 的数组运算会释放 GIL，且不会像多进程那样在 Windows 上重新执行 bt_main.py）。
+# 资金曲线按每笔交易收益率复利（与回测的全仓下单一致），不含交易之间的空仓时间。
+
+METHODS = ('bootstrap', 'shuffle')
+METRICS = ['Return [%]', 'Max. Drawdown [%]', 'Max. Consecutive Losses', 'Win Rate [%]']
+
+
+def path_metrics(returns):
+    """
+    计算每条交易序列的指标。
+
+    参数:
+    - returns: (模拟次数, 交易数) 的每笔收益率矩阵（如 0.01 表示 1%）
+
+    返回:
+    - dict: {指标名: 长度为模拟次数的数组}，指标见 METRICS
+    """
+    # 在对数空间累加，避免长序列连乘的溢出；亏损不超过 -100%
+    log_equity = np.cumsum(np.log1p(np.maximum(returns, -1 + 1e-12)), axis=1)
+    running_peak = np.maximum(np.maximum.accumulate(log_equity, axis=1), 0.0)  # 起点权益为 1
+    max_drawdown = -np.expm1(np.min(log_equity - running_peak, axis=1))
+
+    # 最长连亏：亏损累计数减去最近一次盈利时的累计数
+    losses = returns <= 0
+    loss_count = np.cumsum(losses, axis=1)
+    last_win = np.maximum.accumulate(np.where(losses, 0, loss_count), axis=1)
+    longest_losing = (loss_count - last_win).max(axis=1)
+
+    return {
+        'Return [%]': np.expm1(log_equity[:, -1]) * 100,
+        'Max. Drawdown [%]': -max_drawdown * 100,
+        'Max. Consecutive Losses': longest_losing,
+        'Win Rate [%]': (~losses).mean(axis=1) * 100,
+    }
+
+
+def _simulate_batch(returns, n_simulations, method, seed):
+    rng = np.random.default_rng(seed)
+    if method == 'bootstrap':
+        samples = returns[rng.integers(0, len(returns), size=(n_simulations, len(returns)))]
+    else:
+        samples = rng.permuted(np.tile(returns, (n_simulations, 1)), axis=1)
+    return path_metrics(samples)
+
+
+def simulate_trade_paths(returns, n_simulations=10_000, method='bootstrap', seed=None, batch_size=1000, workers=None):
+    """
+    对交易收益率序列做蒙特卡洛模拟。
+
+    参数:
+    - returns: 按时间顺序的每笔收益率（stats._trades['ReturnPct']）
+    - n_simulations: 模拟次数
+    - method: 'bootstrap' 有放回重抽样（交易数不变），'shuffle' 只打乱顺序（收益和胜率不变，检验回撤和连亏对顺序的敏感性）
+    - seed: 随机种子，种子和 batch_size 相同时结果与 workers 无关
+    - batch_size: 每批模拟次数，内存约为 batch_size * 交易数 * 8 字节的若干倍
+    - workers: 线程数，默认为 CPU 核数；为 1 时在当前线程计算
+
+    返回:
+    - DataFrame: 每行一次模拟，列为 METRICS
+    """
+    if method not in METHODS:
+        raise ValueError(f"method 应为 {METHODS} 之一: {method}")
+    returns = np.asarray(returns, dtype=float)
+    if not len(returns):
+        return pd.DataFrame(columns=METRICS)
+
+    sizes = [min(batch_size, n_simulations - start) for start in range(0, n_simulations, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))  # 每批独立的随机流
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batches = list(pool.map(_simulate_batch, [returns] * len(sizes), sizes, [method] * len(sizes), seeds))
+    else:
+        batches = [_simulate_batch(returns, size, method, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+    return pd.DataFrame({metric: np.concatenate([batch[metric] for batch in batches]) for metric in METRICS})
+
+
+def summarize_simulations(simulations, actual, confidence=0.95):
+    """
+    汇总模拟结果的分布。
+
+    参数:
+    - simulations: simulate_trade_paths 的结果
+    - actual: 原始交易序列的指标（path_metrics 的结果）
+    - confidence: 置信区间水平
+
+    返回:
+    - DataFrame: 每行一个指标，列为回测值、均值、标准差、中位数和置信区间上下限
+    """
+    tail = (1 - confidence) / 2 * 100
+    rows = []
+    for metric in METRICS:
+        values = simulations[metric].to_numpy(dtype=float)
+        rows.append({
+            'Metric': metric,
+            'Backtest': float(actual[metric][0]),
+            'Mean': values.mean(),
+            'Std': values.std(),
+            'Median': np.median(values),
+            f'CI {tail:g}%': np.percentile(values, tail),
+            f'CI {100 - tail:g}%': np.percentile(values, 100 - tail),
+        })
+    return pd.DataFrame(rows)
+
+
+def calculate_monte_carlo(stats, folder_path, n_simulations=10_000, methods=METHODS, confidence=0.95, seed=None, workers=None):
+    """
+    对单次回测的交易做蒙特卡洛稳健性分析，保存各指标的分布汇总和亏损概率。
+
+    参数:
+    - stats: 回测统计结果，包含 _trades
+    - folder_path: 保存结果的文件夹路径
+    - n_simulations: 每种方法的模拟次数
+    - methods: 模拟方法，见 simulate_trade_paths
+    - confidence: 置信区间水平
+    - seed: 随机种子
+    - workers: 线程数
+
+    返回:
+    - mc_df: 各方法、各指标的分布汇总（无交易时为 None）
+    """
+    trades = stats._trades
+    if trades.empty:
+        print("无交易数据，无法进行蒙特卡洛分析。")
+        return None
+
+    returns = trades['ReturnPct'].to_numpy(dtype=float)
+    actual = path_metrics(returns[None, :])
+    summaries = []
+    for method in methods:
+        simulations = simulate_trade_paths(returns, n_simulations, method, seed=seed, workers=workers)
+        summary = summarize_simulations(simulations, actual, confidence)
+        summary.insert(0, 'Method', method)
+        summary['Prob. Loss [%]'] = (simulations['Return [%]'] < 0).mean() * 100
+        summaries.append(summary)
+
+    mc_df = pd.concat(summaries, ignore_index=True)
+    mc_filename = f'{folder_path}/monte_carlo.csv'
+    mc_df.to_csv(mc_filename, index=False)
+    print(f"蒙特卡洛分析（{len(returns)} 笔交易，每种方法 {n_simulations} 次模拟）结果已保存到: {mc_filename}")
+    print(mc_df)
+    return mc_df
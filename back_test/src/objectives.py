@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# 多目标评价：每个参数组合一次性计算一组指标（胜率、交易数、净 R、回撤、持仓时间占比等），
+# 在全部组合中保留 Pareto 前沿（没有任何其他组合在所有目标上都不差且至少一项更好），
+# 前沿随批量回测结果保存，不同目标之间的取舍可以直接查看，不必按每个指标各跑一次优化。
+
+METRICS = ['Win Rate [%]', '# Trades', 'Net R', 'Avg. R', 'Return [%]', 'Max. Drawdown [%]', 'Exposure Time [%]', 'Profit Factor']
+
+# 默认目标：{指标: 'max' 或 'min'}；回撤为负数，'max' 表示回撤越小越好
+DEFAULT_OBJECTIVES = {'Win Rate [%]': 'max', 'Net R': 'max', '# Trades': 'max'}
+
+
+def r_multiples(pnl, size, entry_price, sl):
+    """
+    每笔交易的 R 倍数：盈亏 / 开仓时的止损风险（数量 * |开仓价 - 止损价|），没有止损的交易为 NaN。
+    """
+    pnl, size, entry_price, sl = (np.asarray(values, dtype=float) for values in (pnl, size, entry_price, sl))
+    risk = np.abs(size) * np.abs(entry_price - sl)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(risk > 0, pnl / risk, np.nan)
+
+
+def trade_metrics(stats):
+    """
+    计算一个参数组合的指标向量。
+
+    参数:
+    - stats: 回测统计结果；有 _trades 时由交易明细计算 R 倍数，否则使用 stats 中已有的同名字段（批量内核的结果已包含）
+
+    返回:
+    - pd.Series: 指标见 METRICS
+    """
+    metrics = pd.Series({metric: stats.get(metric, np.nan) for metric in METRICS}, dtype=float)
+    trades = stats.get('_trades')
+    if trades is not None:
+        r = r_multiples(trades['PnL'], trades['Size'], trades['EntryPrice'], trades['SL'].astype(float))
+        metrics['Net R'] = np.nansum(r)
+        metrics['Avg. R'] = np.nanmean(r) if np.isfinite(r).any() else np.nan
+    return metrics
+
+
+def pareto_front(trials, objectives=None, min_trades=0):
+    """
+    找出 Pareto 前沿。
+
+    参数:
+    - trials: 每行一个参数组合的 DataFrame，包含 objectives 中的列
+    - objectives: {列名: 'max' / 'min'}，默认为 DEFAULT_OBJECTIVES
+    - min_trades: 交易数少于该值的组合不参与（胜率、净 R 不可信）
+
+    返回:
+    - np.ndarray: 布尔数组，True 表示该组合在前沿上
+    """
+    objectives = objectives or DEFAULT_OBJECTIVES
+    values = np.column_stack([
+        trials[column].to_numpy(dtype=float) * (1.0 if direction == 'max' else -1.0)
+        for column, direction in objectives.items()
+    ])
+    feasible = np.isfinite(values).all(axis=1)
+    if min_trades:
+        feasible &= trials['# Trades'].to_numpy(dtype=float) >= min_trades
+
+    # 按目标字典序降序排列后，能支配某个点的点一定排在它前面，一次遍历即可，前沿上的点不会再被后面的点支配
+    candidates = np.flatnonzero(feasible)
+    order = candidates[np.lexsort(-values[candidates].T[::-1])]
+    front = np.empty((len(order), values.shape[1]))
+    size = 0
+    on_front = np.zeros(len(trials), dtype=bool)
+    for i in order:
+        point = values[i]
+        kept = front[:size]
+        if size and ((kept >= point).all(axis=1) & (kept > point).any(axis=1)).any():
+            continue
+        front[size] = point
+        size += 1
+        on_front[i] = True
+    return on_front
+
+
+def save_pareto_front(trials, folder, params, objectives=None, min_trades=0):
+    """
+    计算 Pareto 前沿，保存到 pareto_front.csv（按第一个目标降序），并在 trials 中标记 pareto 列。
+
+    参数:
+    - trials: 每行一个参数组合的 DataFrame（参数列和 METRICS 中的指标列）
+    - folder: 保存结果的文件夹路径
+    - params: 参数列名
+    - objectives, min_trades: 见 pareto_front
+
+    返回:
+    - trials: 增加 pareto 列（0/1）的副本
+    - front: 前沿上的组合
+    """
+    objectives = objectives or DEFAULT_OBJECTIVES
+    trials = trials.copy()
+    trials['pareto'] = pareto_front(trials, objectives, min_trades).astype(int)
+    columns = list(params) + [metric for metric in METRICS if metric in trials.columns]
+    first, direction = next(iter(objectives.items()))
+    front = trials.loc[trials['pareto'] == 1, columns].sort_values(first, ascending=direction != 'max', ignore_index=True)
+
+    front_filename = f'{folder}/pareto_front.csv'
+    front.to_csv(front_filename, index=False)
+    print(f"Pareto 前沿（目标 {objectives}，最少 {min_trades} 笔交易）共 {len(front)} 个组合，已保存到: {front_filename}")
+    print(front)
+    return trials, front
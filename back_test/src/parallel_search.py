@@ -0,0 +1,335 @@
+import os
+import time
+import queue
+
+import numpy as np
+import pandas as pd
+
+import backtesting
+
+from scipy.linalg import cho_solve, solve_triangular
+from scipy.spatial.distance import cdist
+from scipy.stats import norm
+
+from .strategy import build_backtest
+from .objectives import trade_metrics
+from .costs import apply_costs
+
+# 异步并行参数搜索：多个工作进程同时回测，每返回一个结果就更新代理模型并补上新的候选，不必等整批结束。
+# 'bayes' 用高斯过程（Matern 5/2 核）拟合已评估的结果，按期望改进（EI）选点；一次需要多个候选时，
+# 把进行中的候选以模型预测值作为"假结果"加入模型（kriging believer），使同一批候选彼此分散。
+# 'random' 和 'grid' 使用同一套并行框架，只是候选顺序不同，便于按耗时比较收敛速度。
+# 参数取值按在各自取值列表中的位置归一化到 [0, 1]，只会评估网格上的点。
+
+METHODS = ('bayes', 'random', 'grid')
+
+_worker_bt = None
+_worker_cost_model = None
+
+
+def _init_worker(data, backtest_params, strategy_params, exit_resolver, cost_model=None):
+    # 每个工作进程只创建一次 Backtest；策略类是局部类，不能随任务传递
+    global _worker_bt, _worker_cost_model
+    _worker_bt = build_backtest(data, backtest_params, strategy_params, exit_resolver)
+    _worker_cost_model = cost_model
+
+
+def _run_params(params):
+    stats = apply_costs(_worker_bt.run(**params), _worker_cost_model)  # 交易成本在工作进程中扣除（见 costs.py）
+    # 去掉 _trades、_equity_curve 等大对象，减少进程间传输；需要交易明细的多目标指标先算好附上
+    return pd.concat([stats.filter(regex='^[^_]'), trade_metrics(stats)[['Net R', 'Avg. R']]])
+
+
+def _matern52(a, b, length_scale):
+    distance = cdist(a, b) * (np.sqrt(5.0) / length_scale)
+    return (1.0 + distance + distance ** 2 / 3.0) * np.exp(-distance)
+
+
+class GaussianProcess:
+    """
+    简单的高斯过程回归（常数均值、Matern 5/2 核），长度尺度按对数边际似然在候选值中选择。
+
+    参数:
+    - noise: 标准化后目标值的噪声方差（回测结果确定，但相邻参数的胜率跳动较大，留一些噪声更稳健）
+    - length_scales: 候选长度尺度（归一化坐标）
+    """
+
+    def __init__(self, noise=1e-2, length_scales=(0.05, 0.1, 0.2, 0.4, 0.8)):
+        self.noise = noise
+        self.length_scales = length_scales
+
+    def fit(self, x, y, length_scale=None):
+        """拟合模型；指定 length_scale 时不再选择（同一批候选的多次拟合复用第一次选出的长度尺度）。"""
+        self.x = x
+        self.y_mean, self.y_std = y.mean(), y.std() or 1.0
+        z = (y - self.y_mean) / self.y_std
+        best = None
+        for length_scale in ([length_scale] if length_scale else self.length_scales):
+            k = _matern52(x, x, length_scale) + self.noise * np.eye(len(x))
+            try:
+                chol = np.linalg.cholesky(k)
+            except np.linalg.LinAlgError:
+                continue
+            alpha = cho_solve((chol, True), z)
+            log_likelihood = -0.5 * z @ alpha - np.log(np.diag(chol)).sum()
+            if best is None or log_likelihood > best[0]:
+                best = (log_likelihood, length_scale, chol, alpha)
+        _, self.length_scale, self.chol, self.alpha = best
+        return self
+
+    def predict(self, x):
+        k = _matern52(x, self.x, self.length_scale)
+        mean = k @ self.alpha
+        v = solve_triangular(self.chol, k.T, lower=True)
+        std = np.sqrt(np.maximum(1.0 - (v ** 2).sum(0), 1e-12))
+        return mean * self.y_std + self.y_mean, std * self.y_std
+
+
+def expected_improvement(mean, std, best, xi=0.01):
+    improvement = mean - best - xi * abs(best)
+    z = improvement / std
+    return improvement * norm.cdf(z) + std * norm.pdf(z)
+
+
+class ParallelSearch:
+    """
+    候选生成（ask/tell 接口）。
+
+    参数:
+    - search_space: {参数名: 取值列表}
+    - method: 'bayes' / 'random' / 'grid'
+    - n_initial: 贝叶斯优化前随机评估的数量
+    - n_candidates: 网格较大时每次从中抽样打分的候选数量
+    - max_model_points: 拟合高斯过程的最多样本数（较好的一半加随机的一半），控制每次建模的耗时
+    - random_state: 随机种子
+    """
+
+    def __init__(self, search_space, method='bayes', n_initial=None, n_candidates=2000, max_model_points=300, random_state=None):
+        if method not in METHODS:
+            raise ValueError(f"method 应为 {METHODS} 之一: {method}")
+        self.names = list(search_space)
+        self.values = [list(values) for values in search_space.values()]
+        self.shape = tuple(len(values) for values in self.values)
+        self.size = int(np.prod(self.shape))
+        self.method = method
+        self.n_initial = n_initial or max(2 * len(self.names), 10)
+        self.n_candidates = n_candidates
+        self.max_model_points = max_model_points
+        self.rng = np.random.default_rng(random_state)
+        self.observed = {}  # 网格下标 -> 目标值
+        self.pending = set()
+        self.model = None
+        self._grid_order = iter(np.arange(self.size)) if method == 'grid' else None
+
+    def params(self, flat):
+        index = np.unravel_index(flat, self.shape)
+        return {name: values[i] for name, values, i in zip(self.names, self.values, index)}
+
+    def _coordinates(self, flat):
+        index = np.array(np.unravel_index(np.asarray(flat), self.shape), dtype=float).T
+        scale = np.maximum(np.array(self.shape, dtype=float) - 1, 1)
+        return index / scale
+
+    def _unseen(self, flat):
+        flat = np.unique(flat)
+        seen = np.fromiter(self.observed.keys(), dtype=np.intp, count=len(self.observed))
+        taken = np.concatenate([seen, np.fromiter(self.pending, dtype=np.intp, count=len(self.pending))])
+        return flat[~np.isin(flat, taken)]
+
+    def _random(self, n):
+        if self.size <= 2 * self.n_candidates:
+            pool = self._unseen(np.arange(self.size))
+        else:
+            pool = self._unseen(self.rng.integers(0, self.size, size=max(4 * n, 64)))
+        return self.rng.permutation(pool)[:n]
+
+    def _candidates(self):
+        if self.size <= self.n_candidates:
+            return self._unseen(np.arange(self.size))
+        # 大网格：随机抽样，并加入当前最佳点在各维度上的相邻格点（局部细化）
+        samples = [self.rng.integers(0, self.size, size=self.n_candidates)]
+        top = sorted(self.observed, key=self.observed.get, reverse=True)[:5]
+        for flat in top:
+            index = np.array(np.unravel_index(flat, self.shape))
+            for dim in range(len(self.shape)):
+                for step in (-1, 1):
+                    neighbor = index.copy()
+                    neighbor[dim] += step
+                    if 0 <= neighbor[dim] < self.shape[dim]:
+                        samples.append([np.ravel_multi_index(tuple(neighbor), self.shape)])
+        return self._unseen(np.concatenate(samples))
+
+    def _model_data(self):
+        flat = np.fromiter(self.observed.keys(), dtype=np.intp, count=len(self.observed))
+        y = np.fromiter(self.observed.values(), dtype=float, count=len(self.observed))
+        if len(flat) > self.max_model_points:
+            order = np.argsort(-y)
+            half = self.max_model_points // 2
+            rest = self.rng.choice(order[half:], self.max_model_points - half, replace=False)
+            keep = np.concatenate([order[:half], rest])
+            flat, y = flat[keep], y[keep]
+        return flat, y
+
+    def ask(self, n=1):
+        """
+        返回最多 n 个新候选（网格下标），并标记为进行中；网格已全部评估时返回空列表。
+        """
+        if self.method == 'grid':
+            chosen = []
+            for flat in self._grid_order:
+                chosen.append(int(flat))
+                if len(chosen) >= n:
+                    break
+        elif self.method == 'random' or len(self.observed) < self.n_initial:
+            chosen = [int(flat) for flat in self._random(n)]
+        else:
+            chosen = self._ask_bayes(n)
+        self.pending.update(chosen)
+        return chosen
+
+    def _ask_bayes(self, n):
+        flat, y = self._model_data()
+        best = y.max()
+        candidates = self._candidates()
+        if not len(candidates):
+            return []
+        candidate_x = self._coordinates(candidates)
+        # 进行中的候选以模型预测值作为假结果，降低其附近的不确定性，使同一批候选分散
+        fantasy_flat = list(self.pending)
+        model = GaussianProcess().fit(self._coordinates(flat), y)
+        fantasy_y = list(model.predict(self._coordinates(fantasy_flat))[0]) if fantasy_flat else []
+        chosen = []
+        available = np.ones(len(candidates), dtype=bool)
+        for _ in range(n):
+            if not available.any():
+                break
+            x = self._coordinates(np.concatenate([flat, np.array(fantasy_flat, dtype=np.intp)]))
+            self.model = GaussianProcess().fit(x, np.concatenate([y, fantasy_y]), model.length_scale)
+            mean, std = self.model.predict(candidate_x)
+            score = np.where(available, expected_improvement(mean, std, best), -np.inf)
+            pick = int(np.argmax(score))
+            available[pick] = False
+            chosen.append(int(candidates[pick]))
+            fantasy_flat.append(candidates[pick])
+            fantasy_y.append(mean[pick])
+        return chosen
+
+    def tell(self, flat, value):
+        """记录一个候选的结果（NaN 按 0 处理，与 backtesting 的 sambo 优化一致）。"""
+        self.pending.discard(flat)
+        self.observed[flat] = 0.0 if value is None or np.isnan(value) else float(value)
+
+
+def parallel_optimize(data, search_space, backtest_params=None, strategy_params=None, exit_resolver=None, maximize='SQN',
+                      method='bayes', max_tries=200, workers=None, batch_size=None, time_budget=None, random_state=None, cost_model=None):
+    """
+    异步并行参数搜索。
+
+    参数:
+    - data: K线数据
+    - search_space: {参数名: 取值列表}
+    - backtest_params, strategy_params, exit_resolver: 见 build_backtest
+    - maximize: 目标，stats 中的列名或接收 stats 返回数值的函数
+    - method: 'bayes' / 'random' / 'grid'（grid 按网格顺序，max_tries 小于网格大小时与 backtesting 一样随机抽取部分网格点）
+    - max_tries: 最多评估次数（0 到 1 之间表示网格比例）
+    - workers: 并行进程数，默认为 CPU 核数（使用 backtesting.Pool，Windows 上为线程）
+    - batch_size: 每次最多补充的候选数量，默认等于 workers
+    - time_budget: 最长搜索时间（秒），到时不再提交新候选
+    - random_state: 随机种子
+    - cost_model: 交易成本模型（见 costs.py），None 则不扣除
+
+    返回:
+    - stats: 最佳参数的回测统计（扣除成本后）
+    - heatmap: 已评估的参数组合及目标值（与 bt.optimize 的 heatmap 格式相同，_full_stats 为各组合的统计）
+    - history: 按完成顺序的评估记录：耗时、目标值、当前最佳值和参数，用于比较收敛速度
+    """
+    search = ParallelSearch(search_space, method, random_state=random_state)
+    if 0 < max_tries <= 1:
+        max_tries = max(1, int(max_tries * search.size))
+    max_tries = min(max_tries, search.size)
+    if method == 'grid' and max_tries < search.size:
+        search._grid_order = iter(np.sort(search.rng.choice(search.size, max_tries, replace=False)))
+    workers = max(1, min(workers or os.cpu_count() or 1, max_tries))
+    batch_size = batch_size or workers
+    objective = maximize if callable(maximize) else (lambda stats: stats[maximize])
+    maximize_key = getattr(maximize, '__name__', str(maximize))
+
+    done = queue.Queue()
+    submitted, rows, full_stats = 0, [], {}
+    start = time.perf_counter()
+    with backtesting.Pool(workers, _init_worker, (data, backtest_params, strategy_params, exit_resolver, cost_model)) as pool:
+        in_flight = 0
+        while True:
+            expired = time_budget is not None and time.perf_counter() - start > time_budget
+            free = min(workers - in_flight, batch_size, max_tries - submitted)
+            if free > 0 and not expired:
+                for flat in search.ask(free):
+                    pool.apply_async(
+                        _run_params, (search.params(flat),),
+                        callback=lambda stats, flat=flat: done.put((flat, stats, None)),
+                        error_callback=lambda error, flat=flat: done.put((flat, None, error)),
+                    )
+                    submitted += 1
+                    in_flight += 1
+            if not in_flight:
+                break
+            # 等到至少一个结果，再取走所有已完成的结果后更新模型
+            results = [done.get()]
+            while True:
+                try:
+                    results.append(done.get_nowait())
+                except queue.Empty:
+                    break
+            for flat, stats, error in results:
+                in_flight -= 1
+                if error is not None:
+                    raise error
+                value = objective(stats) if stats['# Trades'] else np.nan
+                search.tell(flat, value)
+                full_stats[flat] = stats
+                rows.append({
+                    'evaluation': len(rows) + 1,
+                    'elapsed_s': time.perf_counter() - start,
+                    'value': value,
+                    **search.params(flat),
+                })
+
+    history = pd.DataFrame(rows)
+    history['best'] = history['value'].fillna(-np.inf).cummax().replace(-np.inf, np.nan)
+
+    order = sorted(full_stats, key=lambda flat: tuple(search.params(flat).values()))
+    heatmap = pd.Series(
+        [objective(full_stats[flat]) if full_stats[flat]['# Trades'] else np.nan for flat in order],
+        index=pd.MultiIndex.from_tuples([tuple(search.params(flat).values()) for flat in order], names=search.names),
+        name=maximize_key,
+    )
+    heatmap._full_stats = [full_stats[flat] for flat in order]  # process_batch_backtest 从中读取交易数量
+
+    bt = build_backtest(data, backtest_params, strategy_params, exit_resolver)
+    stats = apply_costs(bt.run(**search.params(max(search.observed, key=search.observed.get))), cost_model)
+    print(f"并行搜索（{method}，{workers} 个进程）评估 {len(history)} 个组合，耗时 {history['elapsed_s'].iloc[-1]:.1f} 秒，"
+          f"最佳 {maximize_key} = {history['best'].iloc[-1]}")
+    return stats, heatmap, history
+
+
+def convergence_table(histories, checkpoints=None):
+    """
+    比较多个搜索方法的收敛速度：各时间点（秒）上的当前最佳值和已评估数量。
+
+    参数:
+    - histories: {方法名: parallel_optimize 返回的 history}
+    - checkpoints: 时间点列表，默认取最长耗时的 10 等分
+
+    返回:
+    - DataFrame: 行为时间点，列为 (方法, 'best'/'evaluations')
+    """
+    if checkpoints is None:
+        longest = max(history['elapsed_s'].iloc[-1] for history in histories.values())
+        checkpoints = np.linspace(longest / 10, longest, 10)
+    table = {}
+    for name, history in histories.items():
+        position = np.searchsorted(history['elapsed_s'].to_numpy(), checkpoints, side='right')
+        best = history['best'].to_numpy()
+        table[(name, 'best')] = [best[p - 1] if p else np.nan for p in position]
+        table[(name, 'evaluations')] = position
+    return pd.DataFrame(table, index=pd.Index(np.round(checkpoints, 2), name='elapsed_s'))
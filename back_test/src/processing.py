@@ -1,10 +1,16 @@
 import os
 
+import pandas as pd
+
 from datetime import datetime
 from backtesting.lib import plot_heatmaps
 from .utils import create_3d_heatmap_cube
+from .stability import analyze_parameter_stability
+from .objectives import METRICS, save_pareto_front, trade_metrics
+from .costs import apply_costs
 
-def process_batch_backtest(stats, heatmap, symbol, interval, bt, results_dir='back_test/results'):
+def process_batch_backtest(stats, heatmap, symbol, interval, bt, results_dir='back_test/results', pareto_objectives=None, pareto_min_trades=0,
+                           cost_model=None):
     """
     处理批量回测结果：保存文件、生成图表。
     
@@ -15,27 +21,38 @@ def process_batch_backtest(stats, heatmap, symbol, interval, bt, results_dir='ba
     - interval: 时间间隔
     - bt: Backtest 对象 (此处不再需要)
     - results_dir: 结果保存目录
+    - pareto_objectives: Pareto 前沿的目标 {指标: 'max'/'min'}，默认见 objectives.DEFAULT_OBJECTIVES
+    - pareto_min_trades: 参与 Pareto 前沿的最少交易数
+    - cost_model: 交易成本模型（见 costs.py），没有 _full_stats 而重新回测时用于扣除成本
+
+    返回:
+    - batch_folder: 本次结果的保存文件夹
+    - trials: 每个参数组合的结果（参数稳定性分析成功时附带邻域统计），用于写入结果数据库
     """
     # 将 heatmap 转换为 DataFrame
     heatmap_df = heatmap.reset_index()
     
-    # 从 heatmap._full_stats 中高效提取交易数量，避免重新运行回测
+    # 从 heatmap._full_stats 中高效提取交易数量和多目标指标，避免重新运行回测
     if hasattr(heatmap, '_full_stats'):
-        trades_list = [s['# Trades'] for s in heatmap._full_stats]
-        heatmap_df['# Trades'] = trades_list
+        metrics = [trade_metrics(s) for s in heatmap._full_stats]
     else:
         # 如果 _full_stats 不可用，则保留原有逻辑作为后备，但会很慢
         print("警告: heatmap._full_stats 不可用，将重新运行回测以获取交易数量，这会非常耗时。")
-        trades_list = []
+        metrics = []
         for params in heatmap.index:
             param_dict = dict(zip(heatmap.index.names, params))
-            temp_stats = bt.run(**param_dict)
-            trades_list.append(temp_stats['# Trades'])
-        heatmap_df['# Trades'] = trades_list
+            temp_stats = apply_costs(bt.run(**param_dict), cost_model)
+            metrics.append(trade_metrics(temp_stats))
+    metrics_df = pd.DataFrame(metrics, index=heatmap_df.index)
+    heatmap_df['# Trades'] = metrics_df['# Trades']
 
     # 重命名列
     new_columns = list(heatmap.index.names) + ['win_rate', '# Trades']
     heatmap_df.columns = new_columns
+    # 新增：多目标指标（净 R、回撤、持仓时间占比等，见 objectives.py），用于 Pareto 前沿
+    extra_metrics = [metric for metric in METRICS if metric not in ('# Trades', 'Win Rate [%]')]
+    heatmap_df = pd.concat([heatmap_df, metrics_df[extra_metrics]], axis=1)
+    heatmap_df['Win Rate [%]'] = metrics_df['Win Rate [%]']
     
     # 聚合：对 ema_period, atr_period, multiplier 分组，取 win_rate 的最大值（或平均）
     aggregated = heatmap_df.groupby(['ema_period', 'atr_period', 'multiplier'])['win_rate'].max().reset_index()
@@ -50,6 +67,23 @@ def process_batch_backtest(stats, heatmap, symbol, interval, bt, results_dir='ba
         create_3d_heatmap_cube(aggregated, batch_folder)
     except Exception as e:
         print(f"3D 热力图生成失败: {e}")
+
+    # 新增：Pareto 前沿（多目标取舍），保存到 pareto_front.csv，并在每个组合上标记是否在前沿
+    params = list(heatmap.index.names)
+    try:
+        heatmap_df, _ = save_pareto_front(heatmap_df, batch_folder, params, pareto_objectives, pareto_min_trades)
+    except Exception as e:
+        print(f"Pareto 前沿计算失败: {e}")
+
+    # 新增：参数稳定性分析，在全部优化参数的网格上按邻域胜率排名稳健平台（groupby().max() 只能看到孤立的最高点）
+    trials = heatmap_df
+    try:
+        _, cells = analyze_parameter_stability(heatmap_df, batch_folder, params)
+        if cells is not None:
+            extra = heatmap_df.drop(columns=['win_rate', '# Trades']).drop_duplicates(params)
+            trials = cells.merge(extra, on=params, how='left')
+    except Exception as e:
+        print(f"参数稳定性分析失败: {e}")
     
     # 修改文件名以包含最佳胜率和交易数量
     win_rate = stats['Win Rate [%]']
@@ -59,6 +93,14 @@ def process_batch_backtest(stats, heatmap, symbol, interval, bt, results_dir='ba
     plot_heatmaps(heatmap, filename=plot_filename, open_browser=True)
     heatmap_df.to_csv(heatmap_filename, index=False)  # 使用 heatmap_df 保存，包含 # Trades 列
 
+    # 新增：并行搜索的收敛记录（按完成顺序的耗时、目标值和当前最佳值），用于与网格/随机搜索比较
+    if hasattr(heatmap, '_convergence'):
+        convergence_filename = f'{batch_folder}/convergence.csv'
+        heatmap._convergence.to_csv(convergence_filename, index=False)
+        print(f"收敛记录已保存到: {convergence_filename}")
+
+    return batch_folder, trials
+
 def process_single_backtest(stats, symbol, interval, bt, results_dir='back_test/results', strategy_params=None):
     """
     处理单次回测结果：保存文件、生成图表。
@@ -67,9 +109,12 @@ def process_single_backtest(stats, symbol, interval, bt, results_dir='back_test/
     - stats: 回测统计结果
     - symbol: 交易对符号
     - interval: 时间间隔
-    - bt: Backtest 对象，用于生成图表
+    - bt: Backtest 对象，用于生成图表（流式回测为 None，不生成图表）
     - results_dir: 结果保存目录
     - strategy_params: 策略参数，用于获取 rr
+
+    返回:
+    - single_folder: 本次结果的保存文件夹（用于后续分析，如蒙特卡洛）
     """
     # 生成时间戳并创建新文件夹
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -83,7 +128,8 @@ def process_single_backtest(stats, symbol, interval, bt, results_dir='back_test/
     plot_filename = f'{single_folder}/ema_atr_win{win_rate}_trades{num_trades}.html'
     
     stats._trades.to_csv(trades_filename, index=True)
-    bt.plot(filename=plot_filename, plot_trades=True, open_browser=False)
+    if bt is not None:
+        bt.plot(filename=plot_filename, plot_trades=True, open_browser=False)
 
     # 新增：计算不同小时的胜率
     rr = strategy_params.get('rr', 2) if strategy_params else 2
@@ -92,6 +138,8 @@ def process_single_backtest(stats, symbol, interval, bt, results_dir='back_test/
     # 新增：计算做多和做空的胜率
     calculate_long_short_win_rate(stats, single_folder)
 
+    return single_folder
+
 def calculate_hourly_win_rate(stats, folder_path, rr=2):
     """
     计算当前参数在不同小时时间的净胜次数（胜利次数乘以rr减去失败次数）。
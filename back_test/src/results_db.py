@@ -0,0 +1,291 @@
+import os
+import json
+import sqlite3
+import subprocess
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 回测结果数据库（SQLite，单文件，无需额外依赖）：每次单次/批量回测写入一条 runs 记录（品种、周期、数据区间、参数、代码版本、结果文件夹），
+# 每个参数组合写入一条 trials 记录（优化目标值、胜率、交易数、参数稳定性得分等），跨品种、跨时间段、跨代码版本的比较直接用索引查询，不再逐个解析 CSV。
+
+DEFAULT_DB_PATH = 'back_test/results/results.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,              -- 'single' / 'batch'
+    created_at TEXT NOT NULL,        -- 运行时间（本地时间 ISO 格式）
+    symbol TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    data_start TEXT,                 -- 回测数据起止时间
+    data_end TEXT,
+    code_version TEXT,               -- git 提交号，有未提交修改时带 +dirty
+    folder TEXT,                     -- 结果文件夹
+    params TEXT,                     -- 单次回测为 strategy_params，批量回测为 optimize_params（JSON）
+    backtest_params TEXT,            -- JSON
+    objective TEXT,                  -- 批量回测的优化目标（maximize 的字段名或函数名）
+    win_rate REAL,                   -- 单次回测或批量回测最佳参数的统计
+    n_trades INTEGER,
+    return_pct REAL,
+    max_drawdown REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_symbol ON runs (symbol, interval, data_start);
+CREATE INDEX IF NOT EXISTS idx_runs_created ON runs (created_at);
+
+CREATE TABLE IF NOT EXISTS trials (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    params TEXT NOT NULL,            -- 参数组合（JSON，键已排序）
+    objective_value REAL,            -- 优化目标的取值（目标名见 runs.objective），单次回测为空
+    win_rate REAL,                   -- 胜率 Win Rate [%]
+    n_trades INTEGER,
+    score REAL,                      -- 参数稳定性得分（邻域均值 - 标准差，见 stability.py），单次回测为空
+    neighborhood_mean REAL,
+    neighborhood_min REAL,
+    neighborhood_std REAL,
+    coverage REAL,
+    net_r REAL,                      -- 多目标指标（见 objectives.py）
+    max_drawdown REAL,
+    exposure REAL,
+    pareto INTEGER                   -- 1 表示在该次批量回测的 Pareto 前沿上
+);
+CREATE INDEX IF NOT EXISTS idx_trials_score ON trials (run_id, score);
+CREATE INDEX IF NOT EXISTS idx_trials_win_rate ON trials (run_id, win_rate);
+CREATE INDEX IF NOT EXISTS idx_trials_neighborhood_mean ON trials (run_id, neighborhood_mean);
+CREATE INDEX IF NOT EXISTS idx_trials_neighborhood_min ON trials (run_id, neighborhood_min);
+CREATE INDEX IF NOT EXISTS idx_trials_objective_value ON trials (run_id, objective_value);
+CREATE INDEX IF NOT EXISTS idx_trials_net_r ON trials (run_id, net_r);
+CREATE INDEX IF NOT EXISTS idx_trials_pareto ON trials (run_id, pareto);
+"""
+
+TRIAL_METRICS = ['objective_value', 'win_rate', 'n_trades', 'score', 'neighborhood_mean', 'neighborhood_min', 'neighborhood_std',
+                 'coverage', 'net_r', 'max_drawdown', 'exposure', 'pareto']
+
+# trials DataFrame 列名（process_batch_backtest / stability / objectives）到数据库列名
+TRIAL_COLUMN_NAMES = {'# Trades': 'n_trades', 'Win Rate [%]': 'win_rate', 'Net R': 'net_r', 'Max. Drawdown [%]': 'max_drawdown',
+                      'Exposure Time [%]': 'exposure'}
+# trials 中优化目标的取值列：参数稳定性分析的 value，否则为热力图取值列 win_rate
+# （process_batch_backtest 沿用的列名，取值是 maximize 的结果，不一定是胜率）
+OBJECTIVE_VALUE_COLUMNS = ('value', 'win_rate')
+
+# 排名可用的指标（均有 (run_id, 指标) 索引；只允许这些列名拼入 SQL）
+RANK_COLUMNS = ('score', 'objective_value', 'win_rate', 'neighborhood_mean', 'neighborhood_min', 'net_r')
+
+
+def _plain(value):
+    # numpy 标量、range、Timestamp 等转换为可写入 JSON 的 Python 对象
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (range, np.ndarray, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if callable(value):
+        return getattr(value, '__name__', repr(value))
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _to_json(value):
+    return json.dumps(_plain(value), ensure_ascii=False, sort_keys=True)
+
+
+def _number(value):
+    if value is None:
+        return None
+    value = _plain(value)
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def code_version(repo_dir=None):
+    """
+    返回当前代码的 git 提交号（有未提交修改时带 +dirty），不在 git 仓库中时返回 None。
+    """
+    repo_dir = repo_dir or os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, timeout=10)
+        if commit.returncode != 0:
+            return None
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, capture_output=True, text=True, timeout=10)
+        return commit.stdout.strip() + ('+dirty' if dirty.stdout.strip() else '')
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class ResultsDB:
+    """
+    回测结果数据库。
+
+    参数:
+    - path: 数据库文件路径，不存在时自动创建
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 写入 ----------
+
+    def _insert_run(self, kind, stats, symbol, interval, params, backtest_params, folder, objective=None):
+        cursor = self.conn.execute(
+            'INSERT INTO runs (kind, created_at, symbol, interval, data_start, data_end, code_version, folder, params, '
+            'backtest_params, objective, win_rate, n_trades, return_pct, max_drawdown) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                kind, datetime.now().isoformat(timespec='seconds'), symbol, interval,
+                _plain(stats.get('Start')), _plain(stats.get('End')), code_version(), folder,
+                _to_json(params or {}), _to_json(backtest_params or {}), _plain(objective),
+                _number(stats.get('Win Rate [%]')), _number(stats.get('# Trades')),
+                _number(stats.get('Return [%]')), _number(stats.get('Max. Drawdown [%]')),
+            ),
+        )
+        return cursor.lastrowid
+
+    def record_single(self, stats, symbol, interval, strategy_params, backtest_params=None, folder=None):
+        """
+        记录一次单次回测。
+
+        返回:
+        - run_id
+        """
+        with self.conn:
+            run_id = self._insert_run('single', stats, symbol, interval, strategy_params, backtest_params, folder)
+            self.conn.execute(
+                'INSERT INTO trials (run_id, params, win_rate, n_trades) VALUES (?, ?, ?, ?)',
+                (run_id, _to_json(strategy_params or {}), _number(stats.get('Win Rate [%]')), _number(stats.get('# Trades'))),
+            )
+        return run_id
+
+    def record_batch(self, stats, trials, param_names, symbol, interval, optimize_params=None, backtest_params=None, folder=None,
+                     objective=None):
+        """
+        记录一次批量回测及其全部参数组合。
+
+        参数:
+        - stats: 最佳参数的回测统计
+        - trials: 每行一个参数组合的 DataFrame，含参数列、优化目标值（value 或 win_rate 列，见 OBJECTIVE_VALUE_COLUMNS）、
+          Win Rate [%]、# Trades，以及可选的稳定性列（见 stability.rank_plateaus）、多目标指标列和 pareto 标记（见 objectives.save_pareto_front）
+        - param_names: 参数列名
+        - objective: 优化目标（maximize 的字段名或函数），记录到 runs.objective
+
+        返回:
+        - run_id
+        """
+        value_column = next((column for column in OBJECTIVE_VALUE_COLUMNS if column in trials.columns), None)
+        frame = trials.drop(columns=[c for c in OBJECTIVE_VALUE_COLUMNS if c != value_column and c in trials.columns])
+        frame = frame.rename(columns={value_column: 'objective_value'} if value_column else {}).rename(columns=TRIAL_COLUMN_NAMES)
+        params = [_to_json(dict(zip(param_names, row))) for row in frame[param_names].itertuples(index=False, name=None)]
+        columns = {metric: frame[metric].to_numpy() if metric in frame.columns else [None] * len(frame) for metric in TRIAL_METRICS}
+        with self.conn:
+            run_id = self._insert_run('batch', stats, symbol, interval, optimize_params, backtest_params, folder, objective)
+            self.conn.executemany(
+                f'INSERT INTO trials (run_id, params, {", ".join(TRIAL_METRICS)}) VALUES ({", ".join("?" * (len(TRIAL_METRICS) + 2))})',
+                ((run_id, p, *(_number(columns[m][i]) for m in TRIAL_METRICS)) for i, p in enumerate(params)),
+            )
+        return run_id
+
+    # ---------- 查询 ----------
+
+    def query(self, sql, params=()):
+        """执行任意 SQL 查询，返回 DataFrame。"""
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def runs(self, symbol=None, interval=None, kind=None, data_since=None, limit=50):
+        """
+        按条件列出最近的运行记录（新的在前）。
+        """
+        where, args = self._run_filters(symbol, interval, kind, data_since)
+        return self.query(
+            f'SELECT id, kind, created_at, symbol, interval, data_start, data_end, code_version, objective, win_rate, n_trades, '
+            f'return_pct, max_drawdown, folder FROM runs r {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+            (*args, limit),
+        )
+
+    def trials(self, run_id, by='score', min_trades=0, limit=20):
+        """
+        列出某次运行中排名靠前的参数组合。
+        """
+        by = self._rank_column(by)
+        return self.query(
+            f'SELECT params, {", ".join(TRIAL_METRICS)} FROM trials WHERE run_id = ? AND n_trades >= ? AND {by} IS NOT NULL '
+            f'ORDER BY {by} DESC LIMIT ?',
+            (run_id, min_trades, limit),
+        )
+
+    def pareto(self, run_id, min_trades=0):
+        """
+        列出某次批量回测的 Pareto 前沿（按胜率降序）。
+        """
+        return self.query(
+            f'SELECT params, {", ".join(TRIAL_METRICS)} FROM trials WHERE run_id = ? AND pareto = 1 AND n_trades >= ? '
+            f'ORDER BY win_rate DESC',
+            (run_id, min_trades),
+        )
+
+    def best_params(self, symbol=None, interval=None, kind=None, data_since=None, by='score', min_trades=0, top=1):
+        """
+        每个品种（和周期）排名前 top 的参数组合，跨所有符合条件的运行。
+
+        参数:
+        - symbol, interval, kind: 过滤条件，None 表示不限
+        - data_since: 只看回测数据起始时间不早于该时间的运行（如 '2025-04-01'）
+        - by: 排名指标，默认为参数稳定性得分（稳健参数），也可以是 'objective_value'、'win_rate' 等；
+          不同运行的优化目标可能不同，按 objective_value 跨运行比较时应同时按 objective 过滤
+        - min_trades: 最少交易数
+        - top: 每个品种返回的数量
+
+        返回:
+        - DataFrame: 品种、周期、参数、指标以及所在运行的 id、数据区间和代码版本
+        """
+        by = self._rank_column(by)
+        where, args = self._run_filters(symbol, interval, kind, data_since)
+        # 先用 (run_id, 指标) 索引取每次运行的前 top 个，再在这些候选中按品种排名，不需要对全部 trials 排序
+        return self.query(
+            f'SELECT * FROM ('
+            f'  SELECT r.symbol, r.interval, t.params, {", ".join("t." + m for m in TRIAL_METRICS)}, r.objective, '
+            f'         r.id AS run_id, r.data_start, r.data_end, r.code_version, '
+            f'         ROW_NUMBER() OVER (PARTITION BY r.symbol, r.interval ORDER BY t.{by} DESC) AS rank '
+            f'  FROM runs r JOIN trials t ON t.rowid IN ('
+            f'      SELECT rowid FROM trials WHERE run_id = r.id AND n_trades >= ? AND {by} IS NOT NULL ORDER BY {by} DESC LIMIT ?'
+            f'  ) {where}'
+            f') WHERE rank <= ? ORDER BY symbol, interval, rank',
+            (min_trades, top, *args, top),
+        )
+
+    @staticmethod
+    def _rank_column(by):
+        if by not in RANK_COLUMNS:
+            raise ValueError(f"排名指标应为 {RANK_COLUMNS} 之一: {by}")
+        return by
+
+    @staticmethod
+    def _run_filters(symbol, interval, kind, data_since):
+        conditions, args = [], []
+        for column, value in (('symbol', symbol), ('interval', interval), ('kind', kind)):
+            if value is not None:
+                conditions.append(f'r.{column} = ?')
+                args.append(value)
+        if data_since is not None:
+            conditions.append('r.data_start >= ?')
+            args.append(pd.Timestamp(data_since).isoformat())
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', args
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+from scipy import ndimage
+
+# 参数稳定性分析：把批量回测的热力图放进覆盖全部优化参数的 N 维网格，
+# 用盒状卷积计算每个格点相邻格点（各参数下标相差不超过 radius）的胜率均值、最小值和方差，
+# 按"邻域均值 - penalty * 邻域标准差"给出稳健平台的排名，而不是只看孤立的最高点。
+# 卷积按维度分离计算，10 万格点的网格也只需要几十毫秒。
+
+
+def heatmap_to_grid(heatmap_df, params, value='win_rate'):
+    """
+    把热力图表格转换为稠密 N 维数组，未评估的参数组合为 NaN。
+
+    参数:
+    - heatmap_df: 每行一个参数组合的 DataFrame（process_batch_backtest 中的 heatmap_df）
+    - params: 参数列名列表，对应数组的各个维度
+    - value: 数值列名
+
+    返回:
+    - grid: N 维数组
+    - axes: 每个维度的参数取值（升序）
+    """
+    axes, positions = [], []
+    for param in params:
+        values, index = np.unique(heatmap_df[param].to_numpy(), return_inverse=True)
+        axes.append(values)
+        positions.append(index)
+    grid = np.full([len(values) for values in axes], -np.inf)
+    # 同一组合出现多次时取最大值（与原 groupby().max() 一致）
+    np.maximum.at(grid, tuple(positions), heatmap_df[value].to_numpy(dtype=float))
+    grid[np.isneginf(grid)] = np.nan
+    return grid, axes
+
+
+def neighborhood_stats(grid, radius=1):
+    """
+    计算每个格点邻域（含自身）内已评估格点的统计量。
+
+    参数:
+    - grid: N 维数组，NaN 表示未评估
+    - radius: 邻域半径（各维度的下标距离）
+
+    返回:
+    - dict: {'mean', 'min', 'std', 'coverage'}，与 grid 形状相同；coverage 为邻域内已评估格点的比例
+    """
+    size = 2 * radius + 1
+    evaluated = np.isfinite(grid)
+    values = np.where(evaluated, grid, 0.0)
+    scale = size ** grid.ndim
+
+    # uniform_filter 是均值卷积，乘以窗口大小得到窗口内的和；边界外按 0（未评估）处理
+    window = np.round(ndimage.uniform_filter(np.ones(grid.shape), size=size, mode='constant') * scale)  # 边界处邻域较小
+    count = ndimage.uniform_filter(evaluated.astype(float), size=size, mode='constant') * scale
+    total = ndimage.uniform_filter(values, size=size, mode='constant') * scale
+    total_sq = ndimage.uniform_filter(values ** 2, size=size, mode='constant') * scale
+    count = np.round(count)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean ** 2, 0.0)
+    minimum = ndimage.minimum_filter(np.where(evaluated, grid, np.inf), size=size, mode='constant', cval=np.inf)
+
+    empty = count == 0
+    mean[empty] = np.nan
+    variance[empty] = np.nan
+    minimum[np.isinf(minimum)] = np.nan
+    return {'mean': mean, 'min': minimum, 'std': np.sqrt(variance), 'coverage': count / window}
+
+
+def rank_plateaus(grid, axes, params, radius=1, penalty=1.0, min_coverage=0.5, top_n=20):
+    """
+    按邻域稳健得分排名，并做非极大值抑制：选中一个格点后，其邻域内的格点不再作为新的平台。
+
+    参数:
+    - grid, axes: heatmap_to_grid 的结果
+    - params: 参数名，与 axes 对应
+    - radius: 邻域半径
+    - penalty: 得分 = 邻域均值 - penalty * 邻域标准差
+    - min_coverage: 邻域内已评估格点的最低比例，过低的格点不参与排名（随机/贝叶斯优化只评估部分格点）
+    - top_n: 返回的平台数量
+
+    返回:
+    - plateaus: DataFrame，每行一个平台中心：参数取值、自身值、邻域均值/最小值/标准差、覆盖率和得分
+    - cells: DataFrame，所有已评估格点的参数取值和邻域统计
+    """
+    stats = neighborhood_stats(grid, radius)
+    score = stats['mean'] - penalty * stats['std']
+    candidate = np.isfinite(grid) & (stats['coverage'] >= min_coverage)
+    score = np.where(candidate, score, np.nan)
+
+    def frame(flat_index):
+        index = np.unravel_index(flat_index, grid.shape)
+        data = {param: axis[i] for param, axis, i in zip(params, axes, index)}
+        data.update({
+            'value': grid[index],
+            'neighborhood_mean': stats['mean'][index],
+            'neighborhood_min': stats['min'][index],
+            'neighborhood_std': stats['std'][index],
+            'coverage': stats['coverage'][index],
+            'score': score[index],
+        })
+        return pd.DataFrame(data)
+
+    flat_score = score.ravel()
+    order = np.argsort(-np.nan_to_num(flat_score, nan=-np.inf), kind='stable')
+    order = order[np.isfinite(flat_score[order])]
+    available = np.ones(grid.shape, dtype=bool)
+    chosen = []
+    for flat_index in order:
+        index = np.unravel_index(flat_index, grid.shape)
+        if not available[index]:
+            continue
+        chosen.append(flat_index)
+        available[tuple(slice(max(i - radius, 0), i + radius + 1) for i in index)] = False
+        if len(chosen) >= top_n:
+            break
+
+    plateaus = frame(np.array(chosen, dtype=np.intp))
+    plateaus.insert(0, 'rank', np.arange(1, len(plateaus) + 1))
+    cells = frame(np.flatnonzero(np.isfinite(grid).ravel()))
+    return plateaus, cells
+
+
+def analyze_parameter_stability(heatmap_df, batch_folder, params, value='win_rate', radius=1, penalty=1.0, min_coverage=0.5, top_n=20, min_trades=0):
+    """
+    对批量回测结果做参数稳定性分析，保存稳健平台排名（stability_plateaus.csv）和各格点的邻域统计（stability_cells.csv）。
+
+    参数:
+    - heatmap_df: 每行一个参数组合的 DataFrame（有 '# Trades' 列时附在结果中）
+    - batch_folder: 保存结果的文件夹路径
+    - params: 优化参数列名
+    - min_trades: 交易数少于该值的组合视为未评估（胜率不可信）
+    - 其余参数见 rank_plateaus
+
+    返回:
+    - plateaus: 稳健平台排名
+    - cells: 所有已评估格点的邻域统计（没有可用结果时均为 None）
+    """
+    if min_trades and '# Trades' in heatmap_df.columns:
+        heatmap_df = heatmap_df[heatmap_df['# Trades'] >= min_trades]
+    if heatmap_df.empty:
+        print("没有可用于参数稳定性分析的结果。")
+        return None, None
+    grid, axes = heatmap_to_grid(heatmap_df, params, value)
+    plateaus, cells = rank_plateaus(grid, axes, params, radius, penalty, min_coverage, top_n)
+    if '# Trades' in heatmap_df.columns:
+        trades = heatmap_df.groupby(params, as_index=False)['# Trades'].max()
+        plateaus = plateaus.merge(trades, on=params, how='left')
+        cells = cells.merge(trades, on=params, how='left')
+
+    plateaus_filename = f'{batch_folder}/stability_plateaus.csv'
+    plateaus.to_csv(plateaus_filename, index=False)
+    cells.to_csv(f'{batch_folder}/stability_cells.csv', index=False)
+    print(f"参数稳定性分析（网格 {'x'.join(map(str, grid.shape))}，已评估 {len(cells)} 个格点）结果已保存到: {plateaus_filename}")
+    print(plateaus)
+    return plateaus, cells
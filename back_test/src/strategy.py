@@ -2,9 +2,15 @@ import talib
 import numpy as np
 
 from backtesting import Backtest, Strategy
-from backtesting.lib import crossover
 
-def ema_atr_atrFilter(is_batch_test, data, symbol, interval, backtest_params=None, strategy_params=None, optimize_params=None):
+from .signal_core import entry_signals, UPPER_BREAKOUT, LOWER_BREAKOUT
+from .costs import CostAwareObjective, apply_costs
+
+def build_backtest(data, backtest_params=None, strategy_params=None, exit_resolver=None):
+    # 创建 EMA/ATR 策略的 Backtest 对象；bt.run(**参数) 可覆盖 strategy_params 中的任意参数（批量/分布式优化逐个评估参数组合）
+    # exit_resolver: IntrabarExitResolver（见 intrabar.py），传入时同一根K线内止损止盈都被触及的情况按1m K线判断先后，None 时按 backtesting 默认（止损优先）
+    backtest_params = backtest_params or {}
+    strategy_params = strategy_params or {}
     # 解包 strategy_params 到简单变量名（仅用于单次回测），添加 single_ 前缀
     single_ema_period = strategy_params.get('ema_period', 4)
     single_atr_period = strategy_params.get('atr_period', 18)
@@ -26,56 +32,55 @@ def ema_atr_atrFilter(is_batch_test, data, symbol, interval, backtest_params=Non
         rr = single_rr
         time_filter_hours = single_time_filter_hours  # 新增：禁止交易时段
         volume_multiplier = single_volume_multiplier  # 新增：成交量倍数
+        resolver = exit_resolver  # 不参与优化
 
         def init(self):
             price = self.data.Close
             self.ema = self.I(talib.EMA, price, timeperiod=self.ema_period)
             self.atr = self.I(talib.ATR, self.data.High, self.data.Low, self.data.Close, timeperiod=self.atr_period)
+            self.signal = self.I(
+                entry_signals, self.data.Open, self.data.High, self.data.Low, self.data.Close, self.data.Volume,
+                self.data.index.hour, self.ema_period, self.atr_period, self.multiplier, self.atr_threshold_pct,
+                self.volume_multiplier, self.time_filter_hours, self.ema, self.atr,
+                name='signal', plot=False
+            )
 
         def next(self):
-            # 检查ATR波动率过滤器（基于当前价格的百分比）
-            if self.atr[-1] / self.data.Close[-1] < self.atr_threshold_pct:
-                return  # 如果ATR低于阈值百分比，不执行交易
-
-            # 新增：成交量确认机制
-            # 检查当前K线与前一根K线的颜色一致（都是红或都是绿）
-            current_color = self.data.Close[-1] > self.data.Open[-1]  # True: 绿（上涨），False: 红（下跌）
-            prev_color = self.data.Close[-2] > self.data.Open[-2]
-            if current_color != prev_color:
-                return  # 颜色不一致，不交易
-            
-            # 检查当前成交量大于前一根K线的成交量的倍数
-            if self.data.Volume[-1] <= self.data.Volume[-2] * self.volume_multiplier:
-                return  # 成交量不大于前一根的倍数，不交易
-
-            # 获取当前时间并检查时段过滤器
-            current_time = self.data.index[-1]
-            current_hour = current_time.hour
-            for start, end in self.time_filter_hours:
-                if start <= end:
-                    # 非跨天时段，如12到17
-                    if start <= current_hour <= end:
-                        return
-                else:
-                    # 跨天时段，如23到2
-                    if current_hour >= start or current_hour <= end:
-                        return
-
-            upper = self.ema + self.atr * self.multiplier
-            lower = self.ema - self.atr * self.multiplier
-
-            # 计算止损和止盈距离
-            sl_distance = self.atr * self.sl_multiplier
+            # 入场规则见 signal_core.entry_signals（与实盘 ema_atr_filter 共用），在 init 中一次性向量化计算
+            sl_distance = self.atr[-1] * self.sl_multiplier
             tp_distance = sl_distance * self.rr  # 止盈距离 = 止损距离 * rr
+            close = self.data.Close[-1]
+
+            # 下一根K线的下标：订单和止盈止损在下一根K线内成交
+            next_bar = len(self.data)
 
             # 只有在空仓时才能开仓
             if self.position.size == 0:
-                if crossover(self.data.Close, upper):
-                    self.buy(tp=self.data.Close + tp_distance, sl=self.data.Close - sl_distance)
-                elif crossover(lower, self.data.Close):
-                    self.sell(tp=self.data.Close - tp_distance, sl=self.data.Close + sl_distance)
+                if self.signal[-1] == UPPER_BREAKOUT:
+                    sl, tp = self._resolve(next_bar, True, close - sl_distance, close + tp_distance)
+                    self.buy(tp=tp, sl=sl)
+                elif self.signal[-1] == LOWER_BREAKOUT:
+                    sl, tp = self._resolve(next_bar, False, close + sl_distance, close - tp_distance)
+                    self.sell(tp=tp, sl=sl)
+            elif self.resolver is not None:
+                for trade in self.trades:
+                    sl, tp = self._resolve(next_bar, trade.is_long, trade.sl, trade.tp)
+                    if sl is None and trade.sl is not None:
+                        trade.sl = None
+                    if tp is None and trade.tp is not None:
+                        trade.tp = None
+
+        def _resolve(self, i, is_long, sl, tp):
+            # 下一根K线同时触及止损和止盈时，只保留1m K线上先触发的一侧
+            if self.resolver is None:
+                return sl, tp
+            return self.resolver.resolve(i, is_long, sl, tp)
     
-    bt = Backtest(data, EmaAtrStrategy, **backtest_params)
+    return Backtest(data, EmaAtrStrategy, **backtest_params)
+
+def ema_atr_atrFilter(is_batch_test, data, symbol, interval, backtest_params=None, strategy_params=None, optimize_params=None, exit_resolver=None, cost_model=None):
+    # cost_model: CostModel（见 costs.py），传入时每个参数组合的统计和优化目标都按扣除手续费、滑点、资金费后的交易计算
+    bt = build_backtest(data, backtest_params, strategy_params, exit_resolver)
 
     if is_batch_test:
         # 解析 optimize_params 并引用
@@ -91,7 +96,54 @@ def ema_atr_atrFilter(is_batch_test, data, symbol, interval, backtest_params=Non
         return_heatmap = optimize_params.get('return_heatmap', True)
         maximize = optimize_params.get('maximize', None)
         return_optimization = optimize_params.get('return_optimization', False)
-        
+
+        if method == 'batched':
+            # 新增：批量内核评估完整网格（见 batch_kernel.py），同一 ema_period/atr_period 下的其余参数一次评估，max_tries 不适用
+            from .batch_kernel import batched_grid_search  # 延迟导入，batch_kernel 依赖本模块的 build_backtest
+            if exit_resolver is not None:
+                raise ValueError("批量内核不支持 intrabar_interval，请将其设为 None")
+            search_space = {
+                'ema_period': ema_period_range,
+                'atr_period': atr_period_range,
+                'multiplier': multiplier_range,
+                'sl_multiplier': sl_multiplier_range,
+                'atr_threshold_pct': atr_threshold_pct_range,
+                'rr': rr_range,
+                'volume_multiplier': volume_multiplier_range,
+            }
+            stats, heatmap = batched_grid_search(data, search_space, backtest_params, strategy_params, maximize=maximize or 'SQN', cost_model=cost_model)
+            print(heatmap)
+            return stats, heatmap, bt
+
+        if method.startswith('parallel_'):
+            # 新增：异步并行搜索（'parallel_bayes' / 'parallel_random' / 'parallel_grid'，见 parallel_search.py）
+            from .parallel_search import parallel_optimize  # 延迟导入，parallel_search 依赖本模块的 build_backtest
+            search_space = {
+                'ema_period': ema_period_range,
+                'atr_period': atr_period_range,
+                'multiplier': multiplier_range,
+                'sl_multiplier': sl_multiplier_range,
+                'atr_threshold_pct': atr_threshold_pct_range,
+                'rr': rr_range,
+                'volume_multiplier': volume_multiplier_range,
+            }
+            stats, heatmap, history = parallel_optimize(
+                data, search_space, backtest_params, strategy_params, exit_resolver,
+                maximize=maximize or 'SQN',
+                method=method[len('parallel_'):],
+                max_tries=max_tries,
+                workers=optimize_params.get('workers'),
+                time_budget=optimize_params.get('time_budget'),
+                random_state=optimize_params.get('random_state'),
+                cost_model=cost_model,
+            )
+            heatmap._convergence = history  # process_batch_backtest 保存为 convergence.csv
+            print(heatmap)
+            return stats, heatmap, bt
+
+        if cost_model is not None:
+            maximize = CostAwareObjective(maximize or 'SQN', cost_model)  # 目标按扣除成本后的统计计算
+
         # 修改：接收三个返回值
         stats, heatmap, optimization_result = bt.optimize(
             ema_period=ema_period_range,
@@ -107,9 +159,10 @@ def ema_atr_atrFilter(is_batch_test, data, symbol, interval, backtest_params=Non
             maximize=maximize,
             return_optimization=return_optimization
         )
+        stats = apply_costs(stats, cost_model)
         print(heatmap)
         return stats, heatmap, bt  # 修改：返回 bt 以便在 process_batch_backtest 中使用
     else:
-        stats = bt.run()
+        stats = apply_costs(bt.run(), cost_model)
         print(stats)
         return stats, bt
@@ -0,0 +1,265 @@
+import os
+import sys
+from math import copysign
+
+import numpy as np
+import pandas as pd
+
+from .signal_core import IncrementalSignal, UPPER_BREAKOUT, LOWER_BREAKOUT
+from .utils import KLINE_COLUMNS, OHLCV_COLUMNS, sniff_kline_csv, parse_open_time
+
+# 流式回测：按月份文件分块读取K线，逐根更新信号（signal_core.IncrementalSignal，与实盘相同）并撮合，
+# 指标预热、挂单和持仓状态跨块保留，内存占用只与块大小有关。
+# 撮合规则与 backtesting 对本策略的处理一致：信号K线收盘后市价单在下一根K线开盘成交（默认仓位为全部权益），
+# 止损/止盈在成交当根即开始检查、同一根K线都触及时先处理止损，跳空时按开盘价成交；finalize_trades 时最后一根K线按开盘价平仓。
+
+DEFAULT_CHUNKSIZE = 500_000
+
+# backtesting 中 buy()/sell() 的默认 size（全部权益）
+FULL_EQUITY = 1 - sys.float_info.epsilon
+
+# 支持的 backtest_params（与 backtesting.Backtest 参数同名）
+SUPPORTED_BACKTEST_PARAMS = ('cash', 'commission', 'spread', 'finalize_trades')
+
+TRADE_COLUMNS = ['Size', 'EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'SL', 'TP', 'PnL', 'Commission', 'ReturnPct',
+                 'EntryTime', 'ExitTime']
+
+
+def iter_kline_chunks(symbol, interval, years, months, data_dir='back_test/data', chunksize=DEFAULT_CHUNKSIZE):
+    """
+    按时间顺序分块读取月度K线文件（{data_dir}/{symbol}-{interval}/{symbol}-{interval}-{year}-{month}.csv），不合并、不整体载入。
+    表头和 open_time 格式（毫秒/微秒时间戳或日期字符串）与 read_ohlcv_csv 一样由 utils.sniff_kline_csv 判断。
+
+    参数:
+    - symbol, interval: 交易对和周期（也可以是 build_bars.py 生成的自定义K线类型）
+    - years, months: 年份、月份列表
+    - data_dir: 数据目录
+    - chunksize: 每块的K线数量
+
+    返回:
+    - 生成器，每块为 (DatetimeIndex, open, high, low, close, volume)
+    """
+    for year in years:
+        for month in months:
+            path = f'{data_dir}/{symbol}-{interval}/{symbol}-{interval}-{year}-{month:02d}.csv'
+            if not os.path.exists(path):
+                print(f"文件不存在: {path}")
+                continue
+            has_header, _, unit = sniff_kline_csv(path)
+            dtype = {col: np.float64 for col in OHLCV_COLUMNS}
+            if unit:
+                dtype['open_time'] = np.int64
+            reader = pd.read_csv(
+                path,
+                header=0 if has_header else None,
+                names=None if has_header else KLINE_COLUMNS,
+                usecols=['open_time', *OHLCV_COLUMNS],
+                dtype=dtype,
+                chunksize=chunksize,
+            )
+            for chunk in reader:
+                yield (parse_open_time(chunk['open_time'], unit),
+                       *(chunk[col].to_numpy(dtype=float) for col in OHLCV_COLUMNS))
+
+
+class StreamingBacktest:
+    """
+    EMA/ATR 通道策略的流式回测，可分任意多块喂入K线，结果与一次性喂入完全相同。
+
+    参数:
+    - strategy_params: 策略参数（与 bt_main.strategy_params 同名）
+    - backtest_params: 回测参数，支持 cash、commission（按成交额比例）、spread、finalize_trades
+    """
+
+    def __init__(self, strategy_params, backtest_params=None):
+        backtest_params = dict(backtest_params or {})
+        unsupported = set(backtest_params) - set(SUPPORTED_BACKTEST_PARAMS)
+        if unsupported:
+            raise ValueError(f"流式回测不支持参数: {sorted(unsupported)}")
+        commission = backtest_params.get('commission', 0.0)
+        if not isinstance(commission, (int, float)):
+            raise ValueError("流式回测的 commission 只支持按成交额比例的数值")
+        self.cash = float(backtest_params.get('cash', 10_000))
+        self.commission = float(commission)
+        self.spread = float(backtest_params.get('spread', 0.0))
+        self.finalize_trades = bool(backtest_params.get('finalize_trades', False))
+
+        self.sl_multiplier = strategy_params.get('sl_multiplier', 3)
+        self.rr = strategy_params.get('rr', 2)
+        self.signal = IncrementalSignal(
+            strategy_params.get('ema_period', 4), strategy_params.get('atr_period', 18),
+            strategy_params.get('multiplier', 2), strategy_params.get('atr_threshold_pct', 0),
+            strategy_params.get('volume_multiplier', 1.0), strategy_params.get('time_filter_hours', []),
+        )
+
+        self.bar = -1  # 已处理的最后一根K线下标
+        self.start = None  # 开始撮合的K线下标（指标全部有效后的下一根，与 backtesting 的预热跳过一致）
+        self.pending = None  # 待成交的入场单: (方向, 止损, 止盈)
+        self.trade = None  # 持仓: dict
+        self.trades = []
+
+        self.first_time = None
+        self.last = None  # 最后一根K线: (下标, 时间, open, high, low, close)
+        self.initial_equity = None
+        self.equity = self.cash
+        self.equity_bar = None  # self.equity 对应的K线下标；finalize 会改写最后一根的权益，下一根到来（或结束）时才计入峰值和回撤
+        self.equity_peak = -np.inf
+        self.max_drawdown = 0.0
+
+    def _commission_of(self, size, price):
+        return abs(size) * price * self.commission
+
+    def _open(self, i, time, open_):
+        direction, sl, tp = self.pending
+        self.pending = None
+        adjusted_price = open_ * (1 + copysign(self.spread, direction))
+        fraction = copysign(FULL_EQUITY, direction)
+        price_plus_commission = adjusted_price + self._commission_of(fraction, open_) / abs(fraction)
+        margin_available = max(0.0, self.cash)
+        size = copysign(int((margin_available * abs(fraction)) // price_plus_commission), direction)
+        if not size or abs(size) * price_plus_commission > margin_available:
+            return  # 资金不足，订单取消
+        self.cash -= self._commission_of(size, adjusted_price)
+        self.trade = {'Size': size, 'EntryBar': i, 'EntryPrice': adjusted_price, 'SL': sl, 'TP': tp, 'EntryTime': time}
+
+    def _close(self, i, time, price):
+        trade, self.trade = self.trade, None
+        size, entry = trade['Size'], trade['EntryPrice']
+        exit_commission = self._commission_of(size, price)
+        gross = size * (price - entry)
+        self.cash += gross - exit_commission
+        commission = exit_commission + self._commission_of(size, entry)
+        trade.update(
+            ExitBar=i, ExitPrice=price, ExitTime=time, Commission=commission, PnL=gross - commission,
+            ReturnPct=copysign(1, size) * (price / entry - 1) - commission / (abs(size) * entry),
+        )
+        self.trades.append(trade)
+
+    def _check_exits(self, i, time, open_, high, low):
+        trade = self.trade
+        is_long = trade['Size'] > 0
+        sl, tp = trade['SL'], trade['TP']
+        # 止损先于止盈处理
+        if sl is not None and (low <= sl if is_long else high >= sl):
+            self._close(i, time, min(open_, sl) if is_long else max(open_, sl))
+        elif tp is not None and (high >= tp if is_long else low <= tp):
+            self._close(i, time, max(open_, tp) if is_long else min(open_, tp))
+
+    def _broker(self, i, time, open_, high, low, close):
+        if self.trade is not None:
+            self._check_exits(i, time, open_, high, low)
+        if self.pending is not None:
+            self._open(i, time, open_)
+            if self.trade is not None:
+                self._check_exits(i, time, open_, high, low)  # 成交当根即检查止损止盈
+        self._record_equity(i, close)
+
+    def _record_equity(self, i, close):
+        if self.equity_bar is not None and self.equity_bar != i:
+            self._commit_equity()
+        equity = self.cash
+        if self.trade is not None:
+            equity += self.trade['Size'] * (close - self.trade['EntryPrice'])
+        self.equity = equity
+        self.equity_bar = i
+
+    def _commit_equity(self):
+        equity = self.equity
+        if self.initial_equity is None:
+            self.initial_equity = equity
+        self.equity_peak = max(self.equity_peak, equity)
+        self.max_drawdown = max(self.max_drawdown, 1 - equity / self.equity_peak)
+
+    def _strategy(self, close):
+        if self.trade is not None or self.pending is not None:
+            return
+        signal = self.signal.signal
+        if signal not in (UPPER_BREAKOUT, LOWER_BREAKOUT):
+            return
+        sl_distance = self.signal.atr * self.sl_multiplier
+        tp_distance = sl_distance * self.rr
+        if signal == UPPER_BREAKOUT:
+            self.pending = (1, close - sl_distance, close + tp_distance)
+        else:
+            self.pending = (-1, close + sl_distance, close - tp_distance)
+
+    def feed(self, times, open_, high, low, close, volume):
+        """
+        喂入一块按时间顺序的K线。
+        """
+        hours = times.hour
+        for j in range(len(times)):
+            i = self.bar = self.bar + 1
+            o, h, l, c = open_[j], high[j], low[j], close[j]
+            self.signal.update(o, h, l, c, volume[j], hours[j])
+            if self.first_time is None:
+                self.first_time = times[j]
+            self.last = (i, times[j], o, h, l, c)
+            if self.start is None:
+                if not (np.isnan(self.signal.ema) or np.isnan(self.signal.atr)):
+                    self.start = i + 1
+                continue
+            if i < self.start:
+                continue
+            self._broker(i, times[j], o, h, l, c)
+            self._strategy(c)
+
+    def finish(self):
+        """
+        结束回测并返回统计结果（字段与 backtesting 的 stats 同名，_trades 为交易明细）。
+        """
+        if self.finalize_trades and self.last is not None and self.start is not None and self.start <= self.last[0]:
+            i, time, o, h, l, c = self.last
+            if self.trade is not None:
+                self._close(i, time, o)  # 与 backtesting 相同：用最后一根K线重新撮合，市价平仓按开盘价
+                self._record_equity(i, c)
+            elif self.pending is not None:
+                self._broker(i, time, o, h, l, c)
+        if self.equity_bar is not None:
+            self._commit_equity()
+            self.equity_bar = None
+
+        trades = pd.DataFrame(self.trades, columns=TRADE_COLUMNS)
+        if len(trades):
+            trades['Duration'] = trades['ExitTime'] - trades['EntryTime']
+        returns, pl = trades['ReturnPct'], trades['PnL']
+        n_trades = len(trades)
+        initial = self.initial_equity if self.initial_equity is not None else self.cash
+        growth = returns.fillna(0) + 1
+        stats = pd.Series({
+            'Start': self.first_time,
+            'End': self.last[1] if self.last else None,
+            'Equity Final [$]': self.equity,
+            'Equity Peak [$]': max(self.equity_peak, initial),
+            'Return [%]': (self.equity - initial) / initial * 100,
+            'Max. Drawdown [%]': -self.max_drawdown * 100,
+            '# Trades': n_trades,
+            'Win Rate [%]': (pl > 0).mean() * 100 if n_trades else np.nan,
+            'Best Trade [%]': returns.max() * 100,
+            'Worst Trade [%]': returns.min() * 100,
+            'Avg. Trade [%]': (0 if np.any(growth <= 0) else np.exp(np.log(growth).sum() / (n_trades or np.nan)) - 1) * 100,
+            'Profit Factor': returns[returns > 0].sum() / (abs(returns[returns < 0].sum()) or np.nan),
+            'Expectancy [%]': returns.mean() * 100,
+            'SQN': np.sqrt(n_trades) * pl.mean() / (pl.std() or np.nan),
+            '_trades': trades,
+        }, dtype=object)
+        return stats
+
+
+def run_streaming_backtest(symbol, interval, years, months, strategy_params, backtest_params=None,
+                           data_dir='back_test/data', chunksize=DEFAULT_CHUNKSIZE):
+    """
+    分块读取K线进行回测，峰值内存只与 chunksize 有关，结果与一次性回测相同。
+
+    返回:
+    - stats: 统计结果（pd.Series，_trades 为交易明细）
+    """
+    backtest = StreamingBacktest(strategy_params, backtest_params)
+    bars = 0
+    for chunk in iter_kline_chunks(symbol, interval, years, months, data_dir, chunksize):
+        backtest.feed(*chunk)
+        bars += len(chunk[0])
+    print(f"流式回测完成，共 {bars} 根K线。")
+    stats = backtest.finish()
+    print(stats.drop('_trades'))
+    return stats
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import glob
 import smtplib
 import os
@@ -7,11 +8,23 @@ import zipfile
 import plotly.graph_objects as go
 import shutil  # 添加此导入
 
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from tqdm import tqdm
 from dotenv import load_dotenv  # 添加此导入
 
+try:
+    import pyarrow  # noqa: F401  可选依赖：安装后 CSV 用 pyarrow 引擎多线程解析
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'numpy'  # numpy.loadtxt（C实现）只解析需要的列，比 pandas 的 'c' 引擎快
+
+# Binance K线CSV的列（2022年以前的文件没有表头）
+KLINE_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'count',
+                 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+OHLCV_COLUMNS = {'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}
+
 # 在文件顶部加载 .env 文件
 load_dotenv()
 
@@ -45,6 +58,10 @@ def merge_csv_files(symbol='BTCUSDT', interval='15m', directory=None, output_fil
 def merge_csv_files_by_years_months(symbol, interval, years, months, input_dir=None, output_file=None):
     """
     合并指定年月的数据文件为一个新的CSV文件。
+
+    月度文件用 load_ohlcv_files 读取（只读 open_time 和 OHLCV、指定数据类型、多文件并行）；合并文件只保留这几列，
+    open_time 保持毫秒时间戳，之后 load_and_process_data 读取时同样走 read_ohlcv_csv 的数值快速路径。
+    先写临时文件再原子替换，读取方不会看到写了一半的合并文件。
     
     参数:
     - symbol: 交易对符号，如 'BTCUSDT'
@@ -55,7 +72,7 @@ def merge_csv_files_by_years_months(symbol, interval, years, months, input_dir=N
     - output_file: 输出文件路径，如果为None，则使用默认路径 'data/merged_{symbol}-{interval}.csv'
     
     返回:
-    - merged_data: 合并后的DataFrame
+    - merged_data: 合并后的K线（格式同 read_ohlcv_csv），没有任何文件时为空 DataFrame
     """
     
     if input_dir is None:
@@ -64,57 +81,119 @@ def merge_csv_files_by_years_months(symbol, interval, years, months, input_dir=N
     if output_file is None:
         output_file = f'back_test/data/merged_{symbol}-{interval}.csv'
     
-    data_frames = []
-    
-    for year in years:
-        for month in months:
-            file_path = f'{input_dir}/{symbol}-{interval}-{year}-{month:02d}.csv'
-            if os.path.exists(file_path):
-                df = pd.read_csv(file_path)
-                data_frames.append(df)
-            else:
-                print(f"文件不存在: {file_path}")
-    
-    if data_frames:
-        merged_data = pd.concat(data_frames, ignore_index=True)
-        # 转换 open_time 为可读格式并排序
-        merged_data['open_time'] = pd.to_datetime(merged_data['open_time'], unit='ms')
-        merged_data.sort_values('open_time', inplace=True)
-        merged_data.to_csv(output_file, index=False)
-        print(f"合并完成，输出文件: {output_file}")
-        return merged_data
-    else:
+    file_paths = [f'{input_dir}/{symbol}-{interval}-{year}-{month:02d}.csv' for year in years for month in months]
+    merged_data = load_ohlcv_files(file_paths)
+    if merged_data.empty:
         print("没有找到任何文件进行合并")
         return pd.DataFrame()
 
+    output = merged_data.rename(columns={v: k for k, v in OHLCV_COLUMNS.items()})
+    output.insert(0, 'open_time', merged_data.index.as_unit('ms').asi8)
+    tmp_file = f'{output_file}.{os.getpid()}.tmp'
+    output.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
+    print(f"合并完成，输出文件: {output_file}")
+    return merged_data
+
 # 加载和处理 CSV 数据文件，转换为 backtesting 库所需的格式
 def load_and_process_data(file_path='back_test/data/merged_BTCUSDT-15m.csv'):
 
     try:
-        data = pd.read_csv(file_path)
-
-        sample_value = str(data['open_time'].iloc[0]) if not data.empty else ''
-        if sample_value.isdigit() and len(sample_value) == 13:
-            data['open_time'] = pd.to_datetime(data['open_time'], unit='ms')
-        else:
-            data['open_time'] = pd.to_datetime(data['open_time'])
-                
-        data.set_index('open_time', inplace=True)
-        data = data[['open', 'high', 'low', 'close', 'volume']].rename(
-            columns={
-                'open': 'Open',
-                'high': 'High',
-                'low': 'Low',
-                'close': 'Close',
-                'volume': 'Volume'
-            }
-        )
+        data = read_ohlcv_csv(file_path)
         print(f"数据加载和处理完成，共 {len(data)} 行。")
         return data
     except Exception as e:
         print(f"数据加载和处理出错：{e}")
         return None
 
+# 读取前两行，判断是否有表头、列顺序以及 open_time 的格式（read_ohlcv_csv 和流式回测的分块读取共用）
+def sniff_kline_csv(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        first = f.readline()
+        second = f.readline()
+    has_header = not first[:1].isdigit()
+    columns = [name.strip() for name in first.split(',')] if has_header else KLINE_COLUMNS
+    sample = (second if has_header else first).split(',', 1)[0].strip()
+    # 13位为毫秒时间戳，16位为微秒时间戳（Binance 现货2025年起），其他为日期字符串（合并文件）
+    unit = {13: 'ms', 16: 'us'}.get(len(sample)) if sample.isdigit() else None
+    return has_header, columns, unit
+
+# open_time 列转换为索引：unit 为 sniff_kline_csv 判断的时间戳单位，None 表示日期字符串
+def parse_open_time(times, unit):
+    if unit:
+        index = pd.to_datetime(np.asarray(times, dtype=np.int64), unit=unit)
+    else:
+        index = pd.to_datetime(times, format='ISO8601')
+    return pd.DatetimeIndex(index, name='open_time')
+
+# 快速读取K线CSV为 backtesting 格式
+def read_ohlcv_csv(file_path, float32=False, engine=None):
+    """
+    只读取 open_time 和 OHLCV 五列并指定数据类型，时间戳直接转换为索引，不解析其余列、不做类型推断。
+
+    参数:
+    - file_path: Binance K线文件、合并文件或 build_bars.py 生成的K线文件（有无表头均可）
+    - float32: 价格和成交量用 float32（内存减半；TA-Lib 和 backtesting 需要 float64，只适合做数据分析）
+    - engine: 'pyarrow'（多线程）、'numpy' 或 pandas 的 'c'，默认安装了 pyarrow 时用 'pyarrow'，否则用 'numpy'；
+      open_time 为日期字符串时 'numpy' 改用 'c'
+
+    返回:
+    - data: DatetimeIndex（open_time）+ Open/High/Low/Close/Volume
+    """
+    has_header, columns, unit = sniff_kline_csv(file_path)
+    float_dtype = np.float32 if float32 else np.float64
+    engine = engine or CSV_ENGINE
+    positions = [columns.index(col) for col in ['open_time', *OHLCV_COLUMNS]]
+    if engine == 'numpy' and unit:
+        # 时间戳不超过 2^53，按 float64 解析后转回整数没有误差
+        values = np.loadtxt(file_path, delimiter=',', skiprows=int(has_header), usecols=positions, dtype=np.float64, ndmin=2)
+        values = values.reshape(-1, len(positions))
+        index = parse_open_time(values[:, 0].astype(np.int64), unit)
+        return pd.DataFrame(values[:, 1:].astype(float_dtype), index=index, columns=list(OHLCV_COLUMNS.values()))
+
+    dtype = {col: float_dtype for col in OHLCV_COLUMNS}
+    if unit:
+        dtype['open_time'] = np.int64
+    data = pd.read_csv(
+        file_path,
+        header=0 if has_header else None,
+        # 无表头文件按列位置选列、只给选中的列命名（pyarrow 引擎按文件中的列名筛选，不识别 names 给出的完整列名）
+        names=None if has_header else ['open_time', *OHLCV_COLUMNS],
+        usecols=['open_time', *OHLCV_COLUMNS] if has_header else positions,
+        dtype=dtype,
+        engine='c' if engine == 'numpy' else engine,
+    )
+    data.index = parse_open_time(data.pop('open_time'), unit)
+    return data[list(OHLCV_COLUMNS)].rename(columns=OHLCV_COLUMNS)
+
+# 并行读取多个K线文件并按时间拼接
+def load_ohlcv_files(file_paths, float32=False, engine=None, max_workers=None):
+    """
+    参数:
+    - file_paths: K线文件路径列表（如按月份的文件），不存在的文件跳过
+    - float32, engine: 见 read_ohlcv_csv
+    - max_workers: 读取线程数，默认为 CPU 核数（单核时不开线程）
+
+    返回:
+    - data: 按时间排序的K线（格式同 read_ohlcv_csv）
+    """
+    existing = [path for path in file_paths if os.path.exists(path)]
+    for path in file_paths:
+        if path not in existing:
+            print(f"文件不存在: {path}")
+    if not existing:
+        return pd.DataFrame(columns=list(OHLCV_COLUMNS.values()), index=pd.DatetimeIndex([], name='open_time'))
+    max_workers = min(max_workers or os.cpu_count() or 1, len(existing))
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            frames = list(pool.map(lambda path: read_ohlcv_csv(path, float32, engine), existing))
+    else:
+        frames = [read_ohlcv_csv(path, float32, engine) for path in existing]
+    data = pd.concat(frames)
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index(kind='stable')
+    return data
+
 # 从 Binance 下载指定交易对和时间间隔的历史数据压缩包
 def download_binance_data(symbol='ETCUSDT', interval='15m', years=[2020], months=range(1, 13), save_dir='back_test/data'):
 
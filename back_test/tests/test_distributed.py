@@ -0,0 +1,91 @@
+import time
+from multiprocessing.connection import Client
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.distributed import JobBroker, run_worker
+
+SYMBOL = 'SYNUSDT'
+INTERVAL = '15m'
+AUTHKEY = b'test-authkey'
+LEASE_TIMEOUT = 1.0
+COMBOS = [{'ema_period': ema, 'multiplier': 1} for ema in (10, 15, 20, 25)]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # 工作端从本机数据目录读取月度K线（文件已存在时 acquire_data 不下载）
+    index = pd.date_range('2025-01-01', periods=600, freq='15min')
+    rng = np.random.default_rng(3)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, len(index))))
+    frame = pd.DataFrame({
+        'open_time': index.as_unit('ms').asi8, 'open': close, 'high': close * 1.002, 'low': close * 0.998,
+        'close': close, 'volume': rng.uniform(100, 200, len(index)),
+    })
+    path = tmp_path / f'{SYMBOL}-{INTERVAL}' / f'{SYMBOL}-{INTERVAL}-2025-01.csv'
+    path.parent.mkdir(parents=True)
+    frame.to_csv(path, index=False)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def broker():
+    broker = JobBroker(('127.0.0.1', 0), AUTHKEY, lease_timeout=LEASE_TIMEOUT)
+    spec = {'symbol': SYMBOL, 'interval': INTERVAL, 'years': [2025], 'months': [1],
+            'backtest_params': {'cash': 1_000_000}, 'strategy_params': {'atr_period': 9}, 'cost_params': None}
+    broker.spec_id = broker.submit(spec, COMBOS, chunk_size=2)
+    broker.start()
+    yield broker
+    broker.close()
+
+
+def assert_each_combo_done_once(broker):
+    results = broker.collect(broker.spec_id)
+    assert broker.progress() == (2, 2)
+    assert sorted(results['ema_period']) == [10, 15, 20, 25]
+    assert 'late' not in results
+
+
+def test_expired_lease_is_requeued_and_completed_once(broker, data_dir):
+    # 工作端领取任务后既不续租也不断开（卡死）：租约超时后任务重新排队，由其他工作端完成
+    stalled = Client(broker.address, authkey=AUTHKEY)
+    stalled.send(('lease', 'stalled'))
+    _, job_id, _, combos, _ = stalled.recv()
+    assert job_id == 0
+    time.sleep(LEASE_TIMEOUT + 0.2)
+
+    assert run_worker(broker.address, AUTHKEY, data_dir, name='healthy', connect_timeout=5) == len(COMBOS)
+    assert broker.requeued == 1
+
+    # 卡死的工作端恢复后提交的结果是重复提交，不覆盖已有结果
+    stalled.send(('renew', 'stalled', job_id))
+    assert stalled.recv() == ('ok', False)
+    stalled.send(('complete', 'stalled', job_id, [{**combo, 'late': True} for combo in combos]))
+    assert stalled.recv() == ('ok', False)
+    stalled.close()
+    assert_each_combo_done_once(broker)
+
+
+def test_disconnected_worker_job_is_requeued(broker, data_dir):
+    # 工作端领取任务后退出：断开连接时任务立即重新排队，不必等租约超时
+    gone = Client(broker.address, authkey=AUTHKEY)
+    gone.send(('lease', 'gone'))
+    assert gone.recv()[1] == 0
+    gone.close()
+    deadline = time.time() + 5
+    while broker.requeued == 0:
+        assert time.time() < deadline, '任务没有重新排队'
+        time.sleep(0.01)
+
+    assert run_worker(broker.address, AUTHKEY, data_dir, name='healthy', connect_timeout=5) == len(COMBOS)
+    assert broker.requeued == 1
+    assert_each_combo_done_once(broker)
+
+
+def test_broker_and_worker_require_authkey(data_dir):
+    with pytest.raises(ValueError):
+        JobBroker(('127.0.0.1', 0), b'')
+    with pytest.raises(ValueError):
+        run_worker(('127.0.0.1', 0), b'', data_dir)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.acquisition import acquire_data
+from src.streaming import iter_kline_chunks
+from src.utils import KLINE_COLUMNS, load_ohlcv_files, sniff_kline_csv
+
+SYMBOL = 'SYNUSDT'
+INTERVAL = '15m'
+
+
+def write_month(directory, month, fmt, seed=0):
+    # fmt: 'ms' / 'us' 为毫秒/微秒时间戳（有表头），'ms_noheader' 为2022年以前无表头的格式，'date' 为日期字符串
+    index = pd.date_range(f'2025-{month:02d}-01', periods=200, freq='15min')
+    rng = np.random.default_rng(seed + month)
+    close = 100 + rng.normal(0, 1, len(index)).cumsum()
+    frame = pd.DataFrame({col: 0.0 for col in KLINE_COLUMNS}, index=range(len(index)))
+    frame['open'], frame['high'], frame['low'], frame['close'] = close, close + 1, close - 1, close
+    frame['volume'] = rng.uniform(1, 10, len(index))
+    if fmt == 'date':
+        frame['open_time'] = index.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        frame['open_time'] = index.as_unit('us' if fmt == 'us' else 'ms').asi8
+    path = directory / f'{SYMBOL}-{INTERVAL}' / f'{SYMBOL}-{INTERVAL}-2025-{month:02d}.csv'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    frame.to_csv(path, index=False, header=fmt != 'ms_noheader')
+    return str(path), index
+
+
+@pytest.mark.parametrize('fmt', ['ms', 'us', 'ms_noheader', 'date'])
+def test_chunks_match_loader_for_every_file_format(tmp_path, fmt):
+    paths, indexes = zip(*(write_month(tmp_path, month, fmt) for month in (1, 2)))
+    chunks = list(iter_kline_chunks(SYMBOL, INTERVAL, [2025], [1, 2], data_dir=str(tmp_path), chunksize=150))
+    loaded = load_ohlcv_files(list(paths), max_workers=1)
+
+    times = pd.DatetimeIndex(np.concatenate([chunk[0].to_numpy() for chunk in chunks]))
+    assert len(chunks) == 4
+    assert times.equals(pd.DatetimeIndex(np.concatenate([index.to_numpy() for index in indexes])))
+    assert times.equals(loaded.index.as_unit(times.unit))
+    # 分块读取用 pandas 解析，read_ohlcv_csv 默认用 numpy.loadtxt，两者对同一文本的解析结果可能差 1 ulp
+    for i, column in enumerate(['Open', 'High', 'Low', 'Close', 'Volume'], start=1):
+        np.testing.assert_allclose(np.concatenate([chunk[i] for chunk in chunks]), loaded[column].to_numpy(), rtol=1e-12)
+
+
+@pytest.mark.parametrize('fmt', ['ms', 'us', 'ms_noheader', 'date'])
+def test_pyarrow_engine_matches_numpy_engine(tmp_path, fmt):
+    # 安装了 pyarrow 时 read_ohlcv_csv 默认用 pyarrow 引擎
+    pytest.importorskip('pyarrow')
+    paths = [write_month(tmp_path, month, fmt)[0] for month in (1, 2)]
+    arrow = load_ohlcv_files(paths, engine='pyarrow', max_workers=1)
+    numpy = load_ohlcv_files(paths, engine='numpy', max_workers=1)
+
+    assert arrow.index.equals(numpy.index.as_unit(arrow.index.unit))
+    pd.testing.assert_frame_equal(arrow, numpy, check_index_type=False, check_exact=False, rtol=1e-12)
+
+
+@pytest.mark.parametrize('fmt', ['ms', 'us'])
+def test_merged_file_keeps_epoch_open_time(tmp_path, fmt):
+    paths = [write_month(tmp_path, month, fmt)[0] for month in (1, 2, 3)]
+    data = acquire_data(SYMBOL, INTERVAL, [2025], [1, 2, 3], save_dir=str(tmp_path))
+    merged_file = tmp_path / f'merged_{SYMBOL}-{INTERVAL}_2025_1_2_3.csv'
+
+    has_header, columns, unit = sniff_kline_csv(str(merged_file))
+    assert (has_header, columns, unit) == (True, ['open_time', 'open', 'high', 'low', 'close', 'volume'], 'ms')
+    pd.testing.assert_frame_equal(data, load_ohlcv_files(paths, max_workers=1), check_index_type=False)
+    assert not list(tmp_path.glob('*.tmp'))
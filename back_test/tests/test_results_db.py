@@ -0,0 +1,39 @@
+import pandas as pd
+
+from src.results_db import ResultsDB
+
+PARAMS = ['ema_period', 'multiplier']
+STATS = pd.Series({'Start': pd.Timestamp('2025-01-01'), 'End': pd.Timestamp('2025-03-31'), 'Win Rate [%]': 55.0, '# Trades': 40})
+
+
+def test_objective_value_and_win_rate_are_stored_separately(tmp_path):
+    # process_batch_backtest 的热力图取值列 win_rate 是 maximize 的结果（这里为 SQN），真实胜率在 Win Rate [%]
+    trials = pd.DataFrame({
+        'ema_period': [10, 20], 'multiplier': [1, 2],
+        'win_rate': [1.8, 2.4], 'Win Rate [%]': [48.0, 41.0], '# Trades': [50, 60],
+    })
+    with ResultsDB(str(tmp_path / 'results.db')) as db:
+        run_id = db.record_batch(STATS, trials, PARAMS, 'LINKUSDT', '15m', objective='SQN')
+        by_objective = db.trials(run_id, by='objective_value')
+        by_win_rate = db.trials(run_id, by='win_rate')
+        runs = db.runs()
+
+    assert by_objective['objective_value'].tolist() == [2.4, 1.8]
+    assert by_objective['win_rate'].tolist() == [41.0, 48.0]
+    assert by_win_rate['params'].iloc[0] == '{"ema_period": 10, "multiplier": 1}'
+    assert runs['objective'].tolist() == ['SQN']
+
+
+def test_stability_cells_use_value_as_objective(tmp_path):
+    cells = pd.DataFrame({
+        'ema_period': [10, 20], 'multiplier': [1, 2], 'value': [0.5, 0.7], 'score': [0.4, 0.6],
+        'Win Rate [%]': [60.0, 52.0], '# Trades': [30, 35],
+    })
+    with ResultsDB(str(tmp_path / 'results.db')) as db:
+        run_id = db.record_batch(STATS, cells, PARAMS, 'LINKUSDT', '15m', objective=lambda stats: 0)
+        best = db.best_params(by='objective_value')
+
+    assert best['objective_value'].tolist() == [0.7]
+    assert best['win_rate'].tolist() == [52.0]
+    assert best['objective'].tolist() == ['<lambda>']
+
@@ -0,0 +1,142 @@
+import filecmp
+import importlib
+import logging
+import os
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.batch_kernel import signal_matrix
+from src.signal_core import IncrementalSignal, compute_indicators, entry_signals
+from src.strategy import build_backtest
+
+# 实盘与回测的交易一致性：同一份合成K线分别用回测（build_backtest，信号K线收盘价成交）和实盘代码
+# （live_strategy + 附带止盈止损，由 live/src/replay.py 的模拟交易所撮合）运行，两边的交易必须逐笔一致。
+# 实盘代码同样以顶层包 src 组织，这里以 live_src 为包名加载，避免与回测的 src 冲突。
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+LIVE_SRC = os.path.join(ROOT, 'live', 'src')
+SYMBOL = 'SYN/USDT:USDT'
+PERIOD = 15 * 60
+
+
+def import_live(name):
+    if 'live_src' not in sys.modules:
+        package = types.ModuleType('live_src')
+        package.__path__ = [os.path.abspath(LIVE_SRC)]
+        sys.modules['live_src'] = package
+    return importlib.import_module(f'live_src.{name}')
+
+
+def synthetic_klines(n=3000, seed=7):
+    # 随机游走，开盘价等于上一根收盘价（无跳空），止损止盈按触发价成交
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate([[100.0], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.003, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.003, n))
+    volume = rng.uniform(100, 200, n)
+    index = pd.date_range('2025-01-01', periods=n, freq='15min')
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+
+def backtest_trades(data, params):
+    bt = build_backtest(data, {'cash': 1_000_000_000, 'trade_on_close': True}, params)
+    trades = bt.run()['_trades']
+    return pd.DataFrame({
+        'direction': np.sign(trades['Size']).astype(int).to_numpy(),
+        'entry_time': pd.DatetimeIndex(trades['EntryTime']),
+        'exit_time': pd.DatetimeIndex(trades['ExitTime']),
+        'entry_price': trades['EntryPrice'].to_numpy(),
+        'exit_price': trades['ExitPrice'].to_numpy(),
+    })
+
+
+def live_trades(data, params):
+    replay = import_live('replay')
+    strategy = import_live('strategy')
+    notifier = import_live('notifier')
+    signals = import_live('signals')
+
+    klines = data.rename(columns=str.lower)
+    clock = replay.SimClock(klines.index[0].timestamp())
+    exchange = replay.SimulatedExchange({SYMBOL: klines}, clock, base_timeframe='15m')
+    end_ts = klines.index[-1].timestamp() + PERIOD
+
+    def step():
+        strategy.live_strategy(
+            exchange, SYMBOL, params['ema_period'], params['atr_period'], params['multiplier'], params['atr_threshold_pct'],
+            params['sl_multiplier'], params['rr'], 2.5, 10, 'limit', 100, params['time_filter_hours'],
+            ENTRY_MODE='attached', VOLUME_MULTIPLIER=params['volume_multiplier'], TIMEFRAME='15m',
+            clock=clock.time, sleep=clock.sleep,
+        )
+
+    notifier.start_notifier(dry_run=True)
+    signals._signal_states.clear()
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.ERROR)
+    try:
+        trades = replay.run_replay(exchange, clock, step, end_ts, timeframe='15m')
+    finally:
+        logging.getLogger().setLevel(level)
+        notifier.stop_notifier()
+        signals._signal_states.clear()
+
+    # 实盘在信号K线收盘后成交，平仓时间记为触发K线的收盘时刻；换算为回测使用的K线开盘时间
+    return pd.DataFrame({
+        'direction': np.where(trades['side'] == 'long', 1, -1),
+        'entry_time': pd.DatetimeIndex(trades['entry_time']).tz_localize(None).floor('15min') - pd.Timedelta(PERIOD, 's'),
+        'exit_time': pd.DatetimeIndex(trades['exit_time']).tz_localize(None) - pd.Timedelta(PERIOD, 's'),
+        'entry_price': trades['entry_price'].to_numpy(dtype=float),
+        'exit_price': trades['exit_price'].to_numpy(dtype=float),
+    })
+
+
+PARAM_SETS = [
+    {'ema_period': 12, 'atr_period': 9, 'multiplier': 1, 'sl_multiplier': 2, 'rr': 2, 'atr_threshold_pct': 0,
+     'volume_multiplier': 1.0, 'time_filter_hours': []},
+    {'ema_period': 25, 'atr_period': 24, 'multiplier': 1.5, 'sl_multiplier': 1, 'rr': 1.5, 'atr_threshold_pct': 0.001,
+     'volume_multiplier': 1.1, 'time_filter_hours': [[23, 1], [8, 10]]},
+]
+
+
+def test_signal_core_copies_are_identical():
+    copies = [os.path.join(ROOT, project, 'src', 'signal_core.py') for project in ('back_test', 'live', 'live_vps')]
+    for path in copies[1:]:
+        assert filecmp.cmp(copies[0], path, shallow=False), path
+
+
+@pytest.mark.parametrize('params', PARAM_SETS)
+def test_vectorized_incremental_and_batched_signals_match(params):
+    data = synthetic_klines()
+    o, h, l, c, v = (data[col].to_numpy() for col in ['Open', 'High', 'Low', 'Close', 'Volume'])
+    hours = data.index.hour.to_numpy()
+    ema, atr = compute_indicators(h, l, c, params['ema_period'], params['atr_period'])
+    vectorized = entry_signals(o, h, l, c, v, hours, params['ema_period'], params['atr_period'], params['multiplier'],
+                               params['atr_threshold_pct'], params['volume_multiplier'], params['time_filter_hours'], ema, atr)
+
+    state = IncrementalSignal(params['ema_period'], params['atr_period'], params['multiplier'],
+                              params['atr_threshold_pct'], params['volume_multiplier'], params['time_filter_hours'])
+    incremental = np.array([state.update(o[i], h[i], l[i], c[i], v[i], hours[i]) for i in range(len(data))])
+    batched = signal_matrix(o, c, v, hours, ema, atr, [params['multiplier']], [params['atr_threshold_pct']],
+                            [params['volume_multiplier']], params['time_filter_hours'])[:, 0]
+
+    assert np.count_nonzero(vectorized) > 0
+    np.testing.assert_array_equal(incremental, vectorized)
+    np.testing.assert_array_equal(batched, vectorized)
+
+
+@pytest.mark.parametrize('params', PARAM_SETS)
+def test_live_and_backtest_trades_match(params):
+    data = synthetic_klines()
+    expected = backtest_trades(data, params)
+    actual = live_trades(data, params)
+
+    assert len(expected) >= 10
+    pd.testing.assert_frame_equal(actual[['direction', 'entry_time', 'exit_time']], expected[['direction', 'entry_time', 'exit_time']], check_dtype=False)
+    np.testing.assert_allclose(actual['entry_price'], expected['entry_price'], rtol=1e-9)
+    # 禁止时段内实盘不喂入K线，之后以 WARMUP_LIMIT 根K线重新预热，ATR 与全量计算有极小的起点差异，止损止盈价随之略有偏差
+    np.testing.assert_allclose(actual['exit_price'], expected['exit_price'], rtol=1e-7)
@@ -0,0 +1,37 @@
+import os
+import sys
+
+# back_test、live、live_vps 各自以顶层包 src 组织代码（脚本在项目目录或仓库根目录下运行），
+# 测试按所在项目切换 sys.path 和 sys.modules 中的 src 包，使各项目的测试可以在同一次 pytest 中运行。
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECTS = ('back_test', 'live', 'live_vps')
+
+_active = None
+_stashed = {}
+
+
+def _project_of(path):
+    parts = os.path.relpath(str(path), ROOT).split(os.sep)
+    return parts[0] if parts[0] in PROJECTS else None
+
+
+def _activate(project):
+    global _active
+    if project is None or project == _active:
+        return
+    if _active is not None:
+        _stashed[_active] = {name: sys.modules.pop(name) for name in list(sys.modules) if name == 'src' or name.startswith('src.')}
+        sys.path.remove(os.path.join(ROOT, _active))
+    sys.path.insert(0, os.path.join(ROOT, project))
+    sys.modules.update(_stashed.pop(project, {}))
+    _active = project
+
+
+def pytest_collectstart(collector):
+    if collector.path is not None and collector.path.suffix == '.py':
+        _activate(_project_of(collector.path))
+
+
+def pytest_runtest_setup(item):
+    _activate(_project_of(item.path))
@@ -1,16 +1,31 @@
+import time
+
+STARTUP_TIME = time.monotonic()  # 放在其他导入之前，统计重启到就绪的耗时（包含ccxt等模块导入）
+
 import os
 import ccxt
 import pandas as pd
-import time
 from datetime import datetime, timezone
 import logging
 from logging.handlers import RotatingFileHandler
 
 from dotenv import load_dotenv
-from src.utils import setup_logging, wait_time
+from src.utils import setup_logging
+from src.logs import set_log_context
+from src.scheduler import BarScheduler
+from src.warmup import load_markets_cached, ensure_leverage, prewarm_connection
+from src.notifier import start_notifier, stop_notifier
+from src.latency import start_latency_recorder
+from src.ratelimit import RequestScheduler
+from src.journal import open_journal, reconcile_open_trades
+from src.bars import LocalBarExchange
+from src.config import ConfigWatcher, symbol_settings
+from src.signals import drop_signal_states
 from src.strategy import live_strategy, test_strategy  # 假设test_strategy也在src.strategy中
 
-setup_logging()
+SHARD = os.getenv('LIVE_SHARD')  # 由 supervisor_main 启动的分片进程名，单进程运行时为 None
+QUEUE_LOGGING = True  # 日志经队列由后台线程写入，并另写一份带品种/周期/步骤/延迟字段的 JSON Lines 日志
+setup_logging(SHARD, use_queue=QUEUE_LOGGING)
 load_dotenv()
 
 # 添加模拟交易参数
@@ -21,29 +36,22 @@ EMAIL_FROM = os.getenv('EMAIL_FROM')
 SMTP_USER = os.getenv('SMTP_USER')
 SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
 
-# 将单个SYMBOL改为列表
-SYMBOLS = ['BTC/USDT:USDT']  # 添加更多品种
+# 品种、杠杆、风险、禁止交易时段等策略参数在 config.json 中配置，运行中修改后在下一个周期边界生效（见 src/config.py）：
+# SYMBOLS / CONTRACT_SIZES / LEVERAGES（一一对应）、TP_MODE、ENTRY_MODE、REANCHOR_BRACKETS、EMA_PERIOD、ATR_PERIOD、
+# MULTIPLIER、SL_ATR_MULTIPLIER、ATR_THRESHOLD_PCT、VOLUME_MULTIPLIER、RR、FORBIDDEN_HOURS（UTC）、RISK_USDT
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
 
-# --- 参数配置 ---
+# --- 参数配置（修改后需重启）---
 TIMEFRAME = '15m'
-CONTRACT_SIZES = [100]  # 与SYMBOLS一一对应
-LEVERAGES = [15]  # 与SYMBOLS一一对应，每个品种的杠杆
-
-# 在全局变量部分添加止盈模式配置
-TP_MODE = 'limit'  # 可选值: 'limit' (限价止盈) 或 'trailing' (移动止盈止损)
 
-EMA_PERIOD = 25
-ATR_PERIOD = 24
-MULTIPLIER = 3
-SL_ATR_MULTIPLIER = 2
-ATR_THRESHOLD_PCT = 0
-RR = 2
+# K线来源：True 时每个品种只请求1m K线，TIMEFRAME 等更大周期在本地聚合（多个周期并行时不增加请求）
+LOCAL_BARS = True
 
-# 在全局变量部分添加禁止交易时段
-FORBIDDEN_HOURS = [[23, 1], [8, 10], [3, 4]]  # UTC时间，禁止23点到1点、8点到10点、3点到4点交易
+# K线收盘后的唤醒余量（秒），按交易所时钟对齐
+BAR_CLOSE_MARGIN = 0.3
 
-# 风险管理
-RISK_USDT = 2.5
+# 市场元数据磁盘缓存，避免每次重启都完整下载
+MARKETS_CACHE_TTL = 24 * 3600  # 秒
 
 if IS_SIMULATION:
     API_KEY = os.getenv('OKX_SIM_API_KEY')
@@ -56,12 +64,28 @@ else:
     API_PASSPHRASE = os.getenv('OKX_API_PASSPHRASE')
     SANDBOX = False
 
-# 初始化交易所
-exchange = ccxt.okx({
+MARKETS_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', f"okx_markets{'_sandbox' if SANDBOX else ''}.json")
+
+# 延迟指标：每周期覆盖写入各步骤的延迟直方图，并追加每个品种每周期的步骤明细
+METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics')
+METRICS_SUFFIX = f"_{SHARD}" if SHARD else ''
+LATENCY_METRICS_FILE = os.path.join(METRICS_DIR, f'latency{METRICS_SUFFIX}.json')
+LATENCY_CYCLES_FILE = os.path.join(METRICS_DIR, f'latency_cycles{METRICS_SUFFIX}.jsonl')
+
+# 本地交易流水（SQLite WAL），重启时只核对其中未结束的交易
+JOURNAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal', f"trades{'_sandbox' if SANDBOX else ''}.db")
+
+# 请求限速：按OKX各端点限额分别限速，下单类请求优先于行情和账户查询
+RATE_LIMIT_SCALE = 1.0  # 本进程可用的限额比例（多个进程共用同一账户时按进程数分配）
+RATE_LIMIT_METRICS_FILE = os.path.join(METRICS_DIR, f'rate_limit{METRICS_SUFFIX}.json')
+
+# 初始化交易所（关闭ccxt全局串行限速，改由 RequestScheduler 按端点和优先级限速）
+rate_limiter = RequestScheduler(scale=RATE_LIMIT_SCALE)
+exchange = rate_limiter.wrap(ccxt.okx({
     'apiKey': API_KEY,
     'secret': API_SECRET,
     'password': API_PASSPHRASE,
-    'enableRateLimit': True,
+    'enableRateLimit': False,
     'sandbox': SANDBOX,
     'options': {
         'defaultType': 'swap',
@@ -71,37 +95,143 @@ exchange = ccxt.okx({
         'http': 'http://127.0.0.1:7897',
         'https': 'http://127.0.0.1:7897',
     }
-})
+}))
 
 def main():
+    run()
+
+
+def active_symbols(config, pinned=None):
+    """
+    返回本进程负责的品种设置。
+
+    参数:
+    config (dict): 当前配置
+    pinned (list): 分片运行时分配给本进程的品种，None 表示配置中的全部品种
+
+    返回:
+    dict: {品种: (合约面值, 杠杆)}
+    """
+    settings = symbol_settings(config)
+    if pinned is None:
+        return settings
+    return {symbol: value for symbol, value in settings.items() if symbol in pinned}
+
+
+def reload_config(watcher, pinned=None):
+    """
+    在周期边界检查配置文件，有变化时整体切换到新配置，只重新初始化受影响的品种：
+    新增品种设置杠杆并核对流水，杠杆改变的品种重新设置杠杆，移除的品种丢弃信号状态，
+    指标参数（EMA_PERIOD、ATR_PERIOD、MULTIPLIER）改变时各品种在下个周期重新预热。
+
+    返回:
+    dict: 当前生效的配置
+    """
+    update = watcher.poll()
+    if update is None:
+        return watcher.config
+    config, changes = update
+    logging.info(
+        f"\033[96m配置已更新：新增品种 {changes['added']}，移除品种 {changes['removed']}，杠杆变化 {changes['leverage']}，"
+        f"合约面值变化 {changes['contract_size']}，参数变化 {changes['params']}\033[0m"
+    )
+
+    settings = active_symbols(config, pinned)
+    if pinned is not None:
+        unassigned = [symbol for symbol in changes['added'] if symbol not in pinned]
+        if unassigned:
+            logging.warning(f"{unassigned} 未分配到本分片（{SHARD}），分片运行时新增品种需重启 supervisor_main")
+
+    for symbol in changes['added'] + changes['leverage']:
+        if symbol in settings:
+            try:
+                ensure_leverage(exchange, symbol, settings[symbol][1], is_simulation=SANDBOX)
+            except Exception as e:
+                logging.error(f"{symbol} 设置杠杆失败: {e}")
+    added = [symbol for symbol in changes['added'] if symbol in settings]
+    if added:
+        try:
+            reconcile_open_trades(exchange, symbols=added)
+        except Exception as e:
+            logging.error(f"新增品种核对交易流水失败: {e}")
+
+    if changes['removed']:
+        # 已有持仓的止盈止损订单留在交易所，不受影响
+        drop_signal_states(changes['removed'])
+        logging.info(f"已停止交易 {changes['removed']}（已有持仓保留交易所上的止盈止损订单）")
+    if changes['indicators']:
+        drop_signal_states(list(symbol_settings(config)))
+        logging.info("指标参数已改变，各品种将在下个周期重新预热。")
+    return config
+
+
+def run(symbols=None, wake_offset=0.0, rate_limit_scale=None, status_queue=None, shard_index=None):
+    """
+    运行实盘主循环。
+
+    参数:
+    symbols (list): 分片运行时分配给本进程的品种，None 表示 config.json 中的全部品种
+    wake_offset (float): 在 BAR_CLOSE_MARGIN 之上额外推迟的唤醒秒数（多分片错开请求）
+    rate_limit_scale (float): 本进程的限额比例，默认 RATE_LIMIT_SCALE
+    status_queue: 分片运行时向监控进程报告周期耗时的队列，默认 None
+    shard_index (int): 分片下标，随周期报告发送
+    """
+    if rate_limit_scale is not None:
+        rate_limiter.rescale(rate_limit_scale)
+    set_log_context(shard=SHARD)
+    watcher = ConfigWatcher(CONFIG_FILE)  # 启动时配置无效直接报错退出
+    config = watcher.config
+    # 启动后台邮件通知线程，交易流程只负责入队
+    start_notifier(to_email=EMAIL_TO, from_email=EMAIL_FROM, smtp_user=SMTP_USER, smtp_password=SMTP_PASSWORD)
+    # K线收盘调度与信号判断都使用交易所时钟，收盘前预热连接，避免空闲后首个请求重新握手
+    scheduler = BarScheduler(exchange, TIMEFRAME, safety_margin=BAR_CLOSE_MARGIN + wake_offset, prewarm=lambda: prewarm_connection(exchange))
+    scheduler.sync_clock()  # 同时建立到交易所的连接
+    open_journal(JOURNAL_FILE)
+    latency = start_latency_recorder(LATENCY_METRICS_FILE, LATENCY_CYCLES_FILE, clock=scheduler.exchange_time)
+    # 策略使用的交易所对象：K线由1m数据本地聚合，其余请求透传
+    strategy_exchange = LocalBarExchange(exchange, clock=scheduler.exchange_time) if LOCAL_BARS else exchange
+
     try:
+        # 加载市场元数据（优先使用磁盘缓存）
+        load_markets_cached(exchange, MARKETS_CACHE_FILE, ttl=MARKETS_CACHE_TTL)
+
         # 检查余额并设置杠杆
         balance = exchange.fetch_balance()
         logging.info(f"API连接成功，余额: {balance['total']['USDT']}")
 
-        for symbol, leverage in zip(SYMBOLS, LEVERAGES):  # 为每个品种设置对应的杠杆
-            leverage_to_set = int(leverage)
-            if SANDBOX:
-                exchange.set_leverage(leverage_to_set, symbol, {'mgnMode': 'isolated'})
-                logging.info(f"当前杠杆为：{leverage_to_set}（模拟环境，品种: {symbol}）")
-            else:
-                exchange.set_leverage(leverage_to_set, symbol, {'mgnMode': 'isolated', 'posSide': 'long'})
-                exchange.set_leverage(leverage_to_set, symbol, {'mgnMode': 'isolated', 'posSide': 'short'})
-                logging.info(f"当前杠杆为：{leverage_to_set}（多头和空头，品种: {symbol}）")
+        settings = active_symbols(config, symbols)
+        for symbol, (_, leverage) in settings.items():  # 为每个品种设置对应的杠杆，与当前一致时跳过
+            ensure_leverage(exchange, symbol, leverage, is_simulation=SANDBOX)
+
+        # 只核对流水中未结束的交易，不扫描交易所历史
+        reconcile_open_trades(exchange, symbols=list(settings))
 
     except Exception as e:
         logging.error(f"API连接失败: {e}")
-    
+
+    logging.info(f"启动完成，重启到就绪耗时 {time.monotonic() - STARTUP_TIME:.2f} 秒")
+
+    bar_close = None  # 启动后的首个周期不对应K线收盘，不计唤醒延迟
     while True:
         try:
-            for symbol, contract_size, leverage in zip(SYMBOLS, CONTRACT_SIZES, LEVERAGES):  # 对每个品种运行策略，使用对应的CONTRACT_SIZE和LEVERAGE
-                if SANDBOX:
-                    test_strategy(exchange, symbol, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, SL_ATR_MULTIPLIER, RR, RISK_USDT, leverage, TP_MODE, contract_size, FORBIDDEN_HOURS)
-                else:
-                    live_strategy(exchange, symbol, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, SL_ATR_MULTIPLIER, RR, RISK_USDT, leverage, TP_MODE, contract_size, FORBIDDEN_HOURS)
+            latency.begin_cycle(bar_close)
+            set_log_context(cycle=latency.cycles + 1)
+            cycle_start = time.monotonic()
+            settings = active_symbols(config, symbols)
+            strategy = test_strategy if SANDBOX else live_strategy
+            for symbol, (contract_size, leverage) in settings.items():  # 对每个品种运行策略，使用对应的合约面值和杠杆
+                strategy(strategy_exchange, symbol, config['EMA_PERIOD'], config['ATR_PERIOD'], config['MULTIPLIER'], config['ATR_THRESHOLD_PCT'], config['SL_ATR_MULTIPLIER'], config['RR'], config['RISK_USDT'], leverage, config['TP_MODE'], contract_size, config['FORBIDDEN_HOURS'], config['ENTRY_MODE'], config['REANCHOR_BRACKETS'], config['VOLUME_MULTIPLIER'], TIMEFRAME, clock=scheduler.exchange_time)
+            cycle_seconds = time.monotonic() - cycle_start
+            if status_queue is not None:
+                status_queue.put({'shard': shard_index, 'event': 'cycle', 'cycle_seconds': cycle_seconds, 'bar_close': bar_close, 'symbols': list(settings)})
+            latency.end_cycle()
+            rate_limiter.export(RATE_LIMIT_METRICS_FILE)
+            rate_limiter.log_summary()
+            # 在周期之间切换配置，重新初始化的请求不占用K线收盘后的关键时段
+            config = reload_config(watcher, symbols)
             # 测试用
             # time.sleep(5)
-            wait_time()
+            bar_close = scheduler.wait_next_bar()
             
         except KeyboardInterrupt:
             logging.info("用户中断，停止运行。")
@@ -109,5 +239,8 @@ def main():
         except Exception as e:
             logging.error(f"主循环错误: {e}")
 
+    stop_notifier()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
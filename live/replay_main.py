@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+
+import pandas as pd
+
+from src.notifier import start_notifier
+from src.replay import SimClock, SimulatedExchange, load_klines, run_replay
+from src.bars import LocalBarExchange
+from src.strategy import live_strategy
+
+# 离线回放：用回测数据驱动实盘代码（live_strategy / ema_atr_filter / set_stop_loss_and_take_profit），
+# 时钟由模拟时钟注入，数月的实盘行为可在几分钟内回放完毕。
+
+# --- 回放数据 ---
+# 基础周期K线文件（back_test 下载的数据），基础周期越细，止盈止损撮合越精确
+DATA_FILES = {
+    'BTC/USDT:USDT': 'back_test/data/BTCUSDT-1m/BTCUSDT-1m-2025-01.csv',
+}
+BASE_TIMEFRAME = '1m'
+RESULTS_DIR = 'live/replay_results'
+
+# --- 参数配置（与 live_main 保持一致）---
+TIMEFRAME = '15m'
+CONTRACT_SIZES = [100]  # 与DATA_FILES顺序一一对应
+LEVERAGES = [15]
+TP_MODE = 'limit'
+ENTRY_MODE = 'attached'
+REANCHOR_BRACKETS = True
+
+EMA_PERIOD = 25
+ATR_PERIOD = 24
+MULTIPLIER = 3
+SL_ATR_MULTIPLIER = 2
+ATR_THRESHOLD_PCT = 0
+VOLUME_MULTIPLIER = 1.0  # 信号K线成交量需大于前一根的倍数（与回测 volume_multiplier 一致）
+RR = 2
+FORBIDDEN_HOURS = [[23, 1], [8, 10], [3, 4]]
+RISK_USDT = 2.5
+BAR_CLOSE_MARGIN = 0.3
+LOCAL_BARS = True  # 与 live_main 一致：策略K线由基础周期在本地聚合
+
+TAKER_FEE = 0.0005
+LOG_LEVEL = logging.WARNING  # 回放时实盘代码日志较多，默认只输出警告
+
+
+def main():
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+    start_notifier(dry_run=True)
+
+    symbols = list(DATA_FILES)
+    data = {symbol: load_klines(path) for symbol, path in DATA_FILES.items()}
+    start_ts = max(df.index[0] for df in data.values()).timestamp()
+    end_ts = min(df.index[-1] for df in data.values()).timestamp()
+
+    clock = SimClock(start_ts)
+    exchange = SimulatedExchange(
+        data, clock, base_timeframe=BASE_TIMEFRAME,
+        contract_values={symbol: 1 / size for symbol, size in zip(symbols, CONTRACT_SIZES)},
+        taker_fee=TAKER_FEE,
+    )
+    for symbol, leverage in zip(symbols, LEVERAGES):
+        exchange.set_leverage(leverage, symbol)
+    strategy_exchange = LocalBarExchange(exchange, clock=clock.time, base_timeframe=BASE_TIMEFRAME) if LOCAL_BARS else exchange
+
+    def step():
+        for symbol, contract_size, leverage in zip(symbols, CONTRACT_SIZES, LEVERAGES):
+            live_strategy(strategy_exchange, symbol, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, SL_ATR_MULTIPLIER, RR, RISK_USDT, leverage, TP_MODE, contract_size, FORBIDDEN_HOURS, ENTRY_MODE, REANCHOR_BRACKETS, VOLUME_MULTIPLIER, TIMEFRAME, clock=clock.time, sleep=clock.sleep)
+
+    wall_start = time.perf_counter()
+    trades = run_replay(exchange, clock, step, end_ts, timeframe=TIMEFRAME, margin=BAR_CLOSE_MARGIN)
+    wall = time.perf_counter() - wall_start
+
+    simulated = end_ts - start_ts
+    print(f"回放区间: {pd.to_datetime(start_ts, unit='s')} ~ {pd.to_datetime(end_ts, unit='s')}")
+    print(f"耗时 {wall:.1f} 秒，加速 {simulated / max(wall, 1e-9):.0f} 倍")
+    print(f"交易数量: {len(trades)}，期末余额: {exchange.balance:.2f} USDT")
+    print(f"接口调用次数: {exchange.call_counts}")
+    if not trades.empty:
+        win_rate = (trades['pnl'] > 0).mean() * 100
+        print(f"胜率: {win_rate:.2f}%，净盈亏: {trades['pnl'].sum():.2f} USDT")
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        trades_filename = f"{RESULTS_DIR}/replay_trades_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        trades.to_csv(trades_filename, index=False)
+        print(f"交易明细已保存到: {trades_filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+# 单次请求的K线数量上限（OKX 为 300）
+FETCH_LIMIT = 300
+
+
+class MinuteBarStore:
+    """
+    单个品种的1m K线缓存，并在本地聚合出任意更大周期的K线。
+
+    更大周期按UTC纪元对齐分组（15m 为 :00/:15/:30/:45，1h 为整点，1d 为 UTC 0 点），与交易所K线边界一致。
+    只保存已收盘的1m K线，另外保留最新一根正在形成的1m K线，用于构造正在形成的大周期K线。
+
+    参数:
+    max_bars (int): 最多保留的已收盘1m K线数量
+    """
+
+    def __init__(self, max_bars):
+        self.max_bars = max_bars
+        self.bars = np.empty((0, 6))  # 列: 时间戳(ms), open, high, low, close, volume
+        self.forming = None
+        self.requested_from = None  # 已回补历史的起点（毫秒）
+
+    @property
+    def last_closed_ts(self):
+        return int(self.bars[-1, 0]) if len(self.bars) else None
+
+    def append(self, rows):
+        """
+        合并新获取的1m K线（最后一根视为正在形成），只追加比已有数据更新的已收盘K线。
+
+        返回:
+        int: 新追加的已收盘K线数量
+        """
+        if not rows:
+            return 0
+        rows = np.asarray(rows, dtype=float)
+        closed, self.forming = rows[:-1], rows[-1]
+        if self.last_closed_ts is not None:
+            closed = closed[closed[:, 0] > self.last_closed_ts]
+        if len(closed):
+            self.bars = np.concatenate([self.bars, closed])[-self.max_bars:]
+        return len(closed)
+
+    def aggregate(self, timeframe_ms, limit):
+        """
+        聚合出 timeframe_ms 周期的K线，格式与 ccxt fetch_ohlcv 相同，最后一根为正在形成的K线。
+
+        开头不完整的周期（缓存起点落在周期中间）会被丢弃。
+
+        返回:
+        list: [[时间戳(ms), open, high, low, close, volume], ...]，最多 limit 根
+        """
+        bars = self.bars if self.forming is None else np.vstack([self.bars, self.forming])
+        if not len(bars):
+            return []
+        # 只取足够构造 limit 根的尾部数据，避免每次聚合整段缓存
+        minutes = int(timeframe_ms // 60_000)
+        bars = bars[-(limit + 1) * minutes:]
+        bucket = bars[:, 0] // timeframe_ms * timeframe_ms
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        if bars[0, 0] != bucket[0]:
+            starts = starts[1:]
+            if not len(starts):
+                return []
+            bars, bucket = bars[starts[0]:], bucket[starts[0]:]
+            starts = starts - starts[0]
+        ends = np.r_[starts[1:], len(bars)] - 1
+        result = np.column_stack([
+            bucket[starts],
+            bars[starts, 1],
+            np.maximum.reduceat(bars[:, 2], starts),
+            np.minimum.reduceat(bars[:, 3], starts),
+            bars[ends, 4],
+            np.add.reduceat(bars[:, 5], starts),
+        ])[-limit:]
+        return [[int(row[0])] + row[1:].tolist() for row in result]
+
+
+class LocalBarExchange:
+    """
+    交易所代理：fetch_ohlcv 由每个品种唯一的1m K线流在本地聚合得到，其他方法直接透传。
+
+    每个品种每分钟最多请求一次1m K线（同一周期内多个时间框架、多次重试共用），首次请求某个时间框架时
+    按需回补足够的1m历史；发现1m数据断档时从断点处回补。
+
+    参数:
+    exchange: ccxt交易所对象（可为 RateLimitedExchange）
+    clock (callable): 返回当前交易所时间戳（秒）的函数，默认 time.time
+    base_timeframe (str): 基础K线周期，默认 '1m'
+    max_bars (int): 每个品种最多缓存的1m K线数量，默认 20000（约两周，足够1h周期预热300根）
+    """
+
+    def __init__(self, exchange, clock=None, base_timeframe='1m', max_bars=20000):
+        object.__setattr__(self, '_exchange', exchange)
+        object.__setattr__(self, '_clock', clock or time.time)
+        object.__setattr__(self, '_base_timeframe', base_timeframe)
+        object.__setattr__(self, '_base_ms', exchange.parse_timeframe(base_timeframe) * 1000)
+        object.__setattr__(self, '_max_bars', max_bars)
+        object.__setattr__(self, '_stores', {})
+        object.__setattr__(self, 'base_requests', 0)
+
+    def __getattr__(self, name):
+        return getattr(self._exchange, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._exchange, name, value)
+
+    def _fetch_base(self, symbol, since=None, limit=FETCH_LIMIT):
+        object.__setattr__(self, 'base_requests', self.base_requests + 1)
+        return self._exchange.fetch_ohlcv(symbol, timeframe=self._base_timeframe, since=since, limit=limit)
+
+    def _backfill(self, store, symbol, since):
+        """从 since（毫秒）开始分页获取1m K线直到最新。"""
+        while True:
+            rows = self._fetch_base(symbol, since=since)
+            if len(rows) < 2:
+                store.append(rows)
+                return
+            store.append(rows)
+            if len(rows) < FETCH_LIMIT:
+                return
+            since = int(rows[-1][0])  # 最后一根可能仍在形成，从它开始继续
+
+    def _refresh(self, symbol, want_from):
+        """
+        保证缓存覆盖 want_from（毫秒）至今的已收盘1m K线，本分钟已更新过则不发请求。
+        """
+        store = self._stores.get(symbol)
+        if store is None or want_from < store.requested_from:
+            # 首次使用或需要更长的历史：重新回补整段
+            logging.info(f"回补 {symbol} 的 {self._base_timeframe} K线历史（自 {pd.to_datetime(want_from, unit='ms')} 起）")
+            store = MinuteBarStore(self._max_bars)
+            store.requested_from = want_from
+            self._backfill(store, symbol, int(want_from))
+            self._stores[symbol] = store
+            return store
+
+        now_ms = self._clock() * 1000
+        expected_last = (int(now_ms // self._base_ms) - 1) * self._base_ms  # 应已收盘的最新1m K线
+        if store.last_closed_ts is None:
+            self._backfill(store, symbol, int(want_from))
+            return store
+        if store.last_closed_ts >= expected_last:
+            return store  # 本分钟已获取过
+
+        gap = expected_last - store.last_closed_ts
+        if gap > (FETCH_LIMIT - 2) * self._base_ms:
+            # 断档超过单次请求能覆盖的范围（如停机），从断点分页回补
+            self._backfill(store, symbol, int(store.last_closed_ts + self._base_ms))
+        else:
+            store.append(self._fetch_base(symbol, limit=int(gap // self._base_ms) + 2))
+        return store
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=100, params={}):
+        """
+        返回本地聚合的K线，格式与 ccxt fetch_ohlcv 相同（最后一根为正在形成的K线）。
+
+        传入 since 时直接请求交易所（历史查询不走本地聚合）。
+        """
+        if since is not None:
+            return self._exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit, params=params)
+        timeframe_ms = self._exchange.parse_timeframe(timeframe) * 1000
+        if timeframe_ms % self._base_ms:
+            raise ValueError(f"{timeframe} 不是 {self._base_timeframe} 的整数倍，无法本地聚合")
+        if limit * timeframe_ms // self._base_ms > self._max_bars:
+            raise ValueError(f"{timeframe} x {limit} 根需要的 {self._base_timeframe} K线超过缓存上限 {self._max_bars}")
+        # 从 limit 根之前的周期边界开始需要完整的1m数据
+        want_from = (int(self._clock() * 1000 // timeframe_ms) - (limit - 1)) * timeframe_ms
+        store = self._refresh(symbol, want_from)
+        return store.aggregate(timeframe_ms, limit)
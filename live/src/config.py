@@ -0,0 +1,163 @@
+import os
+import json
+import logging
+import numbers
+
+# 可热更新的实盘参数：运行中修改配置文件后，在下一个周期边界整体替换（校验失败时保留原配置）。
+# 周期、模拟/实盘、K线来源等需要重建调度器或交易所对象的参数仍在 live_main.py 中配置，修改后需重启。
+
+TP_MODES = ('limit', 'trailing')
+ENTRY_MODES = ('attached', 'separate')
+
+
+def _positive_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and value > 0
+
+
+def _non_negative_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and value >= 0
+
+
+def _positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def _forbidden_hours(value):
+    return isinstance(value, list) and all(
+        isinstance(h, list) and len(h) == 2 and all(isinstance(x, int) and 0 <= x <= 24 for x in h) for h in value
+    )
+
+
+# {参数名: (校验函数, 说明)}
+CONFIG_SCHEMA = {
+    'SYMBOLS': (lambda v: isinstance(v, list) and v and all(isinstance(s, str) for s in v) and len(set(v)) == len(v), '不重复的品种列表'),
+    'CONTRACT_SIZES': (lambda v: isinstance(v, list) and all(_positive_number(x) for x in v), '正数列表，与 SYMBOLS 一一对应'),
+    'LEVERAGES': (lambda v: isinstance(v, list) and all(_positive_int(x) for x in v), '正整数列表，与 SYMBOLS 一一对应'),
+    'TP_MODE': (lambda v: v in TP_MODES, f"取值 {TP_MODES}"),
+    'ENTRY_MODE': (lambda v: v in ENTRY_MODES, f"取值 {ENTRY_MODES}"),
+    'REANCHOR_BRACKETS': (lambda v: isinstance(v, bool), '布尔值'),
+    'EMA_PERIOD': (_positive_int, '正整数'),
+    'ATR_PERIOD': (_positive_int, '正整数'),
+    'MULTIPLIER': (_positive_number, '正数'),
+    'SL_ATR_MULTIPLIER': (_positive_number, '正数'),
+    'ATR_THRESHOLD_PCT': (_non_negative_number, '非负数'),
+    'VOLUME_MULTIPLIER': (_non_negative_number, '非负数'),
+    'RR': (_positive_number, '正数'),
+    'FORBIDDEN_HOURS': (_forbidden_hours, '[[开始小时, 结束小时], ...]，小时取 0-24'),
+    'RISK_USDT': (_positive_number, '正数'),
+}
+
+# 改变后需要重建信号状态的参数（指标本身依赖它们）；其余信号过滤条件直接替换，不丢失预热状态
+INDICATOR_KEYS = ('EMA_PERIOD', 'ATR_PERIOD', 'MULTIPLIER')
+
+
+def load_config(path):
+    """
+    读取并校验实盘参数配置文件（JSON）。
+
+    参数:
+    path (str): 配置文件路径
+
+    返回:
+    dict: {参数名: 值}
+
+    异常:
+    ValueError: 缺少参数、取值不合法或列表长度不一致
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError("配置文件顶层必须是对象")
+
+    errors = [f"缺少 {key}" for key in CONFIG_SCHEMA if key not in config]
+    errors += [f"{key} 应为{description}" for key, (check, description) in CONFIG_SCHEMA.items()
+               if key in config and not check(config[key])]
+    if not errors and not len(config['SYMBOLS']) == len(config['CONTRACT_SIZES']) == len(config['LEVERAGES']):
+        errors.append("SYMBOLS、CONTRACT_SIZES、LEVERAGES 长度不一致")
+    if errors:
+        raise ValueError('；'.join(errors))
+
+    unknown = sorted(set(config) - set(CONFIG_SCHEMA))
+    if unknown:
+        logging.warning(f"配置文件中的 {unknown} 不支持热更新，已忽略（请在 live_main.py 中修改并重启）")
+    return {key: config[key] for key in CONFIG_SCHEMA}
+
+
+def symbol_settings(config):
+    """
+    返回:
+    dict: {品种: (合约面值, 杠杆)}，保持配置中的顺序
+    """
+    return {s: (c, l) for s, c, l in zip(config['SYMBOLS'], config['CONTRACT_SIZES'], config['LEVERAGES'])}
+
+
+def diff_config(old, new):
+    """
+    比较两份配置，得到需要重新初始化的品种和发生变化的参数。
+
+    返回:
+    dict: {
+        'added': 新增品种,
+        'removed': 移除的品种,
+        'leverage': 杠杆改变的已有品种,
+        'contract_size': 合约面值改变的已有品种,
+        'params': 发生变化的其他参数名,
+        'indicators': 指标参数是否变化,
+    }
+    """
+    old_symbols, new_symbols = symbol_settings(old), symbol_settings(new)
+    params = [key for key in CONFIG_SCHEMA if key not in ('SYMBOLS', 'CONTRACT_SIZES', 'LEVERAGES') and old[key] != new[key]]
+    return {
+        'added': [s for s in new_symbols if s not in old_symbols],
+        'removed': [s for s in old_symbols if s not in new_symbols],
+        'leverage': [s for s in new_symbols if s in old_symbols and new_symbols[s][1] != old_symbols[s][1]],
+        'contract_size': [s for s in new_symbols if s in old_symbols and new_symbols[s][0] != old_symbols[s][0]],
+        'params': params,
+        'indicators': any(key in params for key in INDICATOR_KEYS),
+    }
+
+
+class ConfigWatcher:
+    """
+    监视实盘参数配置文件，文件修改后重新读取并校验。
+
+    只在调用 poll() 时检查（主循环在周期边界调用），新配置整体替换旧配置，不会出现一个周期内新旧参数混用；
+    文件不完整或校验失败时记录错误并继续使用原配置，修正后再次保存即可生效。
+
+    参数:
+    path (str): 配置文件路径（启动时必须存在且合法）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = self._file_stamp()
+        self.config = load_config(path)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        """
+        检查配置文件是否被修改。
+
+        返回:
+        tuple: 配置有效变化时返回 (新配置, diff_config 结果)，否则返回 None
+        """
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return None
+        self._stamp = stamp
+        try:
+            new = load_config(self.path)
+        except (OSError, ValueError) as e:  # json.JSONDecodeError 是 ValueError 的子类
+            logging.error(f"\033[91m配置文件 {self.path} 无效，继续使用原配置: {e}\033[0m")
+            return None
+        if new == self.config:
+            return None
+        changes = diff_config(self.config, new)
+        self.config = new
+        return new, changes
@@ -1,6 +1,12 @@
 import logging
+import time
+import uuid
 
-def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_price, tp_price, actual_size, TP_MODE, is_simulation=False):
+import ccxt
+
+from .latency import NullTrace
+
+def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_price, tp_price, actual_size, TP_MODE, is_simulation=False, trace=None):
     """
     设置止损和止盈订单。
     
@@ -16,10 +22,13 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
     actual_size: 实际张数
     TP_MODE: 止盈模式 ('limit' 或 'trailing')
     is_simulation: 是否模拟交易
+    trace: 本周期延迟时间线，记录每个止盈止损订单的设置耗时，默认不记录
     
     返回:
     tuple: (止损订单ID, 止盈订单ID, 追踪止盈订单ID)
     """
+    if trace is None:
+        trace = NullTrace()
     sl_order_id = None
     tp_order_id = None
     trailing_order_id = None
@@ -37,6 +46,7 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
                 params=sl_params
             )
             sl_order_id = sl_order['id']
+            trace.mark('sl_placed')
             logging.info(f"\033[92m止损订单（卖出）已设置，订单ID: {sl_order_id}\033[0m")
 
             # 设置止盈订单
@@ -52,6 +62,7 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
                     params=tp_params
                 )
                 tp_order_id = tp_order['id']
+                trace.mark('tp_placed')
                 logging.info(f"\033[92m限价止盈订单（卖出）已设置，订单ID: {tp_order_id}\033[0m")
             elif TP_MODE == 'trailing':
                 trailing_params = {
@@ -69,6 +80,7 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
                     params=trailing_params
                 )
                 trailing_order_id = trailing_order['id']
+                trace.mark('trailing_placed')
                 logging.info(f"\033[92m移动止盈止损订单（卖出）已设置，订单ID: {trailing_order_id}\033[0m")
             else:
                 logging.warning("无效的TP_MODE，跳过止盈设置。")
@@ -85,6 +97,7 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
                 params=sl_params
             )
             sl_order_id = sl_order['id']
+            trace.mark('sl_placed')
             logging.info(f"\033[92m止损订单（买入）已设置，订单ID: {sl_order_id}\033[0m")
 
             # 设置止盈订单
@@ -100,6 +113,7 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
                     params=tp_params
                 )
                 tp_order_id = tp_order['id']
+                trace.mark('tp_placed')
                 logging.info(f"\033[92m限价止盈订单（买入）已设置，订单ID: {tp_order_id}\033[0m")
             elif TP_MODE == 'trailing':
                 trailing_params = {
@@ -117,6 +131,7 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
                     params=trailing_params
                 )
                 trailing_order_id = trailing_order['id']
+                trace.mark('trailing_placed')
                 logging.info(f"\033[92m移动止盈止损订单（买入）已设置，订单ID: {trailing_order_id}\033[0m")
             else:
                 logging.warning("无效的TP_MODE，跳过止盈设置。")
@@ -124,4 +139,168 @@ def set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_pric
     except Exception as e:
         logging.error(f"设置止损止盈失败: {e}")
 
-    return sl_order_id, tp_order_id, trailing_order_id
\ No newline at end of file
+    return sl_order_id, tp_order_id, trailing_order_id
+
+def new_algo_client_id():
+    """
+    生成附带止盈止损的客户端算法订单ID（OKX要求1-32位字母数字）。
+    """
+    return f"rt{uuid.uuid4().hex[:30]}"
+
+
+def new_entry_client_id():
+    """
+    生成入场订单的客户端订单ID（OKX clOrdId，1-32位字母数字），用于超时后查询和防止重复下单。
+    """
+    return f"en{uuid.uuid4().hex[:30]}"
+
+
+class OrderStatusUnknown(ccxt.NetworkError):
+    """
+    多次重试后仍无法确认订单是否已提交；调用方不应换用新的客户端ID重新下单。
+    """
+
+
+def submit_order_idempotent(exchange, SYMBOL, submit, client_order_id, retries=2, sleep=None):
+    """
+    按客户端订单ID幂等地提交订单。
+
+    超时等网络错误时请求可能已到达交易所，先按客户端ID查询：已存在则直接使用该订单，
+    不存在才用同一ID重新提交。交易所拒绝重复的客户端ID，重试不会产生第二笔订单；
+    重试被拒绝时同样按ID查询前一次提交的订单。
+
+    参数:
+    exchange: ccxt交易所对象
+    SYMBOL: 交易对
+    submit: 无参函数，提交带 client_order_id 的订单并返回订单
+    client_order_id: 客户端订单ID
+    retries: 结果未知时的最大重试次数
+    sleep: 休眠函数，默认 time.sleep
+
+    返回:
+    dict: 订单
+
+    异常:
+    ccxt.ExchangeError: 首次提交即被交易所拒绝（订单未创建）
+    OrderStatusUnknown: 重试用尽后仍无法确认订单状态
+    """
+    if sleep is None:
+        sleep = time.sleep
+    error = None
+    for attempt in range(retries + 1):
+        try:
+            return submit()
+        except ccxt.NetworkError as e:
+            error = e
+        except ccxt.ExchangeError as e:
+            if attempt == 0:
+                raise
+            error = e
+        logging.warning(f"下单结果未知（{error}），按客户端订单ID查询: {client_order_id}")
+        sleep(1)
+        try:
+            order = exchange.fetch_order(None, SYMBOL, params={'clientOrderId': client_order_id})
+            logging.info(f"订单已在交易所创建，订单ID: {order['id']}，不再重复提交")
+            return order
+        except ccxt.OrderNotFound:
+            logging.warning(f"未找到客户端订单ID {client_order_id}，使用同一ID重新提交（第 {attempt + 1} 次重试）")
+        except ccxt.BaseError as e:
+            logging.warning(f"按客户端订单ID查询失败: {e}")
+    raise OrderStatusUnknown(f"无法确认客户端订单ID {client_order_id} 的下单结果: {error}")
+
+
+def build_attached_brackets(exchange, SYMBOL, entry_price, sl_price, tp_price, algo_cl_ord_id):
+    """
+    构造OKX入场订单附带的止盈止损参数（attachAlgoOrds）。
+
+    止损为触发后市价，止盈与 set_stop_loss_and_take_profit 的限价模式保持一致：
+    在入场价与止盈价的中点触发，以止盈价挂限价单。
+
+    参数:
+    exchange: ccxt交易所对象
+    SYMBOL: 交易对
+    entry_price: 参考入场价格（信号K线收盘价或实际成交价）
+    sl_price: 止损价格
+    tp_price: 止盈价格
+    algo_cl_ord_id: 附带算法订单的客户端ID，用于后续修改
+
+    返回:
+    list: 可直接放入下单 params 的 attachAlgoOrds 列表
+    """
+    return [{
+        'attachAlgoClOrdId': algo_cl_ord_id,
+        'slTriggerPx': exchange.price_to_precision(SYMBOL, sl_price),
+        'slOrdPx': '-1',
+        'tpTriggerPx': exchange.price_to_precision(SYMBOL, (tp_price + entry_price) / 2),
+        'tpOrdPx': exchange.price_to_precision(SYMBOL, tp_price),
+    }]
+
+
+def place_entry_with_brackets(exchange, SYMBOL, signal, size, ref_price, sl_price, tp_price, is_simulation=False, sleep=None):
+    """
+    单次请求提交市价入场单，并附带止盈止损（OKX attachAlgoOrds）。
+
+    止盈止损价格基于信号K线收盘价计算，入场成交后即处于保护状态，
+    之后可通过 reanchor_attached_brackets 按实际成交价修正。
+
+    参数:
+    exchange: ccxt交易所对象
+    SYMBOL: 交易对
+    signal: 信号类型 ('long_entry' 或 'short_entry')
+    size: 下单张数
+    ref_price: 参考价格（信号K线收盘价）
+    sl_price: 止损价格
+    tp_price: 止盈价格
+    is_simulation: 是否模拟交易
+    sleep: 休眠函数，默认 time.sleep
+
+    返回:
+    tuple: (入场订单, 附带算法订单客户端ID)
+
+    异常:
+    ccxt.ExchangeError: 交易所拒绝该请求，调用方可回退到分步下单
+    OrderStatusUnknown: 超时重试后仍无法确认是否已下单，调用方不能回退到分步下单
+    """
+    side = 'buy' if signal == 'long_entry' else 'sell'
+    algo_cl_ord_id = new_algo_client_id()
+    client_order_id = new_entry_client_id()
+    params = {
+        'clientOrderId': client_order_id,
+        'attachAlgoOrds': build_attached_brackets(exchange, SYMBOL, ref_price, sl_price, tp_price, algo_cl_ord_id),
+    }
+    if not is_simulation:
+        params['posSide'] = 'long' if signal == 'long_entry' else 'short'
+    order = submit_order_idempotent(exchange, SYMBOL, lambda: exchange.create_order(SYMBOL, 'market', side, size, params=params), client_order_id, sleep=sleep)
+    logging.info(f"\033[92m市价入场订单（附带止盈止损）已提交，订单ID: {order['id']}，算法订单ID: {algo_cl_ord_id}\033[0m")
+    return order, algo_cl_ord_id
+
+
+def reanchor_attached_brackets(exchange, SYMBOL, algo_cl_ord_id, entry_price, sl_price, tp_price):
+    """
+    按实际成交价修改入场时附带的止盈止损。
+
+    参数:
+    exchange: ccxt交易所对象
+    SYMBOL: 交易对
+    algo_cl_ord_id: 附带算法订单的客户端ID
+    entry_price: 实际入场价格
+    sl_price: 新止损价格
+    tp_price: 新止盈价格
+
+    返回:
+    bool: 修改成功返回True；失败时原止盈止损保持有效，返回False
+    """
+    try:
+        exchange.privatePostTradeAmendAlgos({
+            'instId': exchange.market_id(SYMBOL),
+            'algoClOrdId': algo_cl_ord_id,
+            'newSlTriggerPx': exchange.price_to_precision(SYMBOL, sl_price),
+            'newSlOrdPx': '-1',
+            'newTpTriggerPx': exchange.price_to_precision(SYMBOL, (tp_price + entry_price) / 2),
+            'newTpOrdPx': exchange.price_to_precision(SYMBOL, tp_price),
+        })
+        logging.info(f"\033[92m附带止盈止损已按成交价修正，止损价格: {sl_price}, 止盈价格: {tp_price}\033[0m")
+        return True
+    except Exception as e:
+        logging.warning(f"修正附带止盈止损失败，保留基于信号收盘价的止盈止损: {e}")
+        return False
@@ -0,0 +1,260 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import time
+
+import ccxt
+
+# 交易流水：events 表只追加（信号、入场、成交、止盈止损订单、平仓），trades 表保存每笔交易的当前状态，
+# 重启时只需按 trades.status 取出未结束的交易与交易所核对，不必扫描交易所历史。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    symbol TEXT NOT NULL,
+    order_id TEXT,
+    kind TEXT NOT NULL,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS trades (
+    order_id TEXT PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    size REAL,
+    entry_price REAL,
+    sl_id TEXT,
+    tp_id TEXT,
+    trailing_id TEXT,
+    algo_cl_ord_id TEXT,
+    status TEXT NOT NULL,
+    opened_ts REAL NOT NULL,
+    updated_ts REAL NOT NULL,
+    closed_ts REAL,
+    close_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status, symbol);
+"""
+
+# 未结束的交易状态：pending 已下单未确认成交，open 已成交
+OPEN_STATUSES = ('pending', 'open')
+
+_NOW = object()  # 占位符：写入时替换为事件时间戳
+
+
+class TradeJournal:
+    """
+    基于 SQLite（WAL 模式）的本地交易流水。
+
+    每次写入在一个事务内追加一条事件并更新对应交易的状态，进程崩溃后最多丢失正在写入的那条记录。
+
+    参数:
+    path (str): 数据库文件路径
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, symbol, order_id, kind, data, statement=None, args=()):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.execute(
+                    'INSERT INTO events (ts, symbol, order_id, kind, data) VALUES (?, ?, ?, ?, ?)',
+                    (now, symbol, order_id, kind, json.dumps(data, ensure_ascii=False, default=str)),
+                )
+                if statement:
+                    self._conn.execute(statement, tuple(a if a is not _NOW else now for a in args))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def record_signal(self, symbol, signal, **data):
+        """记录交易信号（不对应订单）。"""
+        self._write(symbol, None, 'signal', dict(signal=signal, **data))
+
+    def record_entry(self, symbol, order_id, signal, size, **data):
+        """记录已被交易所接受的入场订单，交易状态为 pending。"""
+        side = 'long' if signal == 'long_entry' else 'short'
+        self._write(
+            symbol, order_id, 'entry', dict(signal=signal, size=size, **data),
+            'INSERT OR REPLACE INTO trades (order_id, symbol, side, size, algo_cl_ord_id, status, opened_ts, updated_ts) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (order_id, symbol, side, size, data.get('algo_cl_ord_id'), 'pending', _NOW, _NOW),
+        )
+
+    def record_fill(self, symbol, order_id, entry_price, size):
+        """记录入场成交，交易状态改为 open。"""
+        self._write(
+            symbol, order_id, 'fill', {'entry_price': entry_price, 'size': size},
+            "UPDATE trades SET entry_price = ?, size = ?, status = 'open', updated_ts = ? WHERE order_id = ?",
+            (entry_price, size, _NOW, order_id),
+        )
+
+    def record_brackets(self, symbol, order_id, sl_id=None, tp_id=None, trailing_id=None, **data):
+        """记录止损/止盈/移动止盈订单ID。"""
+        self._write(
+            symbol, order_id, 'brackets', dict(sl_id=sl_id, tp_id=tp_id, trailing_id=trailing_id, **data),
+            'UPDATE trades SET sl_id = ?, tp_id = ?, trailing_id = ?, updated_ts = ? WHERE order_id = ?',
+            (sl_id, tp_id, trailing_id, _NOW, order_id),
+        )
+
+    def record_close(self, symbol, order_id, reason, **data):
+        """记录交易结束（持仓已平或入场未成交）。"""
+        self._write(
+            symbol, order_id, 'close', dict(reason=reason, **data),
+            "UPDATE trades SET status = 'closed', closed_ts = ?, close_reason = ?, updated_ts = ? WHERE order_id = ?",
+            (_NOW, reason, _NOW, order_id),
+        )
+
+    def open_trades(self, symbol=None):
+        """
+        返回未结束的交易。
+
+        返回:
+        list[dict]: trades 表中状态为 pending/open 的行
+        """
+        query = f"SELECT * FROM trades WHERE status IN ({','.join('?' * len(OPEN_STATUSES))})"
+        args = list(OPEN_STATUSES)
+        if symbol is not None:
+            query += ' AND symbol = ?'
+            args.append(symbol)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query + ' ORDER BY opened_ts', args)]
+
+    def events(self, order_id):
+        """返回某笔交易的全部事件（按时间顺序）。"""
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM events WHERE order_id = ? ORDER BY id', (order_id,))
+            return [dict(row, data=json.loads(row['data'])) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_journal = None
+
+
+def open_journal(path):
+    """
+    打开全局交易流水。
+
+    返回:
+    TradeJournal: 全局流水
+    """
+    global _default_journal
+    if _default_journal is not None:
+        _default_journal.close()
+    _default_journal = TradeJournal(path)
+    return _default_journal
+
+
+def get_journal():
+    """返回全局交易流水，未打开时返回 None。"""
+    return _default_journal
+
+
+def journal_call(method, *args, **kwargs):
+    """
+    调用全局流水的记录方法；未打开流水时忽略，写入失败只记录错误，不影响交易流程。
+    """
+    if _default_journal is None:
+        return None
+    try:
+        return getattr(_default_journal, method)(*args, **kwargs)
+    except Exception as e:
+        logging.error(f"交易流水写入失败 ({method}): {e}")
+        return None
+
+
+def mark_flat(symbol):
+    """
+    品种已无持仓时，把流水中该品种未结束的交易标记为已平仓（不发起任何请求）。
+    """
+    if _default_journal is None:
+        return
+    for trade in _default_journal.open_trades(symbol):
+        journal_call('record_close', symbol, trade['order_id'], 'position_flat')
+
+
+def _bracket_alive(exchange, symbol, order_id, client_id=False):
+    params = {'trigger': True}
+    if client_id:
+        params['clientOrderId'] = order_id
+        order_id = None
+    try:
+        return exchange.fetch_order(order_id, symbol, params=params)['status'] == 'open'
+    except ccxt.OrderNotFound:
+        return False
+
+
+def reconcile_open_trades(exchange, journal=None, symbols=None):
+    """
+    启动时只核对流水中未结束的交易：一次查询全部持仓，再逐个检查这些交易的止盈止损订单。
+
+    - 持仓已不存在：标记为已平仓
+    - 持仓存在但止盈止损订单均已失效：记录错误，需要人工处理
+    - 交易所有持仓但流水中没有对应交易：记录警告
+
+    参数:
+    exchange: ccxt交易所对象
+    journal (TradeJournal): 交易流水，默认使用全局流水
+    symbols (list): 只核对这些品种（多进程分片时每个分片只核对自己的品种），默认全部
+
+    返回:
+    dict: {'checked', 'closed', 'unprotected', 'untracked'}
+    """
+    journal = journal or _default_journal
+    summary = {'checked': 0, 'closed': [], 'unprotected': [], 'untracked': []}
+    if journal is None:
+        return summary
+
+    start = time.perf_counter()
+    trades = journal.open_trades()
+    positions = exchange.fetch_positions()
+    held = {(pos['symbol'], pos.get('side')) for pos in positions if pos.get('contracts')}
+    if symbols is not None:
+        trades = [t for t in trades if t['symbol'] in symbols]
+        held = {key for key in held if key[0] in symbols}
+
+    tracked = set()
+    for trade in trades:
+        summary['checked'] += 1
+        symbol, order_id = trade['symbol'], trade['order_id']
+        key = (symbol, trade['side'])
+        if key not in held:
+            journal.record_close(symbol, order_id, 'position_flat_on_startup')
+            summary['closed'].append(order_id)
+            continue
+        tracked.add(key)
+
+        if trade['algo_cl_ord_id']:
+            alive = _bracket_alive(exchange, symbol, trade['algo_cl_ord_id'], client_id=True)
+        else:
+            bracket_ids = [i for i in (trade['sl_id'], trade['tp_id'], trade['trailing_id']) if i]
+            alive = any(_bracket_alive(exchange, symbol, i) for i in bracket_ids)
+        if not alive:
+            summary['unprotected'].append(order_id)
+            logging.error(f"\033[91m{symbol} 持仓（入场订单 {order_id}）没有有效的止盈止损订单，请人工处理。\033[0m")
+
+    for symbol, side in held - tracked:
+        summary['untracked'].append(symbol)
+        logging.warning(f"{symbol} 存在流水中没有记录的 {side} 持仓。")
+
+    logging.info(
+        f"交易流水核对完成，耗时 {time.perf_counter() - start:.2f} 秒：核对 {summary['checked']} 笔，"
+        f"已平仓 {len(summary['closed'])} 笔，无保护 {len(summary['unprotected'])} 笔，未记录持仓 {len(summary['untracked'])} 个"
+    )
+    return summary
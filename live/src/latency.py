@@ -0,0 +1,236 @@
+import os
+import json
+import bisect
+import logging
+import time
+
+from .logs import log_stage, set_log_context
+
+# 直方图桶上界（毫秒），覆盖从本地计算到交易所重试的量级
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """
+    固定桶的延迟直方图（毫秒），用于统计尾部延迟。
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为溢出桶
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, q):
+        """
+        估算分位数：返回该分位所在桶的上界（溢出桶返回最大值），偏保守。
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= rank and c:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': round(self.max, 3),
+            'counts': self.counts,
+        }
+
+
+class CycleTrace:
+    """
+    单个品种在单个周期内的步骤时间线。
+
+    mark(step) 记录当前时刻，同时计算距上一步的耗时（step_ms）和距K线收盘的延迟（since_bar_ms）。
+
+    参数:
+    symbol (str): 交易对
+    bar_close (float): 本周期K线收盘的交易所时间戳（秒），未知时为 None
+    clock (callable): 返回当前时间戳（秒）的函数，与策略使用同一时钟
+    """
+
+    def __init__(self, symbol, bar_close, clock):
+        self.symbol = symbol
+        self.bar_close = bar_close
+        self.clock = clock
+        self.start = clock()
+        self._last = self.start
+        self.events = []
+
+    def mark(self, step, **fields):
+        now = self.clock()
+        event = {'step': step, 'step_ms': round((now - self._last) * 1000, 3)}
+        if self.bar_close is not None:
+            event['since_bar_ms'] = round((now - self.bar_close) * 1000, 3)
+        event.update(fields)
+        self.events.append(event)
+        self._last = now
+        log_stage(self.symbol, event)
+        return event
+
+    def to_dict(self):
+        return {
+            'symbol': self.symbol,
+            'bar_close': self.bar_close,
+            'total_ms': round((self._last - self.start) * 1000, 3),
+            'events': self.events,
+        }
+
+
+class NullTrace:
+    """
+    未启动延迟记录时使用的空时间线，mark 不做任何事。
+    """
+
+    def mark(self, step, **fields):
+        return None
+
+
+class LatencyRecorder:
+    """
+    实盘周期延迟记录器。
+
+    每个周期 begin_cycle 记录调度器唤醒延迟，每个品种通过 trace() 获取时间线，策略结束后 finish() 汇总到
+    按步骤（以及按品种）划分的直方图；end_cycle 把直方图写入指标文件，并把本周期所有时间线追加到明细文件（JSON Lines）。
+
+    参数:
+    metrics_file (str): 直方图指标文件路径（JSON，每周期覆盖写入）
+    cycles_file (str): 每周期明细文件路径（JSON Lines，追加），None 表示不记录明细
+    clock (callable): 时钟函数，默认 time.time；实盘传入调度器的交易所时钟
+    """
+
+    def __init__(self, metrics_file, cycles_file=None, clock=None):
+        self.metrics_file = metrics_file
+        self.cycles_file = cycles_file
+        self.clock = clock or time.time
+        self.started = self.clock()
+        self.cycles = 0
+        self.steps = {}    # {step: {'step_ms': LatencyHistogram, 'since_bar_ms': LatencyHistogram}}
+        self.symbols = {}  # {symbol: {step: LatencyHistogram}}（距K线收盘）
+        self.bar_close = None
+        self._wake = None
+        self._traces = []
+
+    def begin_cycle(self, bar_close=None):
+        """
+        开始新周期并记录唤醒延迟。
+
+        参数:
+        bar_close (float): 本周期K线收盘时间戳（秒），启动后的首个周期为 None
+        """
+        self.bar_close = bar_close
+        self._traces = []
+        self._wake = None
+        if bar_close is not None:
+            wake_ms = (self.clock() - bar_close) * 1000
+            self._wake = round(wake_ms, 3)
+            self._histograms('wake')['since_bar_ms'].observe(wake_ms)
+
+    def trace(self, symbol, clock=None):
+        """返回该品种本周期的时间线。"""
+        trace = CycleTrace(symbol, self.bar_close, clock or self.clock)
+        self._traces.append(trace)
+        return trace
+
+    def finish(self, trace):
+        """把一条时间线的各步骤耗时计入直方图。"""
+        if not isinstance(trace, CycleTrace):
+            return
+        per_symbol = self.symbols.setdefault(trace.symbol, {})
+        for event in trace.events:
+            histograms = self._histograms(event['step'])
+            histograms['step_ms'].observe(event['step_ms'])
+            if 'since_bar_ms' in event:
+                histograms['since_bar_ms'].observe(event['since_bar_ms'])
+                per_symbol.setdefault(event['step'], LatencyHistogram()).observe(event['since_bar_ms'])
+
+    def end_cycle(self):
+        """结束本周期：写入明细和直方图指标文件。"""
+        self.cycles += 1
+        if self.cycles_file:
+            record = {'bar_close': self.bar_close, 'wake_ms': self._wake, 'symbols': [t.to_dict() for t in self._traces]}
+            try:
+                os.makedirs(os.path.dirname(self.cycles_file) or '.', exist_ok=True)
+                with open(self.cycles_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except Exception as e:
+                logging.warning(f"延迟明细写入失败: {e}")
+        self.export()
+
+    def snapshot(self):
+        return {
+            'started': self.started,
+            'updated': self.clock(),
+            'cycles': self.cycles,
+            'buckets_ms': list(LATENCY_BUCKETS_MS),
+            'steps': {step: {k: h.to_dict() for k, h in hists.items() if h.count} for step, hists in self.steps.items()},
+            'symbols': {symbol: {step: h.to_dict() for step, h in hists.items()} for symbol, hists in self.symbols.items()},
+        }
+
+    def export(self):
+        """原子写入直方图指标文件（先写临时文件再替换）。"""
+        try:
+            os.makedirs(os.path.dirname(self.metrics_file) or '.', exist_ok=True)
+            tmp_file = f"{self.metrics_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.metrics_file)
+        except Exception as e:
+            logging.warning(f"延迟指标写入失败: {e}")
+
+    def _histograms(self, step):
+        return self.steps.setdefault(step, {'step_ms': LatencyHistogram(), 'since_bar_ms': LatencyHistogram()})
+
+
+_default_recorder = None
+
+
+def start_latency_recorder(metrics_file, cycles_file=None, clock=None):
+    """
+    创建全局延迟记录器。
+
+    返回:
+    LatencyRecorder: 全局记录器
+    """
+    global _default_recorder
+    _default_recorder = LatencyRecorder(metrics_file, cycles_file, clock)
+    return _default_recorder
+
+
+def get_latency_recorder():
+    """返回全局延迟记录器，未启动时返回 None。"""
+    return _default_recorder
+
+
+def start_trace(symbol, clock=None):
+    """
+    为品种开始本周期的时间线，并把品种写入后续日志的上下文；未启动全局记录器时返回 NullTrace。
+    """
+    set_log_context(symbol=symbol)
+    if _default_recorder is None:
+        return NullTrace()
+    return _default_recorder.trace(symbol, clock)
+
+
+def finish_trace(trace):
+    """把时间线汇总到全局记录器（未启动时忽略），并清除日志上下文中的品种。"""
+    set_log_context(symbol=None)
+    if _default_recorder is not None:
+        _default_recorder.finish(trace)
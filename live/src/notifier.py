@@ -0,0 +1,253 @@
+import os
+import queue
+import smtplib
+import logging
+import threading
+import time
+
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+
+class EmailNotifier:
+    """
+    后台邮件通知分发器。
+
+    交易代码只调用 notify() 将消息放入有界队列，SMTP连接、发送和重试都在后台线程完成。
+    后台线程复用同一个SMTP连接；短时间内连续到达的多条消息合并为一封摘要邮件发送。
+
+    参数:
+    to_email (str): 收件人邮箱，默认从环境变量EMAIL_TO读取
+    from_email (str): 发件人邮箱，默认从环境变量EMAIL_FROM读取
+    smtp_server (str): SMTP服务器，默认 'smtp.qq.com'
+    smtp_port (int): SMTP端口，默认 587
+    smtp_user (str): SMTP用户名，默认从环境变量SMTP_USER读取
+    smtp_password (str): SMTP密码，默认从环境变量SMTP_PASSWORD读取
+    use_tls (bool): 是否使用STARTTLS，默认 True（本地测试SMTP可设为False）
+    max_queue (int): 队列容量，队列满时丢弃新消息并记录警告
+    batch_window (float): 收到第一条消息后等待合并的秒数
+    max_batch (int): 单封摘要邮件最多合并的消息数
+    max_retries (int): 发送失败的最大重试次数
+    retry_delay (float): 重试之间的延迟秒数
+    idle_timeout (float): 连接空闲超过该秒数后主动断开
+    """
+
+    def __init__(
+        self,
+        to_email=None,
+        from_email=None,
+        smtp_server='smtp.qq.com',
+        smtp_port=587,
+        smtp_user=None,
+        smtp_password=None,
+        use_tls=True,
+        max_queue=100,
+        batch_window=2.0,
+        max_batch=20,
+        max_retries=3,
+        retry_delay=5.0,
+        idle_timeout=60.0
+    ):
+        self.to_email = to_email if to_email is not None else os.getenv('EMAIL_TO')
+        self.from_email = from_email if from_email is not None else os.getenv('EMAIL_FROM')
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.smtp_user = smtp_user if smtp_user is not None else os.getenv('SMTP_USER')
+        self.smtp_password = smtp_password if smtp_password is not None else os.getenv('SMTP_PASSWORD')
+        self.use_tls = use_tls
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._server = None
+        self._last_used = 0.0
+        self.sent_count = 0
+        self.dropped_count = 0
+
+    def start(self):
+        """启动后台发送线程（重复调用无副作用）。"""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='email-notifier', daemon=True)
+        self._thread.start()
+        return self
+
+    def notify(self, subject, body):
+        """
+        将通知放入队列，立即返回，不做任何网络操作。
+
+        返回:
+        bool: 成功入队返回True，队列已满返回False
+        """
+        try:
+            self._queue.put_nowait((time.time(), subject, body))
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            logging.warning(f"通知队列已满，丢弃邮件: {subject}")
+            return False
+
+    def stop(self, timeout=10.0):
+        """发送完队列中剩余的消息后停止后台线程并关闭连接。"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._close()
+
+    def _run(self):
+        while not self._stop_event.is_set() or not self._queue.empty():
+            batch = self._collect_batch()
+            if batch:
+                self._deliver(batch)
+            elif self._server is not None and time.time() - self._last_used > self.idle_timeout:
+                self._close()
+
+    def _collect_batch(self):
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _build_message(self, batch):
+        if len(batch) == 1:
+            _, subject, body = batch[0]
+        else:
+            subject = f"通知摘要（{len(batch)} 条）: {batch[0][1]}"
+            sections = []
+            for ts, item_subject, item_body in batch:
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+                sections.append(f"[{stamp} UTC] {item_subject}\n{item_body}")
+            body = ("\n\n" + "-" * 30 + "\n\n").join(sections)
+
+        msg = MIMEMultipart()
+        msg['From'] = self.from_email
+        msg['To'] = self.to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+
+    def _connect(self):
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close()
+
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+        if self.use_tls:
+            server.starttls()
+        if self.smtp_user and self.smtp_password:
+            server.login(self.smtp_user, self.smtp_password)
+        self._server = server
+        return server
+
+    def _close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+    def _deliver(self, batch):
+        msg = self._build_message(batch)
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                server = self._connect()
+                server.sendmail(self.from_email, self.to_email, msg.as_string())
+                self._last_used = time.time()
+                self.sent_count += len(batch)
+                logging.info(f"邮件发送成功（合并 {len(batch)} 条通知）。")
+                return True
+            except Exception as e:
+                self._close()
+                logging.warning(f"邮件发送失败 (第 {attempt}/{self.max_retries} 次尝试): {e}")
+                if attempt < self.max_retries:
+                    # 停止过程中事件已置位，不再等待，直接重试
+                    self._stop_event.wait(self.retry_delay)
+        logging.error(f"邮件发送失败，已达到最大重试次数，丢弃 {len(batch)} 条通知。")
+        return False
+
+
+class LogNotifier:
+    """
+    只写日志、不发送邮件的通知器，用于离线回放和测试。
+    """
+
+    def __init__(self):
+        self.sent_count = 0
+        self.dropped_count = 0
+
+    def notify(self, subject, body):
+        self.sent_count += 1
+        logging.debug(f"[通知] {subject}: {body}")
+        return True
+
+    def stop(self, timeout=None):
+        pass
+
+
+_default_notifier = None
+
+
+def start_notifier(dry_run=False, **kwargs):
+    """
+    创建并启动全局邮件通知分发器。
+
+    参数:
+    dry_run (bool): 为True时只记录日志、不连接SMTP（离线回放使用）
+    **kwargs: 传递给 EmailNotifier 的参数
+
+    返回:
+    EmailNotifier: 全局分发器
+    """
+    global _default_notifier
+    if _default_notifier is not None:
+        _default_notifier.stop()
+    _default_notifier = LogNotifier() if dry_run else EmailNotifier(**kwargs).start()
+    return _default_notifier
+
+
+def notify(subject, body):
+    """
+    将邮件通知放入全局分发器队列（未启动时按默认配置自动启动）。
+
+    参数:
+    subject (str): 邮件主题
+    body (str): 邮件正文
+
+    返回:
+    bool: 是否成功入队
+    """
+    global _default_notifier
+    if _default_notifier is None:
+        _default_notifier = EmailNotifier().start()
+    return _default_notifier.notify(subject, body)
+
+
+def stop_notifier(timeout=10.0):
+    """发送完剩余通知后停止全局分发器。"""
+    global _default_notifier
+    if _default_notifier is not None:
+        _default_notifier.stop(timeout)
+        _default_notifier = None
@@ -0,0 +1,247 @@
+import os
+import json
+import logging
+import threading
+import time
+
+from collections import deque
+
+# OKX v5 各接口限速：{端点: (请求数, 窗口秒数)}
+# 每个端点单独计数，行情请求用尽限额时下单/撤单/算法单不受影响，不需要在同一队列里排优先级
+OKX_ENDPOINTS = {
+    'market_candles': (40, 2),         # GET /api/v5/market/candles
+    'public_time': (10, 2),            # GET /api/v5/public/time
+    'public_instruments': (20, 2),     # GET /api/v5/public/instruments
+    'account_positions': (10, 2),      # GET /api/v5/account/positions
+    'account_balance': (10, 2),        # GET /api/v5/account/balance
+    'account_leverage_info': (20, 2),  # GET /api/v5/account/leverage-info
+    'account_set_leverage': (20, 2),   # POST /api/v5/account/set-leverage
+    'trade_order': (60, 2),            # POST /api/v5/trade/order
+    'trade_order_query': (60, 2),      # GET /api/v5/trade/order
+    'trade_orders_pending': (60, 2),   # GET /api/v5/trade/orders-pending
+    'trade_cancel_batch': (300, 2),    # POST /api/v5/trade/cancel-batch-orders
+    'trade_order_algo': (20, 2),       # POST /api/v5/trade/order-algo
+    'trade_amend_algos': (20, 2),      # POST /api/v5/trade/amend-algos
+}
+
+# ccxt 方法到OKX端点的映射，未列出的方法（本地计算、属性等）不限速
+METHOD_ENDPOINTS = {
+    'fetch_ohlcv': 'market_candles',
+    'fetch_time': 'public_time',
+    'load_markets': 'public_instruments',
+    'fetch_positions': 'account_positions',
+    'fetch_balance': 'account_balance',
+    'fetch_leverage': 'account_leverage_info',
+    'set_leverage': 'account_set_leverage',
+    'create_order': 'trade_order',
+    'create_market_buy_order': 'trade_order',
+    'create_market_sell_order': 'trade_order',
+    'create_stop_loss_order': 'trade_order_algo',
+    'create_take_profit_order': 'trade_order_algo',
+    'fetch_order': 'trade_order_query',
+    'fetch_open_orders': 'trade_orders_pending',
+    'cancel_orders': 'trade_cancel_batch',
+    'cancelOrders': 'trade_cancel_batch',
+    'privatePostTradeAmendAlgos': 'trade_amend_algos',
+}
+
+ALGO_ORDER_TYPES = {'trailing_stop', 'conditional', 'oco', 'trigger'}
+
+
+class TokenBucket:
+    """
+    单个端点的令牌桶，另外记录使用率统计。
+
+    令牌桶允许短时突发，再叠加滑动窗口检查，保证任意窗口内的请求数不超过交易所限额。
+
+    参数:
+    rate (int): 窗口内允许的请求数
+    window (float): 限速窗口（秒）
+    """
+
+    def __init__(self, rate, window):
+        self.rate = rate
+        self.window = window
+        self.capacity = max(1.0, float(rate))
+        self.tokens = self.capacity
+        self.refill_per_second = rate / window
+        self._updated = time.monotonic()
+
+        self.calls = 0
+        self.waited_calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.peak_utilisation = 0.0
+        self._recent = deque()  # 最近一个窗口内的请求时刻
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def time_to_token(self, now):
+        """距离下一个可用令牌的秒数；同时保证任意一个限速窗口内的请求数不超过限额。"""
+        wait = max(0.0, (1 - self.tokens) / self.refill_per_second)
+        if self.utilisation(now) >= 1:
+            wait = max(wait, self._recent[0] + self.window - now)
+        return wait
+
+    def record(self, now, wait):
+        self.calls += 1
+        if wait > 0.001:
+            self.waited_calls += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self._recent.append(now)
+        self.peak_utilisation = max(self.peak_utilisation, self.utilisation(now))
+
+    def utilisation(self, now):
+        """最近一个限速窗口内的请求数占限额的比例。"""
+        while self._recent and now - self._recent[0] >= self.window:
+            self._recent.popleft()
+        return len(self._recent) / self.rate
+
+    def to_dict(self, now):
+        return {
+            'limit': f"{self.rate}/{self.window}s",
+            'calls': self.calls,
+            'waited_calls': self.waited_calls,
+            'total_wait_ms': round(self.total_wait * 1000, 3),
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+            'utilisation': round(self.utilisation(now), 4),
+            'peak_utilisation': round(self.peak_utilisation, 4),
+            'headroom': round(1 - self.peak_utilisation, 4),
+        }
+
+
+class RequestScheduler:
+    """
+    按端点限速的交易所请求调度器，替代 ccxt 全局串行的 enableRateLimit。
+
+    每个端点一个令牌桶，不同端点互不阻塞：行情请求在等待令牌时，下单/撤单/算法单使用各自的限额立即发出。
+    多线程共用同一个调度器时线程安全。
+
+    参数:
+    endpoints (dict): {端点: (请求数, 窗口秒数)}，默认 OKX_ENDPOINTS
+    scale (float): 本进程可用的限额比例，多进程共享同一账户/IP时按进程数分配，默认 1.0
+    """
+
+    def __init__(self, endpoints=None, scale=1.0):
+        self.endpoints = endpoints or OKX_ENDPOINTS
+        self.scale = scale
+        self.buckets = self._build_buckets(scale)
+        self._lock = threading.Lock()
+
+    def rescale(self, scale):
+        """按新的限额比例重建令牌桶（多进程分片运行时每个进程按分片数分配限额）。"""
+        with self._lock:
+            self.scale = scale
+            self.buckets = self._build_buckets(scale)
+
+    def _build_buckets(self, scale):
+        return {
+            name: TokenBucket(max(1, int(rate * scale)), window)
+            for name, (rate, window) in self.endpoints.items()
+        }
+
+    def endpoint_for(self, method, args=(), kwargs=None):
+        """
+        返回 ccxt 方法对应的端点名，未知方法返回 None。
+        """
+        endpoint = METHOD_ENDPOINTS.get(method)
+        if endpoint == 'trade_order':
+            kwargs = kwargs or {}
+            order_type = args[1] if len(args) > 1 else kwargs.get('type')
+            params = kwargs.get('params') or (args[5] if len(args) > 5 else {}) or {}
+            if order_type in ALGO_ORDER_TYPES or 'stopLossPrice' in params or 'takeProfitPrice' in params:
+                endpoint = 'trade_order_algo'
+        return endpoint
+
+    def acquire(self, endpoint):
+        """
+        阻塞直到该端点有可用令牌；等待期间不持有锁，其他端点的请求照常发出。
+
+        参数:
+        endpoint (str): 端点名
+
+        返回:
+        float: 等待秒数
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                bucket = self.buckets[endpoint]
+                now = time.monotonic()
+                bucket.refill(now)
+                delay = bucket.time_to_token(now)
+                if delay == 0:
+                    bucket.tokens -= 1
+                    wait = now - start
+                    bucket.record(now, wait)
+                    return wait
+            time.sleep(max(delay, 0.001))
+
+    def wrap(self, exchange):
+        """返回经过本调度器限速的交易所代理对象。"""
+        return RateLimitedExchange(exchange, self)
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'updated': time.time(),
+                'scale': self.scale,
+                'endpoints': {name: bucket.to_dict(now) for name, bucket in self.buckets.items() if bucket.calls},
+            }
+
+    def export(self, metrics_file):
+        """原子写入各端点的使用率指标（JSON）。"""
+        try:
+            os.makedirs(os.path.dirname(metrics_file) or '.', exist_ok=True)
+            tmp_file = f"{metrics_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, metrics_file)
+        except Exception as e:
+            logging.warning(f"限速指标写入失败: {e}")
+
+    def log_summary(self, warn_utilisation=0.7):
+        """记录峰值使用率最高的端点，超过 warn_utilisation 时给出警告。"""
+        endpoints = self.snapshot()['endpoints']
+        if not endpoints:
+            return
+        name, busiest = max(endpoints.items(), key=lambda item: item[1]['peak_utilisation'])
+        message = (f"限速使用率最高的端点: {name}（峰值 {busiest['peak_utilisation'] * 100:.0f}%，限额 {busiest['limit']}，"
+                   f"累计等待 {busiest['total_wait_ms']:.0f} ms）")
+        if busiest['peak_utilisation'] >= warn_utilisation:
+            logging.warning(f"\033[93m{message}\033[0m")
+        else:
+            logging.info(message)
+
+
+class RateLimitedExchange:
+    """
+    ccxt交易所代理：映射到端点的方法调用先经过 RequestScheduler 取令牌，其余属性和方法直接透传。
+
+    参数:
+    exchange: ccxt交易所对象（应关闭 enableRateLimit，避免重复限速）
+    scheduler (RequestScheduler): 请求调度器
+    """
+
+    def __init__(self, exchange, scheduler):
+        object.__setattr__(self, '_exchange', exchange)
+        object.__setattr__(self, '_scheduler', scheduler)
+
+    def __getattr__(self, name):
+        attr = getattr(self._exchange, name)
+        if not callable(attr) or name not in METHOD_ENDPOINTS:
+            return attr
+        scheduler = self._scheduler
+
+        def call(*args, **kwargs):
+            scheduler.acquire(scheduler.endpoint_for(name, args, kwargs))
+            return attr(*args, **kwargs)
+
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._exchange, name, value)
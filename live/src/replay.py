@@ -0,0 +1,462 @@
+import logging
+import itertools
+
+import ccxt
+import numpy as np
+import pandas as pd
+
+# Binance K线CSV的列（2022年以前的月度文件没有表头）
+KLINE_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'count',
+                 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+
+
+class SimClock:
+    """
+    离线回放使用的模拟时钟。
+
+    time() 返回当前模拟Unix时间戳（秒），sleep() 只推进模拟时间、不真正休眠，
+    可直接作为 live_strategy / ema_atr_filter 的 clock 和 sleep 参数传入。
+    """
+
+    def __init__(self, start_ts):
+        self.now = float(start_ts)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def advance_to(self, ts):
+        self.now = max(self.now, float(ts))
+
+
+def load_klines(file_path):
+    """
+    读取回测数据目录中的Binance K线CSV（月度文件或合并文件，有无表头、毫秒或微秒时间戳均可），返回以UTC时间为索引的OHLCV数据。
+
+    参数:
+    file_path (str): CSV文件路径
+
+    返回:
+    pd.DataFrame: 列为 open, high, low, close, volume
+    """
+    # 与回测的 sniff_kline_csv 相同：首行不以数字开头即为表头，没有表头时按Binance列顺序命名
+    with open(file_path, 'r', encoding='utf-8') as f:
+        has_header = not f.readline()[:1].isdigit()
+    data = pd.read_csv(file_path, header=0 if has_header else None, names=None if has_header else KLINE_COLUMNS)
+    # 13位为毫秒时间戳，16位为微秒时间戳（Binance 现货2025年起），其他为日期字符串（合并文件）
+    sample_value = str(data['open_time'].iloc[0]) if not data.empty else ''
+    unit = {13: 'ms', 16: 'us'}.get(len(sample_value)) if sample_value.isdigit() else None
+    if unit:
+        data['open_time'] = pd.to_datetime(data['open_time'], unit=unit)
+    else:
+        data['open_time'] = pd.to_datetime(data['open_time'])
+    data = data.set_index('open_time').sort_index()
+    return data[['open', 'high', 'low', 'close', 'volume']].astype(float)
+
+
+class SimulatedExchange:
+    """
+    由历史K线驱动的模拟交易所，实现实盘代码用到的ccxt方法子集。
+
+    撮合规则:
+    - 市价单按当前时刻已收盘的最后一根基础K线收盘价成交
+    - 止损、止盈、移动止盈按基础K线的最高/最低价触发；同一根K线内止损与止盈都满足时按止损处理（保守）
+    - 持仓平仓后自动撤销该品种剩余的只减仓委托
+
+    参数:
+    data (dict): {symbol: DataFrame}，基础周期K线（如1m或15m），列为 open, high, low, close, volume
+    clock (SimClock): 模拟时钟
+    base_timeframe (str): 基础K线周期，fetch_ohlcv 请求更大周期时在本地聚合
+    contract_values (dict): {symbol: 每张合约对应的币数量}，默认 1
+    taker_fee (float): 手续费率，默认 0
+    balance (float): 初始USDT余额
+    """
+
+    id = 'simulated'
+
+    parse_timeframe = staticmethod(ccxt.Exchange.parse_timeframe)
+
+    def __init__(self, data, clock, base_timeframe='15m', contract_values=None, taker_fee=0.0, balance=10_000.0):
+        self.clock = clock
+        self.base_timeframe = base_timeframe
+        self.base_period = self.parse_timeframe(base_timeframe)
+        self.contract_values = contract_values or {}
+        self.taker_fee = taker_fee
+        self.balance = balance
+
+        self._bars = {}
+        for symbol, df in data.items():
+            self._bars[symbol] = {
+                'ts': df.index.values.astype('datetime64[s]').astype(np.int64),
+                'open': df['open'].to_numpy(dtype=float),
+                'high': df['high'].to_numpy(dtype=float),
+                'low': df['low'].to_numpy(dtype=float),
+                'close': df['close'].to_numpy(dtype=float),
+                'volume': df['volume'].to_numpy(dtype=float),
+            }
+        self._resampled = {}
+        self._cursor = {symbol: 0 for symbol in self._bars}
+        self._positions = {}
+        self._orders = {}
+        self._ids = itertools.count(1)
+        self.leverage = {}
+        self.trades = []
+        self.call_counts = {}
+
+    # ---- 基础工具 ----
+
+    def _count(self, name):
+        self.call_counts[name] = self.call_counts.get(name, 0) + 1
+
+    def market_id(self, symbol):
+        return symbol
+
+    def price_to_precision(self, symbol, price):
+        return repr(round(float(price), 10))
+
+    def fetch_time(self, params={}):
+        self._count('fetch_time')
+        return int(self.clock.time() * 1000)
+
+    def fetch_balance(self, params={}):
+        self._count('fetch_balance')
+        return {'total': {'USDT': self.balance}, 'free': {'USDT': self.balance}}
+
+    def load_markets(self, reload=False, params={}):
+        return {symbol: {'id': symbol, 'symbol': symbol} for symbol in self._bars}
+
+    def fetch_leverage(self, symbol, params={}):
+        lev = self.leverage.get(symbol)
+        return {'symbol': symbol, 'longLeverage': lev, 'shortLeverage': lev}
+
+    def set_leverage(self, leverage, symbol, params={}):
+        self._count('set_leverage')
+        self.leverage[symbol] = int(leverage)
+        return {}
+
+    # ---- 行情 ----
+
+    def _timeframe_bars(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        if key not in self._resampled:
+            base = self._bars[symbol]
+            period = self.parse_timeframe(timeframe)
+            if period == self.base_period:
+                self._resampled[key] = base
+            else:
+                # 按周期边界分组聚合，reduceat 一次完成
+                bucket = base['ts'] // period * period
+                starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+                ends = np.r_[starts[1:], len(bucket)] - 1
+                self._resampled[key] = {
+                    'ts': bucket[starts],
+                    'open': base['open'][starts],
+                    'high': np.maximum.reduceat(base['high'], starts),
+                    'low': np.minimum.reduceat(base['low'], starts),
+                    'close': base['close'][ends],
+                    'volume': np.add.reduceat(base['volume'], starts),
+                }
+        return self._resampled[key]
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=100, params={}):
+        """
+        返回截至当前模拟时间的K线，最后一根为正在形成的K线（与交易所一致，只含开盘价）。
+        传入 since（毫秒）时从该时间起向后返回最多 limit 根。
+        """
+        self._count('fetch_ohlcv')
+        self._sync()
+        bars = self._timeframe_bars(symbol, timeframe)
+        period = self.parse_timeframe(timeframe)
+        now = self.clock.time()
+        end = int(np.searchsorted(bars['ts'], now - period, side='right'))  # 已收盘的K线
+        start = max(0, end - (limit - 1))
+        if since is not None:
+            start = int(np.searchsorted(bars['ts'], since / 1000))
+            if end - start >= limit:
+                end = start + limit
+                return [
+                    [int(bars['ts'][i]) * 1000, bars['open'][i], bars['high'][i], bars['low'][i], bars['close'][i], bars['volume'][i]]
+                    for i in range(start, end)
+                ]
+        rows = [
+            [int(bars['ts'][i]) * 1000, bars['open'][i], bars['high'][i], bars['low'][i], bars['close'][i], bars['volume'][i]]
+            for i in range(start, end)
+        ]
+        if end < len(bars['ts']) and bars['ts'][end] <= now:
+            forming_open = bars['open'][end]
+            rows.append([int(bars['ts'][end]) * 1000, forming_open, forming_open, forming_open, forming_open, 0.0])
+        return rows
+
+    def last_price(self, symbol):
+        bars = self._bars[symbol]
+        idx = self._cursor[symbol] - 1
+        if idx < 0:
+            raise ccxt.ExchangeError(f"{symbol} 在当前模拟时间之前没有K线数据")
+        return float(bars['close'][idx])
+
+    # ---- 持仓与订单 ----
+
+    def fetch_positions(self, symbols=None, params={}):
+        self._count('fetch_positions')
+        self._sync()
+        result = []
+        for symbol, pos in self._positions.items():
+            if symbols and symbol not in symbols:
+                continue
+            result.append({
+                'symbol': symbol,
+                'contracts': pos['contracts'],
+                'side': 'long' if pos['direction'] > 0 else 'short',
+                'entryPrice': pos['entry_price'],
+            })
+        return result
+
+    def _new_order(self, symbol, type, side, amount, **fields):
+        order = {
+            'id': str(next(self._ids)),
+            'symbol': symbol,
+            'type': type,
+            'side': side,
+            'amount': float(amount),
+            'filled': 0.0,
+            'average': None,
+            'status': 'open',
+            'timestamp': int(self.clock.time() * 1000),
+        }
+        order.update(fields)
+        self._orders[order['id']] = order
+        return order
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        self._count('create_order')
+        self._sync()
+        params = dict(params or {})
+        if type == 'market':
+            client_id = params.get('clientOrderId', params.get('clOrdId'))
+            if client_id is not None and any(o.get('clientOrderId') == client_id for o in self._orders.values()):
+                # 与OKX一致：客户端订单ID重复的请求被拒绝
+                raise ccxt.InvalidOrder(f"客户端订单ID重复: {client_id}")
+            order = self._new_order(symbol, 'market', side, amount, clientOrderId=client_id)
+            self._fill(order, self.last_price(symbol), reason='entry' if not params.get('reduceOnly') else 'close')
+            for algo in params.get('attachAlgoOrds', []):
+                self._attach_brackets(symbol, side, order['filled'], algo)
+            return dict(order)
+        if type == 'trailing_stop':
+            order = self._new_order(
+                symbol, 'trailing_stop', side, amount,
+                reduceOnly=True,
+                callback=float(params['callbackSpread']),
+                active_price=float(params['activePx']),
+                activated=False,
+                extreme=None,
+            )
+            return dict(order)
+        raise ccxt.NotSupported(f"模拟交易所不支持订单类型: {type}")
+
+    def create_market_buy_order(self, symbol, amount, params={}):
+        return self.create_order(symbol, 'market', 'buy', amount, params=params)
+
+    def create_market_sell_order(self, symbol, amount, params={}):
+        return self.create_order(symbol, 'market', 'sell', amount, params=params)
+
+    def create_stop_loss_order(self, symbol, type, side, amount, price=None, stopLossPrice=None, params={}):
+        self._count('create_stop_loss_order')
+        order = self._new_order(symbol, 'stop_loss', side, amount, trigger_price=float(stopLossPrice), limit_price=None, reduceOnly=True)
+        return dict(order)
+
+    def create_take_profit_order(self, symbol, type, side, amount, price=None, takeProfitPrice=None, params={}):
+        self._count('create_take_profit_order')
+        order = self._new_order(
+            symbol, 'take_profit', side, amount,
+            trigger_price=float(takeProfitPrice),
+            limit_price=float(price) if type == 'limit' and price is not None else None,
+            reduceOnly=True,
+        )
+        return dict(order)
+
+    def _attach_brackets(self, symbol, entry_side, amount, algo):
+        exit_side = 'sell' if entry_side == 'buy' else 'buy'
+        self._new_order(
+            symbol, 'oco', exit_side, amount,
+            clientOrderId=algo.get('attachAlgoClOrdId'),
+            sl_trigger=float(algo['slTriggerPx']),
+            tp_trigger=float(algo['tpTriggerPx']),
+            tp_limit=float(algo['tpOrdPx']) if algo.get('tpOrdPx', '-1') != '-1' else None,
+            reduceOnly=True,
+        )
+
+    def privatePostTradeAmendAlgos(self, params):
+        self._count('amend_algos')
+        for order in self._orders.values():
+            if order['status'] == 'open' and order['type'] == 'oco' and order.get('clientOrderId') == params.get('algoClOrdId'):
+                order['sl_trigger'] = float(params.get('newSlTriggerPx', order['sl_trigger']))
+                order['tp_trigger'] = float(params.get('newTpTriggerPx', order['tp_trigger']))
+                if params.get('newTpOrdPx') not in (None, '-1'):
+                    order['tp_limit'] = float(params['newTpOrdPx'])
+                return {'code': '0', 'data': [{'algoClOrdId': params.get('algoClOrdId'), 'sCode': '0'}]}
+        raise ccxt.OrderNotFound(f"未找到算法订单: {params.get('algoClOrdId')}")
+
+    def fetch_order(self, id, symbol=None, params={}):
+        self._count('fetch_order')
+        client_id = (params or {}).get('clientOrderId')
+        if client_id is not None:
+            id = next((i for i, o in self._orders.items() if o.get('clientOrderId') == client_id), None)
+        if id not in self._orders:
+            raise ccxt.OrderNotFound(f"订单不存在: {id}")
+        return dict(self._orders[id])
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        self._count('fetch_open_orders')
+        self._sync()
+        return [dict(o) for o in self._orders.values() if o['status'] == 'open' and (symbol is None or o['symbol'] == symbol)]
+
+    def cancel_orders(self, ids, symbol=None, params={}):
+        self._count('cancel_orders')
+        for order_id in ids:
+            order = self._orders.get(order_id)
+            if order is not None and order['status'] == 'open':
+                order['status'] = 'canceled'
+        return [dict(self._orders[i]) for i in ids if i in self._orders]
+
+    cancelOrders = cancel_orders
+
+    # ---- 撮合 ----
+
+    def _fill(self, order, price, reason, ts=None):
+        symbol = order['symbol']
+        direction = 1 if order['side'] == 'buy' else -1
+        amount = order['amount']
+        pos = self._positions.get(symbol)
+        cv = self.contract_values.get(symbol, 1.0)
+        if ts is None:
+            ts = self.clock.time()
+
+        if pos is not None and pos['direction'] != direction:
+            # 平仓（只减仓，不反手）
+            amount = min(amount, pos['contracts'])
+            gross = (price - pos['entry_price']) * pos['direction'] * amount * cv
+            fee = (price + pos['entry_price']) * amount * cv * self.taker_fee
+            self.balance += gross - fee
+            self.trades.append({
+                'symbol': symbol,
+                'side': 'long' if pos['direction'] > 0 else 'short',
+                'entry_time': pd.to_datetime(pos['entry_ts'], unit='s', utc=True),
+                'exit_time': pd.to_datetime(ts, unit='s', utc=True),
+                'entry_price': pos['entry_price'],
+                'exit_price': price,
+                'contracts': amount,
+                'pnl': gross - fee,
+                'exit_reason': reason,
+            })
+            pos['contracts'] -= amount
+            if pos['contracts'] <= 1e-12:
+                del self._positions[symbol]
+                self._cancel_reduce_only(symbol)
+        elif order.get('reduceOnly'):
+            order['status'] = 'canceled'
+            return
+        elif pos is None:
+            self._positions[symbol] = {'direction': direction, 'contracts': amount, 'entry_price': price, 'entry_ts': ts}
+        else:
+            total = pos['contracts'] + amount
+            pos['entry_price'] = (pos['entry_price'] * pos['contracts'] + price * amount) / total
+            pos['contracts'] = total
+
+        order['filled'] = amount
+        order['average'] = price
+        order['status'] = 'closed'
+
+    def _cancel_reduce_only(self, symbol):
+        for order in self._orders.values():
+            if order['symbol'] == symbol and order['status'] == 'open' and order.get('reduceOnly'):
+                order['status'] = 'canceled'
+
+    def _sync(self):
+        """处理当前模拟时间之前已收盘、尚未撮合的所有基础K线。"""
+        now = self.clock.time()
+        for symbol, bars in self._bars.items():
+            cursor = self._cursor[symbol]
+            end = int(np.searchsorted(bars['ts'], now - self.base_period, side='right'))
+            for i in range(cursor, end):
+                if symbol in self._positions:
+                    self._match_bar(symbol, bars['ts'][i] + self.base_period, bars['high'][i], bars['low'][i])
+            self._cursor[symbol] = max(cursor, end)
+
+    def _match_bar(self, symbol, bar_close_ts, high, low):
+        for order in list(self._orders.values()):
+            if order['symbol'] != symbol or order['status'] != 'open' or symbol not in self._positions:
+                continue
+            exit_dir = 1 if order['side'] == 'buy' else -1  # 买入平空 / 卖出平多
+            price, reason = self._trigger_price(order, exit_dir, high, low)
+            if price is not None:
+                # 成交时间记为触发所在K线的收盘时刻
+                self._fill(order, price, reason, ts=float(bar_close_ts))
+
+    def _trigger_price(self, order, exit_dir, high, low):
+        def stop_hit(trigger):
+            return high >= trigger if exit_dir > 0 else low <= trigger
+
+        def target_hit(trigger):
+            return low <= trigger if exit_dir > 0 else high >= trigger
+
+        if order['type'] == 'stop_loss':
+            if stop_hit(order['trigger_price']):
+                return order['trigger_price'], 'stop_loss'
+        elif order['type'] == 'take_profit':
+            limit = order['limit_price'] if order['limit_price'] is not None else order['trigger_price']
+            if target_hit(order['trigger_price']) and target_hit(limit):
+                return limit, 'take_profit'
+        elif order['type'] == 'oco':
+            if stop_hit(order['sl_trigger']):
+                return order['sl_trigger'], 'stop_loss'
+            limit = order['tp_limit'] if order['tp_limit'] is not None else order['tp_trigger']
+            if target_hit(order['tp_trigger']) and target_hit(limit):
+                return limit, 'take_profit'
+        elif order['type'] == 'trailing_stop':
+            favourable = low if exit_dir > 0 else high
+            if not order['activated']:
+                if (exit_dir > 0 and low <= order['active_price']) or (exit_dir < 0 and high >= order['active_price']):
+                    order['activated'] = True
+                    order['extreme'] = favourable
+                else:
+                    return None, None
+            order['extreme'] = min(order['extreme'], low) if exit_dir > 0 else max(order['extreme'], high)
+            stop = order['extreme'] + exit_dir * order['callback']
+            if stop_hit(stop):
+                return stop, 'trailing_stop'
+        return None, None
+
+
+def run_replay(exchange, clock, step, end_ts, timeframe='15m', margin=0.3):
+    """
+    以模拟时钟逐根K线驱动实盘循环，代替 scheduler.wait_next_bar()。
+
+    参数:
+    exchange (SimulatedExchange): 模拟交易所
+    clock (SimClock): 模拟时钟
+    step (callable): 每根K线收盘后执行的一次实盘循环，如对每个品种调用 live_strategy
+    end_ts (float): 回放结束时间戳（秒）
+    timeframe (str): 循环周期，默认 '15m'
+    margin (float): K线收盘后的唤醒余量（秒）
+
+    返回:
+    pd.DataFrame: 回放期间的全部已平仓交易
+    """
+    period = exchange.parse_timeframe(timeframe)
+    cycles = 0
+    while True:
+        bar_close = (int(clock.time() // period) + 1) * period
+        if bar_close > end_ts:
+            break
+        clock.advance_to(bar_close + margin)
+        step()
+        cycles += 1
+    clock.advance_to(end_ts)
+    exchange._sync()
+
+    trades = pd.DataFrame(exchange.trades)
+    logging.info(f"回放完成：{cycles} 个周期，{len(trades)} 笔交易，期末余额 {exchange.balance:.2f} USDT")
+    return trades
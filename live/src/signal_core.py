@@ -0,0 +1,222 @@
+import numpy as np
+import talib
+
+# 本文件在 back_test/src、live/src、live_vps/src 中各有一份，内容必须完全一致，
+# back_test/signal_parity.py 会校验三份副本以及向量化/逐根两种计算方式的信号一致性。
+
+UPPER_BREAKOUT = 1
+LOWER_BREAKOUT = -1
+NO_SIGNAL = 0
+
+
+def hour_allowed(hour, forbidden_hours):
+    """
+    检查某个UTC小时是否允许交易。
+
+    参数:
+    hour (int): UTC小时 (0-23)
+    forbidden_hours (list): 禁止交易时段列表，如 [[23, 2], [12, 17]]，支持跨天
+
+    返回:
+    bool: True 如果允许交易
+    """
+    for start, end in forbidden_hours or []:
+        if start <= end:
+            if start <= hour <= end:
+                return False
+        elif hour >= start or hour <= end:
+            return False
+    return True
+
+
+def allowed_hours_mask(hours, forbidden_hours):
+    """
+    hour_allowed 的向量化版本。
+
+    参数:
+    hours (np.ndarray): 每根K线开盘时间的UTC小时
+    forbidden_hours (list): 禁止交易时段列表
+
+    返回:
+    np.ndarray: 布尔数组，True 表示允许交易
+    """
+    hours = np.asarray(hours)
+    allowed = np.ones(len(hours), dtype=bool)
+    for start, end in forbidden_hours or []:
+        if start <= end:
+            allowed &= ~((hours >= start) & (hours <= end))
+        else:
+            allowed &= ~((hours >= start) | (hours <= end))
+    return allowed
+
+
+def compute_indicators(high, low, close, ema_period, atr_period):
+    """
+    计算EMA和ATR（TA-Lib）。
+
+    返回:
+    tuple: (ema, atr) 两个 np.ndarray
+    """
+    close = np.asarray(close, dtype=float)
+    ema = talib.EMA(close, timeperiod=ema_period)
+    atr = talib.ATR(np.asarray(high, dtype=float), np.asarray(low, dtype=float), close, timeperiod=atr_period)
+    return ema, atr
+
+
+def entry_signals(open_, high, low, close, volume, hours, ema_period, atr_period, multiplier,
+                  atr_threshold_pct=0, volume_multiplier=1.0, forbidden_hours=None, ema=None, atr=None):
+    """
+    向量化计算每根K线收盘时的EMA-ATR通道突破信号。
+
+    第 i 根K线产生信号的条件（全部满足）:
+    - ATR/收盘价 不低于 atr_threshold_pct
+    - 第 i 根与第 i-1 根K线颜色一致
+    - 第 i 根成交量大于第 i-1 根成交量的 volume_multiplier 倍
+    - 第 i 根K线开盘时间所在小时不在 forbidden_hours 内
+    - 上突破：第 i-1 根收盘价低于上轨且第 i 根收盘价高于上轨；下突破与之对称
+
+    参数:
+    open_, high, low, close, volume: K线数组
+    hours: 每根K线开盘时间的UTC小时数组
+    ema_period, atr_period, multiplier: 通道参数
+    atr_threshold_pct: ATR波动率阈值（基于收盘价的比例）
+    volume_multiplier: 成交量倍数
+    forbidden_hours: 禁止交易时段列表
+    ema, atr: 已计算好的指标（可选，避免重复计算）
+
+    返回:
+    np.ndarray: int8 数组，1 为上突破，-1 为下突破，0 为无信号
+    """
+    open_ = np.asarray(open_, dtype=float)
+    close = np.asarray(close, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    if ema is None or atr is None:
+        ema, atr = compute_indicators(high, low, close, ema_period, atr_period)
+    else:
+        ema = np.asarray(ema, dtype=float)
+        atr = np.asarray(atr, dtype=float)
+
+    signals = np.zeros(len(close), dtype=np.int8)
+    if len(close) < 2:
+        return signals
+
+    upper = ema + atr * multiplier
+    lower = ema - atr * multiplier
+    color = close > open_
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        low_volatility = atr / close < atr_threshold_pct
+        valid = (
+            ~low_volatility[1:]
+            & (color[1:] == color[:-1])
+            & (volume[1:] > volume[:-1] * volume_multiplier)
+            & allowed_hours_mask(hours, forbidden_hours)[1:]
+        )
+        upper_breakout = (close[:-1] < upper[:-1]) & (close[1:] > upper[1:])
+        lower_breakout = (lower[:-1] < close[:-1]) & (lower[1:] > close[1:])
+
+    signals[1:] = np.where(valid & upper_breakout, UPPER_BREAKOUT, np.where(valid & lower_breakout, LOWER_BREAKOUT, NO_SIGNAL))
+    return signals
+
+
+class IncrementalSignal:
+    """
+    逐根K线更新的信号计算器，与 entry_signals 规则相同，EMA/ATR 按 TA-Lib 的递推方式维护，
+    每根新K线只需 O(1) 计算，适合实盘在每个周期只喂入刚收盘的K线。
+
+    参数:
+    ema_period, atr_period, multiplier: 通道参数
+    atr_threshold_pct: ATR波动率阈值
+    volume_multiplier: 成交量倍数
+    forbidden_hours: 禁止交易时段列表
+
+    属性:
+    ema, atr: 最新K线的指标值（预热期为 nan）
+    signal: 最新K线的信号
+    reason: 无信号时的原因，取值 'warmup', 'low_volatility', 'color_mismatch', 'low_volume', 'forbidden_hour', 'no_breakout'
+    last_ts: 最新喂入K线的时间戳
+    """
+
+    def __init__(self, ema_period, atr_period, multiplier, atr_threshold_pct=0, volume_multiplier=1.0, forbidden_hours=None):
+        self.ema_period = ema_period
+        self.atr_period = atr_period
+        self.multiplier = multiplier
+        self.atr_threshold_pct = atr_threshold_pct
+        self.volume_multiplier = volume_multiplier
+        self.forbidden_hours = forbidden_hours or []
+
+        self.count = 0
+        self.ema = np.nan
+        self.atr = np.nan
+        self._ema_k = 2.0 / (ema_period + 1)
+        self._ema_sum = 0.0
+        self._tr_sum = 0.0
+        self._prev = None  # (open, close, volume, upper, lower)
+        self.signal = NO_SIGNAL
+        self.reason = 'warmup'
+        self.last_ts = None
+
+    def _update_indicators(self, high, low, close):
+        n = self.count  # 当前K线的下标
+        # EMA：前 ema_period 根的简单平均作为种子，之后递推
+        if n < self.ema_period:
+            self._ema_sum += close
+            if n == self.ema_period - 1:
+                self.ema = self._ema_sum / self.ema_period
+        else:
+            self.ema = (close - self.ema) * self._ema_k + self.ema
+
+        # ATR：真实波幅从第二根K线开始，前 atr_period 个的简单平均作为种子，之后按 Wilder 平滑
+        if n >= 1:
+            prev_close = self._prev[1]
+            tr = max(high - low, abs(prev_close - high), abs(prev_close - low))
+            if self.atr_period <= 1:
+                self.atr = tr
+            elif n <= self.atr_period:
+                self._tr_sum += tr
+                if n == self.atr_period:
+                    self.atr = self._tr_sum / self.atr_period
+            else:
+                self.atr = (self.atr * (self.atr_period - 1) + tr) / self.atr_period
+
+    def update(self, open_, high, low, close, volume, hour, ts=None):
+        """
+        喂入一根已收盘的K线并返回该K线的信号。
+
+        参数:
+        open_, high, low, close, volume: K线数据
+        hour (int): 该K线开盘时间的UTC小时
+        ts: K线时间戳（可选，记录在 last_ts）
+
+        返回:
+        int: 1 上突破，-1 下突破，0 无信号
+        """
+        open_, high, low, close, volume = float(open_), float(high), float(low), float(close), float(volume)
+        self._update_indicators(high, low, close)
+        upper = self.ema + self.atr * self.multiplier
+        lower = self.ema - self.atr * self.multiplier
+
+        signal, reason = NO_SIGNAL, 'warmup'
+        if self._prev is not None:
+            prev_open, prev_close, prev_volume, prev_upper, prev_lower = self._prev
+            if self.atr / close < self.atr_threshold_pct:
+                reason = 'low_volatility'
+            elif (close > open_) != (prev_close > prev_open):
+                reason = 'color_mismatch'
+            elif not volume > prev_volume * self.volume_multiplier:
+                reason = 'low_volume'
+            elif not hour_allowed(hour, self.forbidden_hours):
+                reason = 'forbidden_hour'
+            elif prev_close < prev_upper and close > upper:
+                signal, reason = UPPER_BREAKOUT, None
+            elif prev_lower < prev_close and lower > close:
+                signal, reason = LOWER_BREAKOUT, None
+            else:
+                reason = 'no_breakout'
+
+        self._prev = (open_, close, volume, upper, lower)
+        self.count += 1
+        self.signal = signal
+        self.reason = reason
+        self.last_ts = ts
+        return signal
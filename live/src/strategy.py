@@ -4,22 +4,31 @@ from datetime import datetime, timezone
 import logging
 from logging.handlers import RotatingFileHandler
 
+import ccxt
 from dotenv import load_dotenv
-from .utils import send_email_notification, setup_logging, time_checker, wait_time
+from .utils import setup_logging, time_checker, wait_time
+from .notifier import notify
 from .signals import ema_atr_filter
-from .exit_mechanism import set_stop_loss_and_take_profit
+from .exit_mechanism import set_stop_loss_and_take_profit, place_entry_with_brackets, reanchor_attached_brackets, new_entry_client_id, submit_order_idempotent
+from .latency import NullTrace, start_trace, finish_trace
+from .journal import journal_call
 
 
-def live_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, SL_ATR_MULTIPLIER, RR, RISK_USDT, FIXED_LEVERAGE, TP_MODE, CONTRACT_SIZE, forbidden_hours=None):
+def live_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, SL_ATR_MULTIPLIER, RR, RISK_USDT, FIXED_LEVERAGE, TP_MODE, CONTRACT_SIZE, forbidden_hours=None, ENTRY_MODE='separate', REANCHOR_BRACKETS=True, VOLUME_MULTIPLIER=1.0, TIMEFRAME='15m', clock=None, sleep=None):
     """
     实盘交易策略：根据EMA和ATR过滤器生成信号，执行交易并设置止盈止损。
     """
+    if clock is None:
+        clock = time.time
+    trace = start_trace(SYMBOL, clock)  # 本周期该品种的延迟时间线
     try:
-        now = datetime.now(timezone.utc)
+        if sleep is None:
+            sleep = time.sleep
+        now = datetime.fromtimestamp(clock(), timezone.utc)
         hour = now.hour
 
         # 获取信号和ATR值
-        mark, atr_value = ema_atr_filter(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, forbidden_hours)
+        mark, atr_value, signal_close = ema_atr_filter(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, forbidden_hours, timeframe=TIMEFRAME, clock=clock, sleep=sleep, volume_multiplier=VOLUME_MULTIPLIER, trace=trace)
 
         # strategy_type = time_checker(hour)  # 移到此处，确保始终定义
         strategy_type = 'trend_following'  
@@ -46,10 +55,11 @@ def live_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRE
             logging.info(f"\033[94m币种 {SYMBOL} 无交易信号。\033[0m")
             return
         else:
-            # 发送邮件通知
+            # 邮件通知放入后台队列发送，不阻塞下单
             subject = "交易信号触发"
             body = f"时间: {now}\n信号: {signal}\n策略类型: {strategy_type}\nATR值: {atr_value}"
-            send_email_notification(subject, body)
+            notify(subject, body)
+            journal_call('record_signal', SYMBOL, signal, mark=mark, atr=atr_value, signal_close=signal_close)
             
             # 取消当前所有委托
             try:
@@ -62,6 +72,7 @@ def live_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRE
                     logging.info("无开放委托。")
             except Exception as e:
                 logging.error(f"取消委托失败: {e}")
+            trace.mark('cancel_orders')
         
         # 计算止损和止盈距离
         sl_distance = atr_value * SL_ATR_MULTIPLIER
@@ -72,83 +83,29 @@ def live_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRE
         logging.info(f"计算得张数: {size:.2f}")
         logging.info(f"ATR值: {atr_value}")
             
-        entry_price = None
-        sl_order_id = None
-        tp_order_id = None
-        trailing_order_id = None
-
-        if signal == 'long_entry':
-            # 多头入场
-            order = exchange.create_market_buy_order(SYMBOL, size, params={'posSide': 'long'})
-            order_id = order['id']
-            logging.info(f"\033[92m市价买入订单已提交，订单ID: {order_id}\033[0m")
-            time.sleep(1)
-            filled_order = exchange.fetch_order(order_id, SYMBOL)
-            if filled_order and filled_order['status'] == 'closed' and filled_order['average']:
-                entry_price = filled_order['average']
-                logging.info(f"\033[92m订单已成交，实际入场价: {entry_price}\033[0m")
-            else:
-                logging.error("错误：无法获取订单成交价，取消设置止盈止损。")
-                return
-            actual_size = float(filled_order.get('filled', filled_order.get('amount', size)))
-            if actual_size <= 0:
-                logging.error("错误：成交张数为0，取消止损止盈设置。")
-                return
-
-            logging.info(f"\033[92m实际张数: {actual_size:.2f}\033[0m")
-            # 计算保证金
-            margin = (actual_size * 0.01 * entry_price) / FIXED_LEVERAGE
-            logging.info(f"\033[92m保证金: {margin:.2f} USDT\033[0m")
-
-            # 设置止盈止损
-            sl_price = entry_price - sl_distance
-            tp_price = entry_price + tp_distance
-            logging.info(f"\033[92m止损价格: {sl_price}, 止盈价格: {tp_price}\033[0m")
-            sl_order_id, tp_order_id, trailing_order_id = set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_price, tp_price, actual_size, TP_MODE, is_simulation=False)
-
-        elif signal == 'short_entry':
-            # 空头入场
-            order = exchange.create_market_sell_order(SYMBOL, size, params={'posSide': 'short'})
-            order_id = order['id']
-            logging.info(f"\033[92m市价卖出订单已提交，订单ID: {order_id}\033[0m")
-            time.sleep(1)
-            filled_order = exchange.fetch_order(order_id, SYMBOL)
-            if filled_order and filled_order['status'] == 'closed' and filled_order['average']:
-                entry_price = filled_order['average']
-                logging.info(f"\033[92m订单已成交，实际入场价: {entry_price}\033[0m")
-            else:
-                logging.error("错误：无法获取订单成交价，取消设置止盈止损。")
-                return
-            actual_size = float(filled_order.get('filled', filled_order.get('amount', size)))
-            if actual_size <= 0:
-                logging.error("错误：成交张数为0，取消止损止盈设置。")
-                return
-            
-            logging.info(f"\033[92m实际张数: {actual_size:.2f}\033[0m")
-            # 计算保证金
-            margin = (actual_size * 0.01 * entry_price) / FIXED_LEVERAGE
-            logging.info(f"\033[92m保证金: {margin:.2f} USDT\033[0m")
-            
-            # 设置止盈止损
-            sl_price = entry_price + sl_distance
-            tp_price = entry_price - tp_distance
-            logging.info(f"\033[92m止损价格: {sl_price}, 止盈价格: {tp_price}\033[0m")
-            sl_order_id, tp_order_id, trailing_order_id = set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_price, tp_price, actual_size, TP_MODE, is_simulation=False)
+        execute_entry(exchange, SYMBOL, signal, size, signal_close, sl_distance, tp_distance, FIXED_LEVERAGE, TP_MODE, ENTRY_MODE, REANCHOR_BRACKETS, is_simulation=False, sleep=sleep, trace=trace)
 
     except Exception as e:
         logging.error(f"策略执行失败: {e}")
+    finally:
+        finish_trace(trace)
 
 
-def test_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, SL_ATR_MULTIPLIER, RR, RISK_USDT, FIXED_LEVERAGE, TP_MODE, CONTRACT_SIZE, forbidden_hours=None):
+def test_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, SL_ATR_MULTIPLIER, RR, RISK_USDT, FIXED_LEVERAGE, TP_MODE, CONTRACT_SIZE, forbidden_hours=None, ENTRY_MODE='separate', REANCHOR_BRACKETS=True, VOLUME_MULTIPLIER=1.0, TIMEFRAME='15m', clock=None, sleep=None):
     """
     模拟交易策略：与实盘类似，但不指定posSide。
     """
+    if clock is None:
+        clock = time.time
+    trace = start_trace(SYMBOL, clock)  # 本周期该品种的延迟时间线
     try:
-        now = datetime.now(timezone.utc)
+        if sleep is None:
+            sleep = time.sleep
+        now = datetime.fromtimestamp(clock(), timezone.utc)
         hour = now.hour
 
         # 获取信号和ATR值
-        mark, atr_value = ema_atr_filter(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, forbidden_hours)
+        mark, atr_value, signal_close = ema_atr_filter(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRESHOLD_PCT, forbidden_hours, timeframe=TIMEFRAME, clock=clock, sleep=sleep, volume_multiplier=VOLUME_MULTIPLIER, trace=trace)
 
         # strategy_type = time_checker(hour)  # 移到此处，确保始终定义
         strategy_type = 'trend_following'  
@@ -175,10 +132,11 @@ def test_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRE
             logging.info(f"\033[94m币种 {SYMBOL} 无交易信号。\033[0m")
             return
         else:
-            # 发送邮件通知
+            # 邮件通知放入后台队列发送，不阻塞下单
             subject = "交易信号触发"
             body = f"时间: {now}\n信号: {signal}\n策略类型: {strategy_type}\nATR值: {atr_value}"
-            send_email_notification(subject, body)
+            notify(subject, body)
+            journal_call('record_signal', SYMBOL, signal, mark=mark, atr=atr_value, signal_close=signal_close)
             
             # 取消当前所有委托
             try:
@@ -191,6 +149,7 @@ def test_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRE
                     logging.info("无开放委托。")
             except Exception as e:
                 logging.error(f"取消委托失败: {e}")
+            trace.mark('cancel_orders')
         
         # 计算止损和止盈距离
         sl_distance = atr_value * SL_ATR_MULTIPLIER
@@ -201,70 +160,111 @@ def test_strategy(exchange, SYMBOL, EMA_PERIOD, ATR_PERIOD, MULTIPLIER, ATR_THRE
         logging.info(f"计算得张数: {size:.2f}")
         logging.info(f"ATR值: {atr_value}")
             
-        entry_price = None
-        sl_order_id = None
-        tp_order_id = None
-        trailing_order_id = None
+        execute_entry(exchange, SYMBOL, signal, size, signal_close, sl_distance, tp_distance, FIXED_LEVERAGE, TP_MODE, ENTRY_MODE, REANCHOR_BRACKETS, is_simulation=True, sleep=sleep, trace=trace)
 
-        if signal == 'long_entry':
-            # 多头入场
-            order = exchange.create_market_buy_order(SYMBOL, size)
-            order_id = order['id']
-            logging.info(f"\033[92m市价买入订单已提交，订单ID: {order_id}\033[0m")
-            time.sleep(1)
-            filled_order = exchange.fetch_order(order_id, SYMBOL)
-            if filled_order and filled_order['status'] == 'closed' and filled_order['average']:
-                entry_price = filled_order['average']
-                logging.info(f"\033[92m订单已成交，实际入场价: {entry_price}\033[0m")
-            else:
-                logging.error("错误：无法获取订单成交价，取消设置止盈止损。")
-                return
-            actual_size = float(filled_order.get('filled', filled_order.get('amount', size)))
-            if actual_size <= 0:
-                logging.error("错误：成交张数为0，取消止损止盈设置。")
-                return
+    except Exception as e:
+        logging.error(f"策略执行失败: {e}")
+    finally:
+        finish_trace(trace)
 
-            logging.info(f"\033[92m实际张数: {actual_size:.2f}\033[0m")
-            # 计算保证金
-            margin = (actual_size * 0.01 * entry_price) / FIXED_LEVERAGE
-            logging.info(f"\033[92m保证金: {margin:.2f} USDT\033[0m")
 
-            # 设置止盈止损
-            sl_price = entry_price - sl_distance
-            tp_price = entry_price + tp_distance
-            logging.info(f"\033[92m止损价格: {sl_price}, 止盈价格: {tp_price}\033[0m")
-            sl_order_id, tp_order_id, trailing_order_id = set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_price, tp_price, actual_size, TP_MODE, is_simulation=True)
+def execute_entry(exchange, SYMBOL, signal, size, signal_close, sl_distance, tp_distance, FIXED_LEVERAGE, TP_MODE, ENTRY_MODE='separate', REANCHOR_BRACKETS=True, is_simulation=False, sleep=None, trace=None):
+    """
+    提交市价入场订单，确认成交后设置止损止盈。
 
-        elif signal == 'short_entry':
-            # 空头入场
-            order = exchange.create_market_sell_order(SYMBOL, size)
-            order_id = order['id']
-            logging.info(f"\033[92m市价卖出订单已提交，订单ID: {order_id}\033[0m")
-            time.sleep(1)
-            filled_order = exchange.fetch_order(order_id, SYMBOL)
-            if filled_order and filled_order['status'] == 'closed' and filled_order['average']:
-                entry_price = filled_order['average']
-                logging.info(f"\033[92m订单已成交，实际入场价: {entry_price}\033[0m")
-            else:
-                logging.error("错误：无法获取订单成交价，取消设置止盈止损。")
-                return
-            actual_size = float(filled_order.get('filled', filled_order.get('amount', size)))
-            if actual_size <= 0:
-                logging.error("错误：成交张数为0，取消止损止盈设置。")
-                return
-            
-            logging.info(f"\033[92m实际张数: {actual_size:.2f}\033[0m")
-            # 计算保证金
-            margin = (actual_size * 0.01 * entry_price) / FIXED_LEVERAGE
-            logging.info(f"\033[92m保证金: {margin:.2f} USDT\033[0m")
-            
-            # 设置止盈止损
-            sl_price = entry_price + sl_distance
-            tp_price = entry_price - tp_distance
-            logging.info(f"\033[92m止损价格: {sl_price}, 止盈价格: {tp_price}\033[0m")
-            sl_order_id, tp_order_id, trailing_order_id = set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_price, tp_price, actual_size, TP_MODE, is_simulation=True)
+    ENTRY_MODE 为 'attached' 且 TP_MODE 为 'limit' 时，入场单附带基于信号K线收盘价计算的止盈止损，
+    一次请求完成开仓和保护；REANCHOR_BRACKETS 为 True 时，成交后再按实际成交价修正止盈止损。
+    交易所拒绝附带止盈止损的请求时，回退到分步下单（市价单 + set_stop_loss_and_take_profit）。
+    入场单带客户端订单ID，超时后先按ID查询再重试（submit_order_idempotent），不会重复开仓；
+    重试后仍无法确认时抛出 OrderStatusUnknown，不回退到分步下单。
 
-    except Exception as e:
-        logging.error(f"策略执行失败: {e}")
+    参数:
+    exchange: ccxt交易所对象
+    SYMBOL: 交易对
+    signal: 信号类型 ('long_entry' 或 'short_entry')
+    size: 下单张数
+    signal_close: 信号K线收盘价
+    sl_distance: 止损距离
+    tp_distance: 止盈距离
+    FIXED_LEVERAGE: 杠杆倍数
+    TP_MODE: 止盈模式 ('limit' 或 'trailing')
+    ENTRY_MODE: 入场模式 ('separate' 分步下单 或 'attached' 附带止盈止损)
+    REANCHOR_BRACKETS: 附带模式下是否按实际成交价修正止盈止损
+    is_simulation: 是否模拟交易
+    sleep: 休眠函数，默认 time.sleep
+    trace: 本周期延迟时间线，记录下单、确认、成交和止盈止损设置的耗时，默认不记录
+
+    返回:
+    tuple: (入场订单ID, 入场价格, 实际张数, 止损订单ID, 止盈订单ID, 追踪止盈订单ID)，失败返回 None
+    """
+    if sleep is None:
+        sleep = time.sleep
+    if trace is None:
+        trace = NullTrace()
+    direction = 1 if signal == 'long_entry' else -1
+    side_name = '买入' if signal == 'long_entry' else '卖出'
+
+    order = None
+    algo_cl_ord_id = None
+    if ENTRY_MODE == 'attached' and TP_MODE == 'limit' and signal_close:
+        ref_sl_price = signal_close - direction * sl_distance
+        ref_tp_price = signal_close + direction * tp_distance
+        try:
+            trace.mark('order_submit', mode='attached')
+            order, algo_cl_ord_id = place_entry_with_brackets(exchange, SYMBOL, signal, size, signal_close, ref_sl_price, ref_tp_price, is_simulation=is_simulation, sleep=sleep)
+        except ccxt.ExchangeError as e:
+            logging.warning(f"附带止盈止损的入场单被拒绝，回退到分步下单: {e}")
+    elif ENTRY_MODE == 'attached':
+        logging.info("附带止盈止损仅支持限价止盈模式且需要信号收盘价，使用分步下单。")
+
+    if order is None:
+        trace.mark('order_submit', mode='separate')
+        client_order_id = new_entry_client_id()
+        if signal == 'long_entry':
+            params = {'posSide': 'long'} if not is_simulation else {}
+            params['clientOrderId'] = client_order_id
+            order = submit_order_idempotent(exchange, SYMBOL, lambda: exchange.create_market_buy_order(SYMBOL, size, params=params), client_order_id, sleep=sleep)
+        else:
+            params = {'posSide': 'short'} if not is_simulation else {}
+            params['clientOrderId'] = client_order_id
+            order = submit_order_idempotent(exchange, SYMBOL, lambda: exchange.create_market_sell_order(SYMBOL, size, params=params), client_order_id, sleep=sleep)
+        logging.info(f"\033[92m市价{side_name}订单已提交，订单ID: {order['id']}\033[0m")
+    order_id = order['id']
+    trace.mark('order_ack')
+    journal_call('record_entry', SYMBOL, order_id, signal, size, mode='attached' if algo_cl_ord_id else 'separate', algo_cl_ord_id=algo_cl_ord_id, signal_close=signal_close)
+
+    sleep(1)
+    filled_order = exchange.fetch_order(order_id, SYMBOL)
+    trace.mark('fill_confirmed')
+    if filled_order and filled_order['status'] == 'closed' and filled_order['average']:
+        entry_price = filled_order['average']
+        logging.info(f"\033[92m订单已成交，实际入场价: {entry_price}\033[0m")
+    else:
+        logging.error("错误：无法获取订单成交价，取消设置止盈止损。")
+        return None
+    actual_size = float(filled_order.get('filled', filled_order.get('amount', size)))
+    if actual_size <= 0:
+        logging.error("错误：成交张数为0，取消止损止盈设置。")
+        journal_call('record_close', SYMBOL, order_id, 'not_filled')
+        return None
+    journal_call('record_fill', SYMBOL, order_id, entry_price, actual_size)
+
+    logging.info(f"\033[92m实际张数: {actual_size:.2f}\033[0m")
+    # 计算保证金
+    margin = (actual_size * 0.01 * entry_price) / FIXED_LEVERAGE
+    logging.info(f"\033[92m保证金: {margin:.2f} USDT\033[0m")
 
+    # 设置止盈止损
+    sl_price = entry_price - direction * sl_distance
+    tp_price = entry_price + direction * tp_distance
+    logging.info(f"\033[92m止损价格: {sl_price}, 止盈价格: {tp_price}\033[0m")
+    if algo_cl_ord_id:
+        if REANCHOR_BRACKETS and entry_price != signal_close:
+            reanchor_attached_brackets(exchange, SYMBOL, algo_cl_ord_id, entry_price, sl_price, tp_price)
+            trace.mark('reanchor')
+        journal_call('record_brackets', SYMBOL, order_id, algo_cl_ord_id, algo_cl_ord_id, None, attached=True)
+        return order_id, entry_price, actual_size, algo_cl_ord_id, algo_cl_ord_id, None
 
+    sl_order_id, tp_order_id, trailing_order_id = set_stop_loss_and_take_profit(exchange, SYMBOL, signal, entry_price, sl_price, tp_price, actual_size, TP_MODE, is_simulation=is_simulation, trace=trace)
+    journal_call('record_brackets', SYMBOL, order_id, sl_order_id, tp_order_id, trailing_order_id, sl_price=sl_price, tp_price=tp_price)
+    return order_id, entry_price, actual_size, sl_order_id, tp_order_id, trailing_order_id
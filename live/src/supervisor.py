@@ -0,0 +1,192 @@
+import os
+import json
+import queue
+import logging
+import multiprocessing
+import time
+
+from collections import deque
+
+
+def shard_symbols(symbols, num_shards):
+    """
+    把品种按顺序轮流分配到各分片。
+
+    参数:
+    symbols (list): 品种列表
+    num_shards (int): 分片数（超过品种数时按品种数）
+
+    返回:
+    list[list[int]]: 每个分片分到的品种下标
+    """
+    num_shards = max(1, min(num_shards, len(symbols)))
+    return [list(range(i, len(symbols), num_shards)) for i in range(num_shards)]
+
+
+class ShardProcess:
+    """
+    一个分片工作进程的运行状态。
+    """
+
+    def __init__(self, index, args):
+        self.index = index
+        self.name = f"shard{index}"
+        self.args = args
+        self.process = None
+        self.started_at = None
+        self.last_heartbeat = None
+        self.restarts = deque()  # 最近重启时刻
+        self.restart_at = None  # 计划重启时刻（退避中）
+        self.cycle_seconds = deque(maxlen=96)
+        self.last_report = {}
+
+
+class Supervisor:
+    """
+    多进程实盘调度：每个分片一个独立进程（独立的交易所客户端），监控并重启崩溃或卡死的分片，汇总各分片的周期耗时。
+
+    工作进程调用 target(shard_index, *args, status_queue)，并在每个周期结束时向 status_queue 发送
+    {'shard': 下标, 'event': 'cycle', 'cycle_seconds': 秒, 'bar_close': 时间戳, ...}。
+
+    参数:
+    target (callable): 工作进程入口（必须是可被子进程导入的模块级函数）
+    shard_args (list[tuple]): 每个分片传给 target 的参数
+    heartbeat_timeout (float): 超过该秒数没有收到周期报告则视为卡死并重启
+    restart_backoff (float): 首次重启前等待秒数，连续重启时按倍数递增
+    max_backoff (float): 最大重启等待秒数
+    metrics_file (str): 各分片状态写入的JSON文件，None 表示不写
+    """
+
+    def __init__(self, target, shard_args, heartbeat_timeout=1800, restart_backoff=5.0, max_backoff=300.0, metrics_file=None):
+        # spawn：子进程重新导入模块，不继承父进程的网络连接和线程
+        self._ctx = multiprocessing.get_context('spawn')
+        self.target = target
+        self.shards = [ShardProcess(i, args) for i, args in enumerate(shard_args)]
+        self.heartbeat_timeout = heartbeat_timeout
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self.metrics_file = metrics_file
+        self.status_queue = self._ctx.Queue()
+        self._stopping = False
+
+    def _start(self, shard):
+        shard.process = self._ctx.Process(
+            target=self.target,
+            args=(shard.index, *shard.args, self.status_queue),
+            name=shard.name,
+            daemon=False,
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        shard.last_heartbeat = shard.started_at
+        shard.restart_at = None
+        logging.info(f"分片 {shard.name} 已启动，PID {shard.process.pid}")
+
+    def start(self):
+        for shard in self.shards:
+            self._start(shard)
+
+    def _schedule_restart(self, shard, reason):
+        now = time.monotonic()
+        while shard.restarts and now - shard.restarts[0] > 3600:
+            shard.restarts.popleft()
+        delay = min(self.max_backoff, self.restart_backoff * (2 ** len(shard.restarts)))
+        shard.restarts.append(now)
+        shard.restart_at = now + delay
+        logging.error(f"\033[91m分片 {shard.name} {reason}，{delay:.0f} 秒后重启（最近一小时第 {len(shard.restarts)} 次）\033[0m")
+
+    def _drain_status(self, timeout):
+        try:
+            message = self.status_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            shard = self.shards[message['shard']]
+            shard.last_heartbeat = time.monotonic()
+            shard.last_report = message
+            if message.get('event') == 'cycle':
+                shard.cycle_seconds.append(message['cycle_seconds'])
+                self._log_cycle(shard, message)
+            try:
+                message = self.status_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _log_cycle(self, shard, message):
+        history = sorted(shard.cycle_seconds)
+        p50 = history[len(history) // 2]
+        logging.info(
+            f"分片 {shard.name} 周期耗时 {message['cycle_seconds']:.2f} 秒"
+            f"（{len(message.get('symbols', []))} 个品种，中位数 {p50:.2f} 秒，最大 {history[-1]:.2f} 秒）"
+        )
+
+    def check(self):
+        """检查各分片：已退出的按退避时间重启，心跳超时的终止后重启。"""
+        now = time.monotonic()
+        for shard in self.shards:
+            if shard.restart_at is not None:
+                if now >= shard.restart_at and not self._stopping:
+                    self._start(shard)
+                continue
+            if not shard.process.is_alive():
+                self._schedule_restart(shard, f"已退出（退出码 {shard.process.exitcode}）")
+            elif now - shard.last_heartbeat > self.heartbeat_timeout:
+                shard.process.terminate()
+                shard.process.join(10)
+                self._schedule_restart(shard, f"超过 {self.heartbeat_timeout:.0f} 秒没有完成周期")
+
+    def snapshot(self):
+        now = time.monotonic()
+        shards = {}
+        for shard in self.shards:
+            history = sorted(shard.cycle_seconds)
+            shards[shard.name] = {
+                'pid': shard.process.pid if shard.process is not None else None,
+                'alive': shard.process is not None and shard.process.is_alive(),
+                'uptime': round(now - shard.started_at, 1) if shard.started_at else None,
+                'seconds_since_heartbeat': round(now - shard.last_heartbeat, 1) if shard.last_heartbeat else None,
+                'restarts_last_hour': len(shard.restarts),
+                'cycles': len(history),
+                'cycle_seconds_p50': history[len(history) // 2] if history else None,
+                'cycle_seconds_max': history[-1] if history else None,
+                'last_report': shard.last_report,
+            }
+        return {'updated': time.time(), 'shards': shards}
+
+    def export(self):
+        if not self.metrics_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.metrics_file) or '.', exist_ok=True)
+            tmp_file = f"{self.metrics_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.metrics_file)
+        except Exception as e:
+            logging.warning(f"分片状态写入失败: {e}")
+
+    def run(self, poll_interval=1.0, export_interval=30.0):
+        """启动全部分片并持续监控，Ctrl+C 时终止所有分片。"""
+        self.start()
+        last_export = 0.0
+        try:
+            while True:
+                self._drain_status(poll_interval)
+                self.check()
+                if time.monotonic() - last_export >= export_interval:
+                    self.export()
+                    last_export = time.monotonic()
+        except KeyboardInterrupt:
+            logging.info("用户中断，停止所有分片。")
+        finally:
+            self.stop()
+
+    def stop(self, timeout=15.0):
+        self._stopping = True
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+        for shard in self.shards:
+            if shard.process is not None:
+                shard.process.join(timeout)
+        self.export()
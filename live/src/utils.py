@@ -9,19 +9,26 @@ from email.mime.multipart import MIMEMultipart
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timezone, timedelta
 
+from .logs import start_queue_logging, ConsoleFilter, JsonFormatter
+
 # 设置日志配置，包括文件轮转和控制台输出
-def setup_logging():
+def setup_logging(name=None, use_queue=False):
     """
     设置日志配置，包括文件轮转和控制台输出。
     
     此函数创建日志目录（如果不存在），并配置日志记录器以将日志写入轮转文件和控制台。
     日志文件基于当前时间戳命名，并使用RotatingFileHandler来限制文件大小和保留备份。
+
+    参数:
+    name (str): 日志文件名后缀（多进程分片运行时每个进程一个文件），默认 None
+    use_queue (bool): 为 True 时交易线程只把日志放入队列，由后台线程写入文本日志、JSON Lines 结构化日志和控制台，默认 False
     """
     log_dir = os.path.join(os.path.dirname(__file__), '..', 'logs')
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
-    log_filename = os.path.join(log_dir, f"{datetime.now().strftime('%Y-%m-%d_%H-%M')}.log")
+    suffix = f"_{name}" if name else ''
+    log_filename = os.path.join(log_dir, f"{datetime.now().strftime('%Y-%m-%d_%H-%M')}{suffix}.log")
     # 使用 RotatingFileHandler 来自动轮转日志文件
     handler = RotatingFileHandler(
         log_filename,
@@ -29,9 +36,25 @@ def setup_logging():
         backupCount=5,  # 保留5个备份文件
         encoding='utf-8'
     )
+    log_format = f'%(asctime)s - %(levelname)s - {name + " - " if name else ""}%(message)s'
+    if use_queue:
+        json_handler = RotatingFileHandler(
+            log_filename[:-len('.log')] + '.jsonl',
+            maxBytes=10*1024*1024,
+            backupCount=5,
+            encoding='utf-8'
+        )
+        json_handler.setFormatter(JsonFormatter())
+        console = logging.StreamHandler()
+        for text_handler in (handler, console):
+            text_handler.setFormatter(logging.Formatter(log_format))
+            text_handler.addFilter(ConsoleFilter())
+        start_queue_logging([handler, json_handler, console])
+        return
+
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
+        format=log_format,
         handlers=[
             handler,
             logging.StreamHandler()
@@ -39,7 +62,7 @@ def setup_logging():
     )
 
 # 获取OHLCV数据并转换为Pandas DataFrame
-def get_ohlcv_data(exchange, symbol='BTC/USDT:USDT', timeframe='15m', limit=100, retries=10, delay=10):
+def get_ohlcv_data(exchange, symbol='BTC/USDT:USDT', timeframe='15m', limit=100, retries=10, delay=10, sleep=None):
     """
     获取OHLCV数据并转换为Pandas DataFrame，增加了重试机制。
     
@@ -50,10 +73,13 @@ def get_ohlcv_data(exchange, symbol='BTC/USDT:USDT', timeframe='15m', limit=100,
     limit (int): 获取的K线数量，默认 100
     retries (int): 失败后重试的次数
     delay (int): 每次重试之间的延迟秒数
+    sleep (callable): 休眠函数，默认 time.sleep
     
     返回:
     pd.DataFrame: 包含OHLCV数据的DataFrame，索引为时间戳，失败则抛出异常
     """
+    if sleep is None:
+        sleep = time.sleep
     for i in range(retries):
         try:
             bars = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
@@ -65,7 +91,7 @@ def get_ohlcv_data(exchange, symbol='BTC/USDT:USDT', timeframe='15m', limit=100,
             logging.warning(f"获取OHLCV数据失败 (第 {i+1}/{retries} 次尝试): {e}")
             if i < retries - 1:
                 logging.info(f"将在 {delay} 秒后重试...")
-                time.sleep(delay)
+                sleep(delay)
             else:
                 logging.error("获取OHLCV数据失败，已达到最大重试次数。")
                 raise  # 重试次数用尽后，重新抛出异常
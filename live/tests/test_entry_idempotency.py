@@ -0,0 +1,85 @@
+import ccxt
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.exit_mechanism import OrderStatusUnknown
+from src.replay import SimClock, SimulatedExchange
+from src.strategy import execute_entry
+
+SYMBOL = 'BTC/USDT:USDT'
+
+
+class FlakyExchange(SimulatedExchange):
+    """
+    模拟网络超时的交易所：前 timeouts 次下单请求超时；after_send 为 True 时订单已在交易所创建后才超时。
+    """
+
+    def __init__(self, *args, timeouts=1, after_send=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeouts = timeouts
+        self.after_send = after_send
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        if self.timeouts > 0:
+            self.timeouts -= 1
+            if self.after_send:
+                super().create_order(symbol, type, side, amount, price, params)
+            raise ccxt.RequestTimeout('okx POST /api/v5/trade/order request timeout')
+        return super().create_order(symbol, type, side, amount, price, params)
+
+
+def make_exchange(**kwargs):
+    index = pd.date_range('2025-01-01', periods=8, freq='15min', tz='UTC')
+    close = 100 + np.arange(len(index), dtype=float)
+    data = pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': 1.0}, index=index)
+    clock = SimClock(index[-1].timestamp() + 900)
+    return FlakyExchange({SYMBOL: data}, clock, **kwargs)
+
+
+def entry_orders(exchange):
+    return [o for o in exchange._orders.values() if o['type'] == 'market']
+
+
+def run_entry(exchange, mode):
+    return execute_entry(
+        exchange, SYMBOL, 'long_entry', 2, 107.0, 5.0, 10.0, 10, 'limit',
+        ENTRY_MODE=mode, is_simulation=True, sleep=exchange.clock.sleep,
+    )
+
+
+@pytest.mark.parametrize('mode', ['separate', 'attached'])
+def test_timeout_after_send_does_not_duplicate_entry(mode):
+    exchange = make_exchange(timeouts=1, after_send=True)
+    result = run_entry(exchange, mode)
+
+    orders = entry_orders(exchange)
+    assert len(orders) == 1
+    assert result[0] == orders[0]['id']
+    assert orders[0]['clientOrderId'].startswith('en')
+    assert exchange.fetch_positions([SYMBOL])[0]['contracts'] == 2
+
+
+@pytest.mark.parametrize('mode', ['separate', 'attached'])
+def test_timeout_before_send_retries_with_same_client_id(mode):
+    exchange = make_exchange(timeouts=1, after_send=False)
+    result = run_entry(exchange, mode)
+
+    orders = entry_orders(exchange)
+    assert len(orders) == 1
+    assert result[0] == orders[0]['id']
+    assert exchange.call_counts['create_order'] == 1
+
+
+def test_unresolved_timeout_raises_without_fallback():
+    exchange = make_exchange(timeouts=10, after_send=False)
+    with pytest.raises(OrderStatusUnknown):
+        run_entry(exchange, 'attached')
+    assert entry_orders(exchange) == []
+
+
+def test_duplicate_client_id_is_rejected():
+    exchange = make_exchange(timeouts=0)
+    exchange.create_order(SYMBOL, 'market', 'buy', 1, params={'clientOrderId': 'en1'})
+    with pytest.raises(ccxt.InvalidOrder):
+        exchange.create_order(SYMBOL, 'market', 'buy', 1, params={'clientOrderId': 'en1'})
@@ -0,0 +1,123 @@
+import smtplib
+import time
+from email import message_from_string
+from email.header import decode_header, make_header
+
+import pytest
+
+from src import notifier
+from src.notifier import EmailNotifier
+
+
+class FakeSMTP:
+    """
+    本地SMTP替身：记录连接和发送的邮件；failures 为前若干次 sendmail 抛出的异常，refuse 为 True 时拒绝连接。
+    """
+
+    instances = []
+    sent = []
+    failures = []
+    refuse = False
+    refused = 0
+
+    def __init__(self, host, port, timeout=None):
+        if FakeSMTP.refuse:
+            FakeSMTP.refused += 1
+            raise ConnectionRefusedError(f"{host}:{port} 拒绝连接")
+        FakeSMTP.instances.append(self)
+        self.closed = False
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def noop(self):
+        return (250, b'OK')
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if FakeSMTP.failures:
+            raise FakeSMTP.failures.pop(0)
+        FakeSMTP.sent.append(msg)
+
+    def quit(self):
+        self.closed = True
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    FakeSMTP.instances, FakeSMTP.sent, FakeSMTP.failures, FakeSMTP.refuse, FakeSMTP.refused = [], [], [], False, 0
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
+    return FakeSMTP
+
+
+def make_notifier(**kwargs):
+    params = dict(to_email='to@example.com', from_email='from@example.com', smtp_user='', smtp_password='',
+                  use_tls=False, batch_window=0.2, retry_delay=0.0)
+    params.update(kwargs)
+    return EmailNotifier(**params)
+
+
+def subject_of(raw):
+    return str(make_header(decode_header(message_from_string(raw)['Subject'])))
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+def test_messages_are_batched_into_one_email(smtp):
+    email = make_notifier()
+    for i in range(3):
+        assert email.notify(f"开仓 {i}", f"正文 {i}")
+    email.start()
+    email.stop(timeout=5)
+
+    assert len(smtp.sent) == 1
+    assert subject_of(smtp.sent[0]) == '通知摘要（3 条）: 开仓 0'
+    assert email.sent_count == 3
+    assert len(smtp.instances) == 1
+
+
+def test_failed_send_is_retried_on_a_new_connection(smtp):
+    smtp.failures = [smtplib.SMTPServerDisconnected('连接已断开')]
+    email = make_notifier(max_retries=3)
+    email.notify('开仓', '正文')
+    email.start()
+    email.stop(timeout=5)
+
+    assert len(smtp.sent) == 1
+    assert len(smtp.instances) == 2
+    assert smtp.instances[0].closed
+    assert email.sent_count == 1
+
+
+def test_notifier_failure_does_not_raise_in_trading_code(smtp):
+    smtp.refuse = True
+    notifier.start_notifier(to_email='to@example.com', from_email='from@example.com', use_tls=False,
+                            batch_window=0.0, max_retries=2, retry_delay=0.0)
+    dispatcher = notifier._default_notifier
+    try:
+        # 交易代码中的 notify 只入队，SMTP不可用时不抛出异常；重试用尽后丢弃该消息，后台线程继续运行
+        assert notifier.notify('开仓', '正文')
+        wait_until(lambda: smtp.refused == 2)
+        smtp.refuse = False
+        assert notifier.notify('平仓', '正文')
+        wait_until(lambda: dispatcher.sent_count == 1)
+        assert dispatcher._thread.is_alive()
+    finally:
+        notifier.stop_notifier(timeout=5)
+
+    assert [subject_of(raw) for raw in smtp.sent] == ['平仓']
+    assert not dispatcher._thread.is_alive()
+
+
+def test_full_queue_drops_without_blocking(smtp):
+    email = make_notifier(max_queue=1)
+    assert email.notify('一', '正文')
+    assert not email.notify('二', '正文')
+    assert email.dropped_count == 1
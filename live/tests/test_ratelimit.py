@@ -0,0 +1,52 @@
+import threading
+import time
+
+from src.ratelimit import RequestScheduler
+
+ENDPOINTS = {
+    'market_candles': (1, 1.0),
+    'trade_order': (60, 2),
+    'trade_order_algo': (20, 2),
+}
+
+
+def test_order_request_overtakes_queued_market_request():
+    scheduler = RequestScheduler(ENDPOINTS)
+    scheduler.acquire('market_candles')  # 用尽行情限额，下一个行情请求需要排队约1秒
+    finished = []
+    waits = {}
+
+    def call(endpoint, name):
+        waits[name] = scheduler.acquire(endpoint)
+        finished.append(name)
+
+    market = threading.Thread(target=call, args=('market_candles', 'market'))
+    market.start()
+    time.sleep(0.1)  # 行情请求已在等待令牌
+    assert finished == []
+    order = threading.Thread(target=call, args=('trade_order', 'order'))
+    order.start()
+    order.join(timeout=5)
+    market.join(timeout=5)
+
+    assert finished == ['order', 'market']
+    assert waits['order'] < 0.05
+    assert waits['market'] > 0.5
+
+
+def test_window_limit_is_enforced():
+    scheduler = RequestScheduler({'market_candles': (2, 0.2)})
+    waits = [scheduler.acquire('market_candles') for _ in range(3)]
+
+    assert waits[0] < 0.01 and waits[1] < 0.01
+    assert waits[2] >= 0.05
+    assert scheduler.snapshot()['endpoints']['market_candles']['waited_calls'] == 1
+
+
+def test_algo_orders_use_the_algo_endpoint():
+    scheduler = RequestScheduler(ENDPOINTS)
+
+    assert scheduler.endpoint_for('create_order', ('BTC/USDT:USDT', 'market', 'buy', 1)) == 'trade_order'
+    assert scheduler.endpoint_for('create_order', ('BTC/USDT:USDT', 'trailing_stop', 'sell', 1)) == 'trade_order_algo'
+    assert scheduler.endpoint_for('create_order', ('BTC/USDT:USDT', 'market', 'sell', 1), {'params': {'stopLossPrice': 1}}) == 'trade_order_algo'
+    assert scheduler.endpoint_for('price_to_precision') is None
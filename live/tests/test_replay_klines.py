@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.replay import KLINE_COLUMNS, load_klines
+
+
+@pytest.mark.parametrize('fmt', ['ms', 'us', 'ms_noheader', 'date'])
+def test_load_klines_reads_every_file_format(tmp_path, fmt):
+    # fmt: 'ms' / 'us' 为毫秒/微秒时间戳（有表头），'ms_noheader' 为2022年以前无表头的月度文件，'date' 为日期字符串（合并文件）
+    index = pd.date_range('2025-01-01', periods=50, freq='15min')
+    close = 100 + np.arange(len(index), dtype=float)
+    frame = pd.DataFrame({col: 0.0 for col in KLINE_COLUMNS}, index=range(len(index)))
+    frame['open'], frame['high'], frame['low'], frame['close'], frame['volume'] = close, close + 1, close - 1, close, 10.0
+    if fmt == 'date':
+        frame['open_time'] = index.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        frame['open_time'] = index.as_unit('us' if fmt == 'us' else 'ms').asi8
+    path = tmp_path / 'klines.csv'
+    frame.to_csv(path, index=False, header=fmt != 'ms_noheader')
+
+    data = load_klines(str(path))
+
+    assert data.index.equals(pd.DatetimeIndex(index.as_unit(data.index.unit), name='open_time'))
+    assert list(data.columns) == ['open', 'high', 'low', 'close', 'volume']
+    np.testing.assert_array_equal(data['close'].to_numpy(), close)
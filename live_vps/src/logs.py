@@ -0,0 +1,142 @@
+import re
+import json
+import queue
+import atexit
+import logging
+import contextvars
+
+from logging.handlers import QueueHandler, QueueListener
+
+# 结构化日志：交易线程只把日志记录放入队列，格式化和文件写入由后台线程完成；
+# 除人类可读的文本日志外，另写一份 JSON Lines 日志，每条记录附带品种、周期编号、步骤和延迟等字段。
+
+ANSI_PATTERN = re.compile(r'\033\[[0-9;]*m')
+
+# JSON 记录中附带的上下文字段
+CONTEXT_FIELDS = ('shard', 'cycle', 'symbol', 'stage', 'latency_ms', 'since_bar_ms')
+
+_context = contextvars.ContextVar('log_context', default=None)
+_listener = None
+
+stage_logger = logging.getLogger('live.stage')
+
+
+def set_log_context(**fields):
+    """
+    设置当前线程后续日志附带的上下文字段（如 shard、cycle、symbol），值为 None 时清除该字段。
+    """
+    context = dict(_context.get() or {})
+    for key, value in fields.items():
+        if value is None:
+            context.pop(key, None)
+        else:
+            context[key] = value
+    _context.set(context)
+
+
+class ContextFilter(logging.Filter):
+    """在调用线程中把上下文字段写入日志记录（记录自带的同名字段优先）。"""
+
+    def filter(self, record):
+        for key, value in (_context.get() or {}).items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class ConsoleFilter(logging.Filter):
+    """过滤只写入结构化日志的记录（extra={'console': False}），如逐步骤的延迟记录。"""
+
+    def filter(self, record):
+        return getattr(record, 'console', True)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    把日志记录格式化为一行 JSON：时间、级别、消息（去除 ANSI 颜色码）以及存在的上下文字段。
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': ANSI_PATTERN.sub('', record.getMessage()),
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    不在调用线程格式化的 QueueHandler：标准实现会在入队前格式化消息，这里把格式化留给后台线程的各个处理器。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def start_queue_logging(handlers, level=logging.INFO):
+    """
+    把根日志器的输出改为经过队列、由后台线程写入 handlers。
+
+    参数:
+    handlers (list): 实际写文件/控制台的处理器（各自设置格式和过滤器）
+    level (int): 根日志器级别
+
+    返回:
+    QueueListener: 后台监听器，进程退出时自动停止并写完队列中的记录
+    """
+    global _listener
+    stop_queue_logging()
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_queue_logging)
+    return _listener
+
+
+def stop_queue_logging():
+    """停止后台监听器并写完剩余记录。"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def structured_logging_enabled():
+    return _listener is not None
+
+
+def log_stage(symbol, event):
+    """
+    把一个延迟步骤写入结构化日志（不输出到控制台和文本日志）；未启用队列日志时不创建记录。
+
+    参数:
+    symbol (str): 交易对
+    event (dict): CycleTrace.mark 生成的步骤记录
+    """
+    if _listener is None:
+        return
+    stage_logger.info(
+        "%s %s", symbol, event['step'],
+        extra={
+            'console': False,
+            'symbol': symbol,
+            'stage': event['step'],
+            'latency_ms': event['step_ms'],
+            'since_bar_ms': event.get('since_bar_ms'),
+        },
+    )
@@ -0,0 +1,122 @@
+import logging
+import time
+
+from collections import deque
+
+
+class BarScheduler:
+    """
+    按交易所时钟对齐的K线收盘调度器。
+
+    通过 exchange.fetch_time() 测量本地时钟与交易所服务器时间的偏差（取往返延迟最小的样本），
+    之后以单调时钟推算交易所时间，休眠到K线边界之后 safety_margin 秒再唤醒，
+    并记录每次唤醒相对K线收盘的延迟。
+
+    参数:
+    exchange: ccxt交易所对象
+    timeframe (str): K线周期，如 '15m'
+    safety_margin (float): 唤醒时间相对K线边界的安全余量（秒），默认 0.3
+    resync_interval (float): 重新校准时钟偏差的间隔（秒），默认 3600
+    samples (int): 每次校准的采样次数，默认 5
+    prewarm (callable): K线收盘前调用的连接预热函数，默认 None（不预热）
+    prewarm_lead (float): 在唤醒前多少秒执行预热，默认 3
+    """
+
+    def __init__(self, exchange, timeframe='15m', safety_margin=0.3, resync_interval=3600, samples=5, prewarm=None, prewarm_lead=3.0):
+        self.exchange = exchange
+        self.timeframe = timeframe
+        self.period = exchange.parse_timeframe(timeframe)
+        self.safety_margin = safety_margin
+        self.resync_interval = resync_interval
+        self.samples = samples
+        self.prewarm = prewarm
+        self.prewarm_lead = prewarm_lead
+
+        self.offset = 0.0  # 交易所时间 - 本地时间（秒）
+        self.rtt = None
+        self._anchor_wall = time.time()
+        self._anchor_mono = time.monotonic()
+        self._last_sync = None
+        self.lateness_history = deque(maxlen=96)  # 最近96次唤醒延迟（15m周期约一天）
+
+    def sync_clock(self):
+        """
+        测量本地时钟与交易所时钟的偏差。
+
+        返回:
+        float: 偏差秒数（交易所时间 - 本地时间），失败时保留上次结果
+        """
+        best = None
+        for _ in range(self.samples):
+            try:
+                t0 = time.monotonic()
+                wall0 = time.time()
+                server_ms = self.exchange.fetch_time()
+                rtt = time.monotonic() - t0
+            except Exception as e:
+                logging.warning(f"获取交易所服务器时间失败: {e}")
+                continue
+            # 假设服务器时间在往返中点取得
+            offset = server_ms / 1000 - (wall0 + rtt / 2)
+            if best is None or rtt < best[0]:
+                best = (rtt, offset)
+
+        if best is None:
+            logging.warning(f"时钟校准失败，继续使用上次偏差 {self.offset * 1000:.1f} ms")
+            return self.offset
+
+        self.rtt, self.offset = best
+        self._anchor_wall = time.time()
+        self._anchor_mono = time.monotonic()
+        self._last_sync = self._anchor_mono
+        logging.info(f"交易所时钟偏差: {self.offset * 1000:.1f} ms（往返延迟 {self.rtt * 1000:.1f} ms）")
+        return self.offset
+
+    def exchange_time(self):
+        """
+        以单调时钟推算当前交易所时间（秒级Unix时间戳），不受本地时钟跳变影响。
+        """
+        return self._anchor_wall + self.offset + (time.monotonic() - self._anchor_mono)
+
+    def next_bar_close(self, now=None):
+        """
+        返回下一个K线边界的交易所时间戳（秒）。
+        """
+        if now is None:
+            now = self.exchange_time()
+        return (int(now // self.period) + 1) * self.period
+
+    def wait_next_bar(self):
+        """
+        休眠到下一根K线收盘之后 safety_margin 秒，并记录唤醒延迟。
+
+        返回:
+        float: 本次等待的K线边界时间戳（秒）
+        """
+        if self._last_sync is None or time.monotonic() - self._last_sync > self.resync_interval:
+            self.sync_clock()
+
+        bar_close = self.next_bar_close()
+        target = bar_close + self.safety_margin
+        logging.info(f"等待 {target - self.exchange_time():.3f} 秒到下一个 {self.timeframe} 整点")
+        logging.info("-" * 50)
+
+        if self.prewarm is not None and target - self.exchange_time() > self.prewarm_lead:
+            # 空闲期间连接可能已被关闭，收盘前重新建立，避免首个请求承担握手耗时
+            self._sleep_until(target - self.prewarm_lead)
+            self.prewarm()
+        self._sleep_until(target)
+
+        lateness = self.exchange_time() - bar_close
+        self.lateness_history.append(lateness)
+        worst = max(self.lateness_history)
+        logging.info(f"K线收盘后 {lateness * 1000:.1f} ms 唤醒（安全余量 {self.safety_margin * 1000:.0f} ms，最近最大 {worst * 1000:.1f} ms）")
+        return bar_close
+
+    def _sleep_until(self, target):
+        while True:
+            remaining = target - self.exchange_time()
+            if remaining <= 0:
+                return
+            # time.sleep 基于单调时钟，临近目标时缩短休眠以减少过冲
+            time.sleep(remaining if remaining < 1 else remaining - 0.5)
@@ -1,16 +1,68 @@
-import talib
 import logging
 from datetime import datetime, timezone
+import numpy as np
 import pandas as pd
 import time
-from .utils import get_ohlcv_data, is_trading_allowed  # 添加导入
+from .utils import get_ohlcv_data
+from .signal_core import IncrementalSignal, hour_allowed, UPPER_BREAKOUT, LOWER_BREAKOUT
+from .latency import NullTrace
+from .journal import mark_flat
 
-def ema_atr_filter(exchange, symbol, ema_period, atr_period, multiplier, atr_threshold_pct, forbidden_hours=None, timeframe='15m'):
+# 预热时获取的K线数量（OKX单次上限300），预热后每个周期只获取最近几根
+WARMUP_LIMIT = 300
+INCREMENTAL_LIMIT = 5
+
+# 每个 (品种, 周期, 指标参数) 的逐根信号状态，跨周期保留
+_signal_states = {}
+
+
+def drop_signal_states(symbols):
+    """
+    丢弃这些品种的信号状态（配置中移除品种后释放内存，再次加入时重新预热）。
+
+    返回:
+    int: 丢弃的状态数量
+    """
+    keys = [key for key in _signal_states if key[0] in symbols]
+    for key in keys:
+        del _signal_states[key]
+    return len(keys)
+
+
+def _fetch_aligned_ohlcv(exchange, symbol, timeframe, limit, clock, sleep, trace, max_retries=100):
+    """
+    获取K线并确认最后两根已收盘K线的时间与当前时钟一致，不一致时重试。
+
+    返回:
+    pd.DataFrame: 最后一行为未收盘K线；重试次数用尽返回 None
+    """
+    duration_seconds = exchange.parse_timeframe(timeframe)
+    for attempt in range(max_retries):
+        df = get_ohlcv_data(exchange, symbol, timeframe=timeframe, limit=limit, sleep=sleep)
+        now_ts = clock()
+        expected_last_ts = (int(now_ts // duration_seconds) - 1) * duration_seconds
+        expected_prev_ts = (int(now_ts // duration_seconds) - 2) * duration_seconds
+        last_ts = int(df.index[-2].timestamp())
+        prev_ts = int(df.index[-3].timestamp())
+        if last_ts == expected_last_ts and prev_ts == expected_prev_ts:
+            trace.mark('ohlcv', retries=attempt, limit=limit)
+            return df
+        logging.warning(
+            f"K线数据时间不匹配，需重新获取。期望: {pd.to_datetime(expected_prev_ts, unit='s')} 和 {pd.to_datetime(expected_last_ts, unit='s')}，实际: {df.index[-3]} 和 {df.index[-2]}"
+        )
+        sleep(2)
+    logging.error("重试次数过多，仍未获取到匹配时间的数据。")
+    trace.mark('ohlcv', retries=max_retries, limit=limit, failed=True)
+    return None
+
+
+def ema_atr_filter(exchange, symbol, ema_period, atr_period, multiplier, atr_threshold_pct, forbidden_hours=None, timeframe='15m', clock=None, sleep=None, volume_multiplier=1.0, trace=None):
     """
     生成EMA-ATR过滤信号。
-    
-    计算EMA通道和ATR，检查波动率和突破条件。
-    
+
+    信号规则由 signal_core 提供，与回测共用同一份实现。首次调用时获取 WARMUP_LIMIT 根K线预热指标，
+    之后每个周期只获取最近几根K线，把新收盘的K线逐根喂入已保存的状态；数据出现断档时重新预热。
+
     参数:
     exchange: ccxt交易所对象
     symbol: 交易对
@@ -18,104 +70,108 @@ def ema_atr_filter(exchange, symbol, ema_period, atr_period, multiplier, atr_thr
     atr_period: ATR周期
     multiplier: 通道倍数
     atr_threshold_pct: ATR阈值百分比
-    forbidden_hours: 禁止交易时段列表，如 [[23,2], [12,17]]，默认None（允许所有时段）
+    forbidden_hours: 禁止交易时段列表，如 [[23,2], [12,17]]，默认None（允许所有时段），按信号K线的开盘时间判断
     timeframe: K线时间框架，如 '15m', '30m', '1h'，默认 '15m'
-    
+    clock: 返回当前Unix时间戳（秒）的函数，默认 time.time；实盘传入调度器的交易所时钟
+    sleep: 休眠函数，默认 time.sleep；回放时传入模拟时钟
+    volume_multiplier: 成交量倍数，信号K线成交量需大于前一根的该倍数，默认 1.0
+    trace: 本周期延迟时间线（latency.CycleTrace），记录K线获取、指标计算、持仓查询的耗时，默认不记录
+
     返回:
-    tuple: (信号类型, ATR值) 或 (None, ATR值)
+    tuple: (信号类型, ATR值, 信号K线收盘价) 或 (None, ATR值, 信号K线收盘价)
     """
     if forbidden_hours is None:
         forbidden_hours = []  # 默认允许所有时段
-    
+    if clock is None:
+        clock = time.time
+    if sleep is None:
+        sleep = time.sleep
+    if trace is None:
+        trace = NullTrace()
+
     try:
-        # 检查时段过滤器
-        current_hour = datetime.now(timezone.utc).hour
-        if not is_trading_allowed(current_hour, forbidden_hours):
+        # 检查时段过滤器（信号K线 = 刚收盘的那根，按其开盘时间判断，与回测一致）
+        duration_seconds = exchange.parse_timeframe(timeframe)
+        signal_bar_ts = (int(clock() // duration_seconds) - 1) * duration_seconds
+        if not hour_allowed(datetime.fromtimestamp(signal_bar_ts, timezone.utc).hour, forbidden_hours):
             logging.info("当前时段禁止交易。")
-            return None, None
-
-        max_retries = 100
-        for attempt in range(max_retries):
-            df = get_ohlcv_data(exchange, symbol, timeframe=timeframe)
-            duration_seconds = exchange.parse_timeframe(timeframe)
-            now_ts = time.time()
-            expected_last_ts = (int(now_ts // duration_seconds) - 1) * duration_seconds
-            expected_prev_ts = (int(now_ts // duration_seconds) - 2) * duration_seconds
-            last_ts = int(df.index[-2].timestamp())
-            prev_ts = int(df.index[-3].timestamp())
-            if last_ts == expected_last_ts and prev_ts == expected_prev_ts:
-                break
-            else:
-                logging.warning(
-                    f"K线数据时间不匹配，需重新获取。期望: {pd.to_datetime(expected_prev_ts, unit='s')} 和 {pd.to_datetime(expected_last_ts, unit='s')}，实际: {df.index[-3]} 和 {df.index[-2]}"
-                )
-                time.sleep(2)
-        else:
-            logging.error("重试次数过多，仍未获取到匹配时间的数据。")
-            return None, None
+            return None, None, None
+
+        key = (symbol, timeframe, ema_period, atr_period, multiplier)
+        state = _signal_states.get(key)
+        warm = state is not None and state.last_ts is not None
+        if state is not None:
+            # 过滤条件只影响之后K线的信号判断，运行中修改配置时直接替换，不丢失指标预热状态
+            state.atr_threshold_pct = atr_threshold_pct
+            state.volume_multiplier = volume_multiplier
+            state.forbidden_hours = forbidden_hours or []
+
+        df = _fetch_aligned_ohlcv(exchange, symbol, timeframe, INCREMENTAL_LIMIT if warm else WARMUP_LIMIT, clock, sleep, trace)
+        if df is None:
+            return None, None, None
+        timestamps = df.index[:-1].values.astype('datetime64[s]').astype(np.int64)
+
+        # 状态与本次数据接不上（停机、禁止时段跳过了若干周期等）时重新预热
+        if warm and state.last_ts not in timestamps:
+            logging.info(f"信号状态与最新K线不连续，重新预热 {symbol} 指标。")
+            warm = False
+            df = _fetch_aligned_ohlcv(exchange, symbol, timeframe, WARMUP_LIMIT, clock, sleep, trace)
+            if df is None:
+                return None, None, None
+            timestamps = df.index[:-1].values.astype('datetime64[s]').astype(np.int64)
+
+        if not warm:
+            state = IncrementalSignal(ema_period, atr_period, multiplier, atr_threshold_pct, volume_multiplier, forbidden_hours)
+            _signal_states[key] = state
+
+        # 只喂入尚未处理过的已收盘K线
+        closed = df.iloc[:-1]
+        bars = closed[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float)
+        hours = closed.index.hour
+        new_bars = np.flatnonzero(timestamps > (state.last_ts if warm else -1))
+        for i in new_bars:
+            state.update(*bars[i], hours[i], ts=int(timestamps[i]))
+        trace.mark('indicators', bars=len(new_bars))
+        if warm and not len(new_bars):
+            # 调度周期短于K线周期时（如15m调度下的1h策略），本周期没有新收盘的K线，信号已在之前处理过
+            logging.info(f"{symbol} {timeframe} 没有新收盘的K线，跳过。")
+            return None, state.atr, df['close'].iloc[-2]
 
         # 添加调试日志：检查数据是否更新（一一对应输出上上根和上一根K线的时间和成交量）
         for i, (ts, vol) in enumerate(zip(df.index[-3:-1], df['volume'].iloc[-3:-1]), 1):
             logging.info(f"K线{i}: 时间 {ts}, 成交量 {vol}")
-        
-        # 计算技术指标
-        df['ema'] = talib.EMA(df['close'], timeperiod=ema_period)
-        df['atr'] = talib.ATR(df['high'], df['low'], df['close'], timeperiod=atr_period)
-        df['upper_band'] = df['ema'] + (multiplier * df['atr'])
-        df['lower_band'] = df['ema'] - (multiplier * df['atr'])
-        
-        atr_value = df['atr'].iloc[-2]  # 获取ATR值
-
-        # 获取价格数据（使用前两根已确定的k线及其对应的通道值）
+
+        atr_value = state.atr  # 获取ATR值
         last_close = df['close'].iloc[-2]  # 上一根k线的收盘价
-        prev_close = df['close'].iloc[-3]  # 上上根k线的收盘价
-        last_upper_band = df['upper_band'].iloc[-2]  # 上一根k线的上轨
-        last_lower_band = df['lower_band'].iloc[-2]  # 上一根k线的下轨
-        prev_upper_band = df['upper_band'].iloc[-3]  # 上上根k线的上轨
-        prev_lower_band = df['lower_band'].iloc[-3]  # 上上根k线的下轨
 
         # 检查是否已有持仓
         positions = exchange.fetch_positions()
+        trace.mark('positions')
         has_position = any(pos['symbol'] == symbol and pos['contracts'] != 0 for pos in positions)
         if has_position:
             logging.info("已有持仓，跳过开仓信号。")
-            return None, atr_value
-        
-        # 波动率过滤器
-        atr_pct = atr_value / last_close
-        if atr_pct < atr_threshold_pct:
-            logging.info(f"波动率过低 ({atr_pct:.4f} < {atr_threshold_pct})，跳过交易。")
-            return None, atr_value
-        
-        # 新增：成交量过滤器
-        # 检查上一根和上上根K线颜色一致（都是上涨或都是下跌）
-        last_color = df['close'].iloc[-2] > df['open'].iloc[-2]  # True: 绿（上涨），False: 红（下跌）
-        prev_color = df['close'].iloc[-3] > df['open'].iloc[-3]
-        if last_color != prev_color:
+            return None, atr_value, last_close
+        mark_flat(symbol)  # 持仓已平，流水中该品种未结束的交易同步标记为已平仓
+
+        if state.signal == UPPER_BREAKOUT:
+            return 'upper_breakout', atr_value, last_close
+        elif state.signal == LOWER_BREAKOUT:
+            return 'lower_breakout', atr_value, last_close
+
+        if np.isnan(state.ema) or np.isnan(state.atr):
+            logging.warning(f"K线数量不足，指标尚未完成预热（已处理 {state.count} 根）。")
+        elif state.reason == 'low_volatility':
+            logging.info(f"波动率过低 ({atr_value / last_close:.4f} < {atr_threshold_pct})，跳过交易。")
+        elif state.reason == 'color_mismatch':
             logging.info("上一根和上上根K线颜色不一致，跳过交易。")
-            return None, atr_value
-        
-        # 检查上一根K线成交量大于上上根K线成交量
-        last_volume = df['volume'].iloc[-2]
-        prev_volume = df['volume'].iloc[-3]
-        if last_volume <= prev_volume:
-            logging.info(f"上一根K线成交量 ({last_volume}) 不大于上上根K线成交量 ({prev_volume})，跳过交易。")
-            return None, atr_value
-        
-        # 上轨突破条件（上上根在通道内，上一根突破上轨）
-        upper_breakout = (prev_close <= prev_upper_band) and (last_close > last_upper_band)
-        
-        # 下轨突破条件（上上根在通道内，上一根突破下轨）
-        lower_breakout = (prev_close >= prev_lower_band) and (last_close < last_lower_band)
-        
-        if upper_breakout:
-            return 'upper_breakout', atr_value
-        
-        elif lower_breakout:
-            return 'lower_breakout', atr_value
-        
-        return None, atr_value  # 无信号时也返回 atr_value
-        
+        elif state.reason == 'low_volume':
+            last_volume = df['volume'].iloc[-2]
+            prev_volume = df['volume'].iloc[-3]
+            logging.info(f"上一根K线成交量 ({last_volume}) 不大于上上根K线成交量 ({prev_volume}) 的 {volume_multiplier} 倍，跳过交易。")
+        elif state.reason == 'forbidden_hour':
+            logging.info("当前时段禁止交易。")
+        return None, atr_value, last_close  # 无信号时也返回 atr_value
+
     except Exception as e:
         logging.error(f"策略信号生成失败: {e}")
-        return None, None
\ No newline at end of file
+        return None, None, None
@@ -0,0 +1,109 @@
+import os
+import json
+import logging
+import time
+
+
+# 进程内已确认的杠杆设置 {(symbol, posSide): leverage}，避免重复查询
+_applied_leverage = {}
+
+
+def load_markets_cached(exchange, cache_file, ttl=24 * 3600):
+    """
+    从磁盘缓存加载市场元数据，缓存不存在或过期时才完整下载。
+
+    参数:
+    exchange: ccxt交易所对象
+    cache_file (str): 缓存文件路径（JSON）
+    ttl (float): 缓存有效期（秒），默认 24 小时
+
+    返回:
+    dict: exchange.markets
+    """
+    if os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < ttl:
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            exchange.set_markets(cached['markets'], cached.get('currencies'))
+            logging.info(f"从缓存加载市场元数据: {cache_file}（{len(exchange.markets)} 个市场）")
+            return exchange.markets
+        except Exception as e:
+            logging.warning(f"市场元数据缓存读取失败，重新下载: {e}")
+
+    exchange.load_markets()
+    try:
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        tmp_file = f"{cache_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'markets': exchange.markets, 'currencies': exchange.currencies}, f)
+        os.replace(tmp_file, cache_file)
+        logging.info(f"市场元数据已下载并缓存到: {cache_file}")
+    except Exception as e:
+        logging.warning(f"市场元数据缓存写入失败: {e}")
+    return exchange.markets
+
+
+def ensure_leverage(exchange, symbol, leverage, is_simulation=False, margin_mode='isolated'):
+    """
+    幂等设置杠杆：先查询当前杠杆，只在与目标不一致时才调用 set_leverage。
+
+    参数:
+    exchange: ccxt交易所对象
+    symbol (str): 交易对
+    leverage (int): 目标杠杆
+    is_simulation (bool): 模拟环境（单向持仓，不区分posSide）
+    margin_mode (str): 保证金模式，默认 'isolated'
+
+    返回:
+    int: 实际调用 set_leverage 的次数
+    """
+    leverage = int(leverage)
+    sides = ['net'] if is_simulation else ['long', 'short']
+    if all(_applied_leverage.get((symbol, side)) == leverage for side in sides):
+        return 0
+
+    current = {}
+    try:
+        info = exchange.fetch_leverage(symbol, {'marginMode': margin_mode})
+        current = {'long': info.get('longLeverage'), 'short': info.get('shortLeverage'), 'net': info.get('longLeverage')}
+    except Exception as e:
+        logging.warning(f"查询当前杠杆失败，直接设置（品种: {symbol}）: {e}")
+
+    calls = 0
+    for side in sides:
+        if current.get(side) == leverage:
+            _applied_leverage[(symbol, side)] = leverage
+            continue
+        params = {'mgnMode': margin_mode}
+        if side != 'net':
+            params['posSide'] = side
+        exchange.set_leverage(leverage, symbol, params)
+        _applied_leverage[(symbol, side)] = leverage
+        calls += 1
+
+    if calls:
+        logging.info(f"当前杠杆为：{leverage}（已更新 {calls} 项，品种: {symbol}）")
+    else:
+        logging.info(f"当前杠杆为：{leverage}（无需修改，品种: {symbol}）")
+    return calls
+
+
+def prewarm_connection(exchange):
+    """
+    发送一次轻量公共请求，提前建立（或恢复）到交易所的HTTPS连接。
+
+    参数:
+    exchange: ccxt交易所对象
+
+    返回:
+    float: 请求耗时（秒），失败返回 None
+    """
+    try:
+        start = time.perf_counter()
+        exchange.fetch_time()
+        elapsed = time.perf_counter() - start
+        logging.info(f"连接预热完成，耗时 {elapsed * 1000:.1f} ms")
+        return elapsed
+    except Exception as e:
+        logging.warning(f"连接预热失败: {e}")
+        return None
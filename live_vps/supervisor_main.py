@@ -0,0 +1,51 @@
+import os
+import logging
+
+from src.supervisor import Supervisor, shard_symbols
+from src.config import load_config
+
+# 多进程分片运行：品种按顺序轮流分配到 NUM_SHARDS 个进程，每个进程各自创建交易所客户端运行 live_main.run，
+# 某个品种卡住或进程崩溃只影响所在分片；监控进程负责重启并汇总各分片的周期耗时。
+# 品种按启动时 config.json 中的 SYMBOLS 分配，其余参数各分片在运行中热更新；增删品种需重启本程序。
+
+NUM_SHARDS = 2
+WAKE_STAGGER = 1.0  # 相邻分片唤醒时间错开的秒数，分散K线收盘后的请求
+HEARTBEAT_PERIODS = 2  # 超过几个K线周期没有完成周期视为卡死
+RESTART_BACKOFF = 5.0  # 首次重启等待秒数，连续重启时翻倍
+SHARDS_METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics', 'shards.json')
+
+
+def run_shard(shard_index, symbols, wake_offset, rate_limit_scale, status_queue):
+    """分片进程入口：在子进程中导入 live_main，使每个分片拥有独立的交易所客户端、日志文件和指标文件。"""
+    os.environ['LIVE_SHARD'] = f"shard{shard_index}"
+    import live_main
+    live_main.run(symbols, wake_offset=wake_offset, rate_limit_scale=rate_limit_scale, status_queue=status_queue, shard_index=shard_index)
+
+
+def main():
+    os.environ['LIVE_SHARD'] = 'supervisor'
+    import live_main  # 读取品种配置（监控进程本身不发起交易请求）
+
+    symbols = load_config(live_main.CONFIG_FILE)['SYMBOLS']
+    groups = shard_symbols(symbols, NUM_SHARDS)
+    shard_args = []
+    for i, indices in enumerate(groups):
+        shard_args.append((
+            [symbols[j] for j in indices],
+            i * WAKE_STAGGER,
+            live_main.RATE_LIMIT_SCALE / len(groups),  # 各分片共用同一账户和IP，平分限额
+        ))
+        logging.info(f"分片 shard{i}: {shard_args[-1][0]}，唤醒推迟 {i * WAKE_STAGGER:.1f} 秒")
+
+    period = live_main.exchange.parse_timeframe(live_main.TIMEFRAME)
+    supervisor = Supervisor(
+        run_shard, shard_args,
+        heartbeat_timeout=HEARTBEAT_PERIODS * period + 120,
+        restart_backoff=RESTART_BACKOFF,
+        metrics_file=SHARDS_METRICS_FILE,
+    )
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()